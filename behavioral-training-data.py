@@ -6,10 +6,39 @@ Teaches the ML model what different behavioral patterns look like.
 Each pattern is a sequence of events that represents a specific emotional state.
 """
 
+import argparse
+import gc
+import hashlib
 import json
-from typing import List, Dict, Tuple
+import os
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Iterator, List, Dict, Optional, Tuple
 import numpy as np
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Only needed for Parquet datasets (DatasetWriter / TrainingDataset)
+    pa = pq = None
+
+if pa is not None:
+    EVENTS_SCHEMA = pa.schema([
+        ('sample_id', pa.int64()),
+        ('position', pa.int32()),
+        ('type', pa.dictionary(pa.int32(), pa.string())),
+        ('data', pa.string()),  # JSON object; fields vary by event type
+    ])
+    LABELS_SCHEMA = pa.schema([
+        ('sample_id', pa.int64()),
+        ('emotion', pa.dictionary(pa.int32(), pa.string())),
+        ('confidence', pa.float32()),
+        ('pattern', pa.dictionary(pa.int32(), pa.string())),
+        ('offset', pa.int64()),  # First row of the sample in events.parquet
+        ('length', pa.int32()),
+    ])
+
 class BehavioralPatternLibrary:
     """Library of known behavioral patterns for training"""
 
@@ -339,33 +368,118 @@ class BehavioralPatternLibrary:
         print(f"✅ Exported {len(training_data)} training patterns to {filepath}")
 
 
+RANDOM_EVENT_TYPES = ('mouse', 'idle', 'scroll')
+
+
+@contextmanager
+def paused_gc():
+    """Suspend the cyclic GC while building millions of small dicts (none of them cyclic)"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class PatternTemplate:
+    """A base sequence compiled for batch variation.
+
+    Numeric data fields become one array, so noise for many variations is a
+    single (variations × fields) draw. Variations are copy-on-write: events
+    without numeric data (and the inserted random events) are shared with the
+    template rather than copied, so treat generated sequences as read-only.
+    """
+
+    def __init__(self, sequence: List[Dict]):
+        self.sequence = sequence
+        self.fields = []  # Per event: [(key, column)] of numeric data fields
+        values = []
+        for event in sequence:
+            fields = []
+            for key, value in event.get('data', {}).items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    fields.append((key, len(values)))
+                    values.append(value)
+            self.fields.append(fields)
+        self.values = np.array(values, dtype=float)
+        self.random_events = tuple({'type': t, 'data': {'random': True}} for t in RANDOM_EVENT_TYPES)
+
+    def variations(self, rng: np.random.Generator, count: int) -> List[List[Dict]]:
+        """`count` noisy variations (same distribution as PatternSimulator.add_noise + skips)"""
+        length = len(self.sequence)
+        levels = rng.uniform(0.05, 0.2, count)
+        values = self.values + rng.standard_normal((count, len(self.values))) * (np.abs(self.values) * levels[:, None])
+        inserts = rng.random((count, length)) < 0.15  # Random events after 15% of template events
+        insert_types = rng.integers(0, len(RANDOM_EVENT_TYPES), (count, length))
+        lengths = length + inserts.sum(axis=1)
+        skips = np.where(rng.random(count) < 0.2,  # 20% of variations drop one event
+                         (rng.random(count) * lengths).astype(int), -1)
+
+        variations = []
+        for row, inserted, types, skip in zip(values.tolist(), inserts.tolist(), insert_types.tolist(), skips.tolist()):
+            variation = []
+            for event, fields, insert, kind in zip(self.sequence, self.fields, inserted, types):
+                if fields:
+                    data = dict(event['data'])
+                    for key, column in fields:
+                        data[key] = row[column]
+                    event = dict(event, data=data)
+                variation.append(event)
+                if insert:
+                    variation.append(self.random_events[kind])
+            if skip >= 0:
+                del variation[skip]
+            variations.append(variation)
+        return variations
+
+
+def generate_samples(sequence: List[Dict], emotion: str, confidence: float, count: int,
+                     seed: np.random.SeedSequence) -> List[Tuple[List[Dict], str, float]]:
+    """One worker's share of a pattern's variations (module level so process pools can pickle it)"""
+    rng = np.random.default_rng(seed)
+    with paused_gc():
+        variations = PatternTemplate(sequence).variations(rng, count)
+    # Slightly reduce confidence for variations
+    confidences = (confidence * rng.uniform(0.85, 1.0, count)).tolist()
+    return [(variation, emotion, varied) for variation, varied in zip(variations, confidences)]
+
+
 class PatternSimulator:
-    """Simulates behavioral patterns with realistic variations"""
+    """Simulates behavioral patterns with realistic variations.
 
-    def __init__(self):
+    All randomness comes from a numpy Generator seeded from `seed`, so a
+    seeded simulator reproduces the same variations and datasets.
+    """
+
+    def __init__(self, seed=None):
         self.library = BehavioralPatternLibrary()
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.rng = np.random.default_rng(self.seed_sequence.spawn(1)[0])
 
     def add_noise(self, pattern: List[Dict], noise_level: float = 0.1) -> List[Dict]:
-        """Add realistic noise to a pattern"""
+        """Add realistic noise to a pattern (the pattern itself is left untouched)"""
         noisy_pattern = []
 
         for event in pattern:
-            noisy_event = event.copy()
+            noisy_event = event
 
             # Add noise to numeric values
-            if 'data' in noisy_event:
-                for key, value in noisy_event['data'].items():
-                    if isinstance(value, (int, float)):
+            if 'data' in event:
+                data = dict(event['data'])
+                for key, value in data.items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
                         # Add gaussian noise
-                        noise = np.random.normal(0, value * noise_level)
-                        noisy_event['data'][key] = value + noise
+                        data[key] = value + self.rng.normal(0, abs(value) * noise_level)
+                noisy_event = dict(event, data=data)
 
             noisy_pattern.append(noisy_event)
 
             # Occasionally insert random events (real user behavior)
-            if np.random.random() < 0.15:  # 15% chance
+            if self.rng.random() < 0.15:  # 15% chance
                 random_event = {
-                    'type': np.random.choice(['mouse', 'idle', 'scroll']),
+                    'type': str(self.rng.choice(RANDOM_EVENT_TYPES)),
                     'data': {'random': True}
                 }
                 noisy_pattern.append(random_event)
@@ -373,44 +487,227 @@ class PatternSimulator:
         return noisy_pattern
 
     def generate_variations(self, pattern: List[Dict], num_variations: int = 10) -> List[List[Dict]]:
-        """Generate multiple variations of a pattern"""
-        variations = []
-
-        for _ in range(num_variations):
-            # Vary the noise level
-            noise_level = np.random.uniform(0.05, 0.2)
-            variation = self.add_noise(pattern, noise_level)
-
-            # Occasionally skip events (incomplete patterns)
-            if np.random.random() < 0.2:  # 20% chance
-                skip_index = np.random.randint(0, len(variation))
-                variation = variation[:skip_index] + variation[skip_index+1:]
-
-            variations.append(variation)
-
-        return variations
-
-    def generate_training_dataset(self, samples_per_pattern: int = 50) -> List[Tuple[List[Dict], str, float]]:
-        """Generate a full training dataset with variations"""
+        """Generate multiple variations of a pattern (noise drawn for the whole batch at once)"""
+        return PatternTemplate(pattern).variations(self.rng, num_variations)
+
+    def iter_training_chunks(self, samples_per_pattern: int = 50, workers: int = 1,
+                             chunk_size: int = 20000) -> Iterator[Tuple[str, List[Tuple[List[Dict], str, float]]]]:
+        """Yield (pattern name, samples) chunks: each base pattern, then its variations.
+
+        Each pattern's variations are split into chunks of `chunk_size`, and
+        every chunk gets its own child of the simulator's SeedSequence, so the
+        output depends only on the seed - not on `workers`, which spreads the
+        chunks over a process pool (at most 2 × workers chunks in flight).
+        """
+        jobs = []
+        for emotion, pattern_list in self.library.patterns.items():
+            for pattern in pattern_list:
+                jobs.append((pattern, emotion, None))  # The original pattern
+                for start in range(0, samples_per_pattern, chunk_size):
+                    jobs.append((pattern, emotion, min(chunk_size, samples_per_pattern - start)))
+        seeds = iter(self.seed_sequence.spawn(sum(count is not None for _, _, count in jobs)))
+        jobs = [(pattern, emotion, count, next(seeds) if count is not None else None)
+                for pattern, emotion, count in jobs]
+
+        def run(job):
+            pattern, emotion, count, seed = job
+            if count is None:
+                return [(pattern['sequence'], emotion, pattern['confidence'])]
+            return generate_samples(pattern['sequence'], emotion, pattern['confidence'], count, seed)
+
+        if workers <= 1:
+            for job in jobs:
+                yield job[0]['name'], run(job)
+            return
+
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for job in jobs:
+                pattern, emotion, count, seed = job
+                if count is None:
+                    pending.append((pattern['name'], None, run(job)))
+                else:
+                    pending.append((pattern['name'], pool.submit(
+                        generate_samples, pattern['sequence'], emotion, pattern['confidence'], count, seed), None))
+                while len(pending) > 2 * workers or (pending and pending[0][1] is None):
+                    name, future, samples = pending.popleft()
+                    yield name, samples if future is None else future.result()
+            for name, future, samples in pending:
+                yield name, samples if future is None else future.result()
+
+    def generate_training_dataset(self, samples_per_pattern: int = 50, workers: int = 1,
+                                  chunk_size: int = 20000) -> List[Tuple[List[Dict], str, float]]:
+        """Generate a full training dataset with variations (in memory; see iter_training_chunks)"""
         dataset = []
-        base_patterns = self.library.get_training_data()
+        with paused_gc():
+            for _, samples in self.iter_training_chunks(samples_per_pattern, workers, chunk_size):
+                dataset.extend(samples)
 
-        for sequence, emotion, confidence in base_patterns:
-            # Add original pattern
-            dataset.append((sequence, emotion, confidence))
+        print(f"📊 Generated {len(dataset)} training samples from {len(self.library.get_training_data())} base patterns")
+        return dataset
 
-            # Generate variations
-            variations = self.generate_variations(sequence, samples_per_pattern)
-            for variation in variations:
-                # Slightly reduce confidence for variations
-                varied_confidence = confidence * np.random.uniform(0.85, 1.0)
-                dataset.append((variation, emotion, varied_confidence))
 
-        print(f"📊 Generated {len(dataset)} training samples from {len(base_patterns)} base patterns")
-        return dataset
+_encode_data = json.JSONEncoder(separators=(',', ':')).encode  # Reused: json.dumps builds an encoder per call
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError('Parquet datasets need pyarrow (pip install pyarrow)')
+
+
+class DatasetWriter:
+    """Streams labelled samples into a Parquet dataset directory.
+
+    events.parquet holds one row per event (sample, position, type, JSON
+    data) and labels.parquet one row per sample (emotion, confidence,
+    pattern, plus the sample's first event row and length). Samples are
+    buffered and flushed as one row group per table every
+    `row_group_samples`, so row group i of both files covers the same
+    samples and memory stays flat however large the dataset grows. Each
+    flush is written as exactly one row group (pyarrow would otherwise
+    split an events table past its default 1Mi-row limit and break the
+    pairing).
+    """
+
+    def __init__(self, path: str, row_group_samples: int = 50000, compression: str = 'zstd'):
+        _require_pyarrow()
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.row_group_samples = row_group_samples
+        self.events = pq.ParquetWriter(os.path.join(path, 'events.parquet'), EVENTS_SCHEMA, compression=compression)
+        self.labels = pq.ParquetWriter(os.path.join(path, 'labels.parquet'), LABELS_SCHEMA, compression=compression)
+        self.samples = 0
+        self.event_rows = 0
+        self.emotion_counts = Counter()
+        self._clear()
+
+    def _clear(self):
+        self._events = {name: [] for name in EVENTS_SCHEMA.names}
+        self._labels = {name: [] for name in LABELS_SCHEMA.names}
+
+    def add(self, sequence: List[Dict], emotion: str, confidence: float, pattern: str = '',
+            encoded: Optional[Dict[int, str]] = None):
+        """Append one sample; `encoded` memoizes JSON for data dicts shared between samples (by id)"""
+        events, labels = self._events, self._labels
+        labels['sample_id'].append(self.samples)
+        labels['emotion'].append(emotion)
+        labels['confidence'].append(confidence)
+        labels['pattern'].append(pattern)
+        labels['offset'].append(self.event_rows)
+        labels['length'].append(len(sequence))
+        for position, event in enumerate(sequence):
+            data = event.get('data') or {}
+            text = encoded.get(id(data)) if encoded is not None else None
+            if text is None:
+                text = _encode_data(data)
+                if encoded is not None:
+                    encoded[id(data)] = text
+            events['sample_id'].append(self.samples)
+            events['position'].append(position)
+            events['type'].append(event.get('type', ''))
+            events['data'].append(text)
+        self.samples += 1
+        self.event_rows += len(sequence)
+        self.emotion_counts[emotion] += 1
+        if len(labels['sample_id']) >= self.row_group_samples:
+            self.flush()
+
+    def extend(self, samples: List[Tuple[List[Dict], str, float]], pattern: str = ''):
+        # Variations share unmodified events with their template (copy-on-write),
+        # so each shared data dict is encoded once; `samples` keeps the ids alive
+        encoded = {}
+        for sequence, emotion, confidence in samples:
+            self.add(sequence, emotion, confidence, pattern, encoded)
+
+    def flush(self):
+        if not self._labels['sample_id']:
+            return
+        for writer, columns, schema in ((self.events, self._events, EVENTS_SCHEMA),
+                                        (self.labels, self._labels, LABELS_SCHEMA)):
+            table = pa.table(columns, schema=schema)
+            writer.write_table(table, row_group_size=len(table))
+        self._clear()
+
+    def close(self):
+        self.flush()
+        self.events.close()
+        self.labels.close()
+
+    def __enter__(self) -> 'DatasetWriter':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrainingDataset:
+    """Memory-mapped reader for a DatasetWriter directory.
+
+    labels() is the small per-sample table; iter_samples() decodes one row
+    group of events at a time back into (sequence, emotion, confidence), so
+    training and benchmark code can walk datasets larger than memory.
+    Decoded samples share data dicts - treat them as read-only.
+    """
+
+    def __init__(self, path: str):
+        _require_pyarrow()
+        self.path = path
+        self.events = pq.ParquetFile(pa.memory_map(os.path.join(path, 'events.parquet')))
+        self.label_file = pq.ParquetFile(pa.memory_map(os.path.join(path, 'labels.parquet')))
+        if self.events.num_row_groups != self.label_file.num_row_groups:
+            raise ValueError(f"{path}: events.parquet has {self.events.num_row_groups} row groups but "
+                             f"labels.parquet has {self.label_file.num_row_groups}; the files are not paired")
+
+    def __len__(self) -> int:
+        return self.label_file.metadata.num_rows
+
+    @property
+    def num_row_groups(self) -> int:
+        return self.label_file.num_row_groups
+
+    def labels(self, columns: Optional[List[str]] = None) -> 'pa.Table':
+        return self.label_file.read(columns=columns)
+
+    def fingerprint(self) -> str:
+        """Content hash of both files (cache key for derived feature matrices)"""
+        digest = hashlib.blake2b(digest_size=16)
+        for name in ('events.parquet', 'labels.parquet'):
+            with open(os.path.join(self.path, name), 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+        return digest.hexdigest()
+
+    def read_row_group(self, index: int) -> List[Tuple[List[Dict], str, float]]:
+        labels = self.label_file.read_row_group(index, columns=['emotion', 'confidence', 'length']).to_pydict()
+        events = self.events.read_row_group(index, columns=['type', 'data']).to_pydict()
+        # Identical data is decoded once and shared, like the generator's copy-on-write events
+        decoded = {}
+        sequences = []
+        for kind, text in zip(events['type'], events['data']):
+            data = decoded.get(text)
+            if data is None:
+                data = decoded[text] = json.loads(text)
+            sequences.append({'type': kind, 'data': data})
+        samples, start = [], 0
+        for emotion, confidence, length in zip(labels['emotion'], labels['confidence'], labels['length']):
+            samples.append((sequences[start:start + length], emotion, confidence))
+            start += length
+        return samples
+
+    def iter_samples(self) -> Iterator[Tuple[List[Dict], str, float]]:
+        for index in range(self.num_row_groups):
+            yield from self.read_row_group(index)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export the pattern library and generate a training dataset')
+    parser.add_argument('--samples', type=int, default=20, help='Variations per base pattern')
+    parser.add_argument('--workers', type=int, default=1, help='Generator processes')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--parquet', help='Stream the dataset to this directory (events.parquet + labels.parquet)')
+    args = parser.parse_args()
+
     # Create pattern library
     library = BehavioralPatternLibrary()
 
@@ -418,17 +715,23 @@ if __name__ == "__main__":
     library.export_for_training('/tmp/behavioral_patterns.json')
 
     # Generate training dataset with variations
-    simulator = PatternSimulator()
-    training_data = simulator.generate_training_dataset(samples_per_pattern=20)
+    simulator = PatternSimulator(seed=args.seed)
+    started = time.perf_counter()
+    if args.parquet:
+        with DatasetWriter(args.parquet) as writer:
+            for pattern, samples in simulator.iter_training_chunks(samples_per_pattern=args.samples,
+                                                                   workers=args.workers):
+                writer.extend(samples, pattern)
+        total, emotion_counts = writer.samples, writer.emotion_counts
+        print(f"📦 Wrote {total} samples ({writer.event_rows} events) to {args.parquet}")
+    else:
+        training_data = simulator.generate_training_dataset(samples_per_pattern=args.samples, workers=args.workers)
+        total, emotion_counts = len(training_data), Counter(emotion for _, emotion, _ in training_data)
+    print(f"   in {time.perf_counter() - started:.2f}s")
 
     print(f"\n🧠 Training data ready:")
-    print(f"   Total samples: {len(training_data)}")
-
-    # Count samples per emotion
-    emotion_counts = {}
-    for _, emotion, _ in training_data:
-        emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
+    print(f"   Total samples: {total}")
 
     print(f"\n📊 Samples per emotion:")
     for emotion, count in sorted(emotion_counts.items()):
-        print(f"   {emotion}: {count} samples")
\ No newline at end of file
+        print(f"   {emotion}: {count} samples")
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+EMOTIONS.state Subject Layout Benchmark
+
+Estimates how many bytes typical downstream consumers receive from the ML
+service under the flat EMOTIONS.state subject versus hierarchical
+EMOTIONS.state.<tenant>.<emotion> subjects (JSON or binary payloads), where
+NATS filters on the server and each consumer only gets what it subscribed to.
+
+Bytes are counted as the NATS protocol sends them to a subscriber
+(MSG line + payload + CRLF), for the same stream of published results.
+
+  python3 benchmark-emotion-subjects.py
+  python3 benchmark-emotion-subjects.py --tenants 50 --messages 100000
+  python3 benchmark-emotion-subjects.py --input build-a.jsonl   # telemetry-replay.py --emit output
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+CRITICAL_EMOTIONS = ('price_shock', 'sticker_shock', 'abandonment_intent', 'exit_risk', 'frustration', 'confusion')
+INTERVENTIONS = ('discount_modal', 'trust_badges', 'urgency_banner', 'social_toast',
+                 'comparison_modal', 'help_chat', 'value_highlight', 'exit_intent')
+
+
+def load_service_module():
+    """Import emotion-ml-service.py (hyphenated, so not importable by name)"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'emotion-ml-service.py')
+    spec = importlib.util.spec_from_file_location('emotion_ml_service', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module  # So pickling (e.g. the batch scoring pool) can find it
+    spec.loader.exec_module(module)
+    return module
+
+
+def subject_matches(pattern: str, subject: str) -> bool:
+    """NATS wildcard match ('*' one token, '>' the rest)"""
+    pattern_tokens, tokens = pattern.split('.'), subject.split('.')
+    for i, token in enumerate(pattern_tokens):
+        if token == '>':
+            return len(tokens) > i
+        if i >= len(tokens) or (token != '*' and token != tokens[i]):
+            return False
+    return len(pattern_tokens) == len(tokens)
+
+
+def wire_bytes(subject: str, payload: bytes, sid: str = '1') -> int:
+    """Bytes a subscriber receives for one message (MSG <subject> <sid> <size>\\r\\n<payload>\\r\\n)"""
+    return len(f"MSG {subject} {sid} {len(payload)}\r\n") + len(payload) + 2
+
+
+def synthetic_events(emotions: Tuple[str, ...], tenants: int, messages: int, seed: int) -> List[Dict]:
+    """Published events with a skewed tenant mix and a realistic emotion spread"""
+    rng = random.Random(seed)
+    tenant_ids = [f"tenant{i:03d}" for i in range(tenants)]
+    tenant_weights = [1.0 / (i + 1) for i in range(tenants)]  # A few large tenants, a long tail
+    emotion_weights = [3.0 if e in ('curiosity', 'engagement') else 1.0 for e in emotions]
+    events = []
+    for i in range(messages):
+        emotion = rng.choices(emotions, emotion_weights)[0]
+        scores = {e: round(rng.random(), 3) for e in rng.sample(emotions, rng.randint(1, 5))}
+        scores[emotion] = max(scores.values())
+        events.append({
+            'sessionId': f"sess_{rng.randrange(10 ** 12)}_{rng.randrange(10000)}",
+            'tenantId': rng.choices(tenant_ids, tenant_weights)[0],
+            'emotion': emotion,
+            'confidence': round(rng.uniform(50, 100), 1),
+            'ml_scores': scores,
+            'is_anomaly': rng.random() < 0.05,
+            'behavior_cluster': rng.choice((None, 0, 1, 2, -1)),
+            'interventions': sorted(rng.sample(INTERVENTIONS, rng.randint(0, 3))),
+            'source': 'ml',
+            'timestamp': '2026-01-01T12:00:00.000000',
+        })
+    return events
+
+
+def load_events(path: str) -> List[Dict]:
+    """Events from a telemetry-replay.py --emit file"""
+    with open(path) as f:
+        return [json.loads(line)['event'] for line in f if line.strip()]
+
+
+def consumers(events: List[Dict], prefix: str) -> Dict[str, List[str]]:
+    """Representative downstream subscriptions (hierarchical form)"""
+    top_tenant = Counter(e.get('tenantId') for e in events).most_common(1)[0][0]
+    tenant = top_tenant or 'default'
+    return {
+        'all traffic': [f"{prefix}.>"],
+        f"one tenant dashboard ({tenant})": [f"{prefix}.{tenant}.*"],
+        'critical alerts, all tenants': [f"{prefix}.*.{emotion}" for emotion in CRITICAL_EMOTIONS],
+        f"critical alerts ({tenant})": [f"{prefix}.{tenant}.{emotion}" for emotion in CRITICAL_EMOTIONS],
+    }
+
+
+class EmotionCodes:
+    """The service's emotion table (what ML.control.schema reports)"""
+
+    def __init__(self, service):
+        self.names = service.EmotionalIntelligence().compiled_rules.emotions
+        self.codes = {emotion: code for code, emotion in enumerate(self.names)}
+
+
+def run(service, events: List[Dict]) -> Dict:
+    prefix = service.EMOTIONS_SUBJECT
+    emotions = EmotionCodes(service)
+    layouts = {'flat json': [], 'hierarchical json': [], 'hierarchical binary': []}
+
+    started = time.perf_counter()
+    for event in events:
+        layouts['flat json'].append((prefix, json.dumps(event).encode()))
+    json_encode = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for event in events:
+        subject = service.MLEmotionService.emotion_subject(event.get('tenantId'), event['emotion'])
+        layouts['hierarchical binary'].append((subject, service.encode_emotion_payload(event, emotions.codes, 0.0)))
+    binary_encode = time.perf_counter() - started
+
+    for (subject, _), (_, payload) in zip(layouts['hierarchical binary'], layouts['flat json']):
+        layouts['hierarchical json'].append((subject, payload))
+
+    started = time.perf_counter()
+    for _, payload in layouts['flat json']:
+        json.loads(payload)
+    json_decode = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _, payload in layouts['hierarchical binary']:
+        service.decode_emotion_payload(payload, emotions.names)
+    binary_decode = time.perf_counter() - started
+
+    report = {'messages': len(events), 'consumers': {}, 'codec_us': {
+        'json_encode': json_encode / len(events) * 1e6,
+        'json_decode': json_decode / len(events) * 1e6,
+        'binary_encode': binary_encode / len(events) * 1e6,
+        'binary_decode': binary_decode / len(events) * 1e6,
+    }}
+    for name, patterns in consumers(events, prefix).items():
+        results = {}
+        for layout, published in layouts.items():
+            # The flat subject can't be filtered: every consumer gets everything
+            received = [
+                (subject, payload) for subject, payload in published
+                if layout == 'flat json' or any(subject_matches(p, subject) for p in patterns)
+            ]
+            results[layout] = {
+                'messages': len(received),
+                'bytes': sum(wire_bytes(subject, payload) for subject, payload in received),
+            }
+        baseline = results['flat json']['bytes']
+        for layout in results.values():
+            layout['saved'] = 1.0 - layout['bytes'] / baseline if baseline else 0.0
+        report['consumers'][name] = {'subscriptions': patterns, **results}
+    return report
+
+
+def print_report(report: Dict):
+    print(f"\n📮 EMOTIONS.state subject layouts - {report['messages']} published results")
+    for name, result in report['consumers'].items():
+        print(f"\n   {name}")
+        for layout in ('flat json', 'hierarchical json', 'hierarchical binary'):
+            r = result[layout]
+            print(f"     {layout:<20} {r['messages']:>8} msgs {r['bytes'] / 1024:>10.1f} KiB"
+                  f"   saved {r['saved'] * 100:5.1f}%")
+    codec = report['codec_us']
+    print(f"\n   Codec per message: json {codec['json_encode']:.1f}µs enc / {codec['json_decode']:.1f}µs dec, "
+          f"binary {codec['binary_encode']:.1f}µs enc / {codec['binary_decode']:.1f}µs dec")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Consumer bandwidth under flat vs hierarchical EMOTIONS.state subjects')
+    parser.add_argument('--input', help='Published events from telemetry-replay.py --emit (default: synthetic)')
+    parser.add_argument('--tenants', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', help='Also write the report as JSON')
+    args = parser.parse_args()
+
+    service = load_service_module()
+    if args.input:
+        events = load_events(args.input)
+    else:
+        events = synthetic_events(EmotionCodes(service).names, args.tenants, args.messages, args.seed)
+    if not events:
+        raise SystemExit('No events to benchmark')
+
+    report = run(service, events)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,343 +9,419 @@ This is what makes Elmo different from Jessie-May.
 """
 
 import asyncio
+import bisect
+import cProfile
+import hashlib
+import itertools
 import json
+import os
+import pstats
+import signal
+import struct
+import sys
+import threading
 import time
+import traceback
 import numpy as np
-import pandas as pd
 from datetime import datetime, timedelta
-from collections import defaultdict, deque
-from typing import Dict, List, Tuple, Optional
+from collections import Counter, defaultdict, deque
+from typing import Callable, Dict, List, Tuple, Optional
 
 import nats
 from nats.errors import ConnectionClosedError, TimeoutError
 
 # ML imports
-from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import IsolationForest, RandomForestClassifier
 from sklearn.cluster import DBSCAN
-from scipy import stats
 import warnings
 warnings.filterwarnings('ignore')
 
+# Service components that live in their own modules (re-exported here)
+from emotion_ml.artifacts import ModelArtifacts
+from emotion_ml.batch import BatchScorer, extract_feature_block, session_window, split_reply
+from emotion_ml.cascade import CascadePolicy
+from emotion_ml.dedup import RotatingBloomFilter, event_fingerprint
+from emotion_ml.features import (
+    EXTRACTOR_VERSION, FEATURE_INDEX, FEATURE_SCHEMA, BehavioralFeatureExtractor, ColumnarFeatureExtractor,
+    columnar_features, encode_event, feature_vector
+)
+from emotion_ml.ingest import IngestServer, normalize_envelope
+from emotion_ml.library import EMOTION_MAP, load_training_module
+from emotion_ml.normalization import OnlineNormalizer
+from emotion_ml.overload import OverloadController
+from emotion_ml.patterns import PatternIndex, pattern_events
+from emotion_ml.publishing import PublishPolicy
+from emotion_ml.scheduling import DEFAULT_TENANT, TenantScheduler
+from emotion_ml.sequences import (
+    SequenceMatcher, SequenceState, TransitionModel, TransitionState, event_token
+)
+from emotion_ml.sketches import CountMinSketch, HyperLogLog, QuantileSketch, TrafficSketches
+from emotion_ml.windows import EventTimeWindow, parse_event_time
+
+# NATS subjects
+TELEMETRY_SUBJECT = 'TELEMETRY.events'
+EMOTIONS_SUBJECT = 'EMOTIONS.state'   # Legacy flat subject; hierarchical is EMOTIONS.state.<tenant>.<emotion>
+CONTROL_SUBJECT = 'ML.control'   # ML.control.<command>, request-reply
+METRICS_SUBJECT = 'ML.metrics'   # Periodic metrics snapshots
+SCORE_SUBJECT = 'ML.score.batch'  # Batch scoring request, replies streamed in chunks
+SKETCH_SUBJECT = 'ML.sketches'   # ML.sketches.<tenant>, periodic traffic/feature sketch snapshots
+NATS_MAX_PAYLOAD = 1024 * 1024   # Server default, when the connection does not report its own
+
+
+_SUBJECT_UNSAFE = str.maketrans({c: '_' for c in '.*> \t\r\n'})
+
+
+def subject_token(value) -> str:
+    """Make a value safe to use as one NATS subject token"""
+    token = str(value or '').translate(_SUBJECT_UNSAFE)
+    return token or '_'
+
+
+# Compact EMOTIONS.state payload. Layout (little endian):
+#   header   version u8, emotion code u8, flags u8, timestamp f64, event time f64,
+#            ingest time f64 (epoch s, NaN if unknown), confidence f32 (percent),
+#            behavior cluster i16
+#   strings  sessionId, tenantId        (u8 length + utf-8)
+#   scores   u8 count, then (emotion code u8, score u16 / 65535) per emotion
+#   actions  u8 count, then interventions (u8 length + utf-8)
+# Emotion codes index the service's emotion table (ML.control.schema);
+# code 255 is followed by the emotion name for emotions outside the table.
+EMOTION_PAYLOAD_VERSION = 2  # v2 added event and ingest times
+_PAYLOAD_HEADER = struct.Struct('<BBBdddfh')
+_PAYLOAD_SCORE = struct.Struct('<BH')
+_NAMED_EMOTION = 255
+_FLAG_ANOMALY = 1
+_FLAG_CLUSTER = 2
+
+
+def _pack_str(value: str) -> bytes:
+    data = value.encode()[:255]
+    return bytes((len(data),)) + data
+
+
+def _unpack_str(data: bytes, offset: int) -> Tuple[str, int]:
+    end = offset + 1 + data[offset]
+    return data[offset + 1:end].decode(errors='replace'), end
+
+
+def _isoformat(epoch: Optional[float]) -> Optional[str]:
+    return None if epoch is None or epoch != epoch else datetime.fromtimestamp(epoch).isoformat()
+
+
+def _epoch_or_nan(value: Optional[float]) -> float:
+    return float('nan') if value is None else value
+
+
+def encode_emotion_payload(event: Dict, codes: Dict[str, int], published_at: float,
+                           event_time: Optional[float] = None, ingest_time: Optional[float] = None) -> bytes:
+    """Binary form of an EMOTIONS.state event (see the layout above)"""
+    def emotion(name):
+        code = codes.get(name, _NAMED_EMOTION)
+        return code, _pack_str(name) if code == _NAMED_EMOTION else b''
+
+    code, name = emotion(event['emotion'])
+    cluster = event.get('behavior_cluster')
+    flags = (_FLAG_ANOMALY if event.get('is_anomaly') else 0) | (_FLAG_CLUSTER if cluster is not None else 0)
+    parts = [
+        _PAYLOAD_HEADER.pack(EMOTION_PAYLOAD_VERSION, code, flags, published_at,
+                             _epoch_or_nan(event_time), _epoch_or_nan(ingest_time),
+                             event['confidence'], int(cluster) if cluster is not None else 0),
+        name,
+        _pack_str(event['sessionId']),
+        _pack_str(event.get('tenantId') or ''),
+    ]
+    scores = list(event.get('ml_scores', {}).items())[:255]
+    parts.append(bytes((len(scores),)))
+    for score_emotion, score in scores:
+        score_code, score_name = emotion(score_emotion)
+        parts.append(_PAYLOAD_SCORE.pack(score_code, round(min(max(score, 0.0), 1.0) * 65535)) + score_name)
+    interventions = event.get('interventions', [])[:255]
+    parts.append(bytes((len(interventions),)))
+    parts.extend(_pack_str(action) for action in interventions)
+    return b''.join(parts)
+
+
+def decode_emotion_payload(data: bytes, emotions) -> Dict:
+    """Decode a JSON or binary EMOTIONS.state payload into the JSON event shape"""
+    if not data or data[0] != EMOTION_PAYLOAD_VERSION:
+        return json.loads(data)
+
+    def emotion(code, offset):
+        if code == _NAMED_EMOTION:
+            return _unpack_str(data, offset)
+        return emotions[code], offset
+
+    _, code, flags, published_at, event_time, ingest_time, confidence, cluster = _PAYLOAD_HEADER.unpack_from(data)
+    name, offset = emotion(code, _PAYLOAD_HEADER.size)
+    session_id, offset = _unpack_str(data, offset)
+    tenant_id, offset = _unpack_str(data, offset)
+
+    scores = {}
+    count, offset = data[offset], offset + 1
+    for _ in range(count):
+        score_code, score = _PAYLOAD_SCORE.unpack_from(data, offset)
+        score_name, offset = emotion(score_code, offset + _PAYLOAD_SCORE.size)
+        scores[score_name] = score / 65535
+
+    interventions = []
+    count, offset = data[offset], offset + 1
+    for _ in range(count):
+        action, offset = _unpack_str(data, offset)
+        interventions.append(action)
+
+    return {
+        'sessionId': session_id,
+        'tenantId': tenant_id or None,
+        'emotion': name,
+        'confidence': confidence,
+        'ml_scores': scores,
+        'is_anomaly': bool(flags & _FLAG_ANOMALY),
+        'behavior_cluster': cluster if flags & _FLAG_CLUSTER else None,
+        'interventions': interventions,
+        'source': 'ml',
+        'timestamp': datetime.fromtimestamp(published_at).isoformat(),
+        'eventTime': _isoformat(event_time),
+        'ingestTime': _isoformat(ingest_time),
+    }
+
+
+class StageProfiler:
+    """Sampled profiler for scoring stages and feature helpers.
+
+    Off by default. When enabled, 1-in-`sample_every` `process_session` calls
+    run under cProfile and time each pipeline stage, so the report shows
+    cumulative time per feature helper (the columnar kernel, and the pandas
+    `BehavioralFeatureExtractor` helpers for sessions that fall back to
+    them) and per stage.
+    When disabled, the only cost per call is a boolean check.
+    """
+
+    def __init__(self, sample_every: int = 100):
+        self.enabled = False
+        self.sample_every = sample_every
+        self._calls = 0
+        self.sampled_calls = 0
+        self.profile = cProfile.Profile()
+        self.stage_totals = defaultdict(float)
+        self.stage_counts = defaultdict(int)
+
+    def start(self, sample_every: Optional[int] = None):
+        if sample_every:
+            self.sample_every = max(1, int(sample_every))
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+
+    def reset(self):
+        self._calls = 0
+        self.sampled_calls = 0
+        self.profile = cProfile.Profile()
+        self.stage_totals.clear()
+        self.stage_counts.clear()
+
+    def should_sample(self) -> bool:
+        """Called once per scoring call - True for the sampled 1-in-N"""
+        if not self.enabled:
+            return False
+        self._calls += 1
+        return self._calls % self.sample_every == 0
+
+    def stage_timer(self) -> Callable[[str], None]:
+        """Returns mark(stage) which charges the time since the previous mark to `stage`"""
+        last = [time.perf_counter()]
+
+        def mark(stage: str):
+            now = time.perf_counter()
+            self.stage_totals[stage] += now - last[0]
+            self.stage_counts[stage] += 1
+            last[0] = now
+
+        return mark
+
+    def report(self, top: int = 20) -> Dict:
+        """Aggregated per-stage and per-feature-helper timings"""
+        report = {
+            'enabled': self.enabled,
+            'sample_every': self.sample_every,
+            'sampled_calls': self.sampled_calls,
+            'stages': {
+                stage: {
+                    'calls': self.stage_counts[stage],
+                    'total_ms': total * 1000,
+                    'mean_ms': total * 1000 / max(self.stage_counts[stage], 1),
+                }
+                for stage, total in sorted(self.stage_totals.items(), key=lambda x: -x[1])
+            },
+            'feature_helpers': {},
+            'top_functions': [],
+        }
+        if not self.sampled_calls:
+            return report
+
+        helpers = {name for name in vars(BehavioralFeatureExtractor) if name.startswith('_')}
+        helpers.update(('extract_features', 'columnar_features', 'encode_event', '_segment_reduce', '_segment_moments'))
+        source = sys.modules[BehavioralFeatureExtractor.__module__].__file__
+        functions = []
+        for (filename, lineno, name), (cc, nc, tt, ct, callers) in pstats.Stats(self.profile).stats.items():
+            if filename == source and name in helpers:
+                report['feature_helpers'][name] = {
+                    'calls': nc,
+                    'cumulative_ms': ct * 1000,
+                    'own_ms': tt * 1000,
+                }
+            functions.append((ct, f"{name} ({os.path.basename(filename)}:{lineno})", nc, tt))
+
+        report['feature_helpers'] = dict(sorted(report['feature_helpers'].items(),
+                                                key=lambda x: -x[1]['cumulative_ms']))
+        report['top_functions'] = [
+            {'function': desc, 'calls': nc, 'cumulative_ms': ct * 1000, 'own_ms': tt * 1000}
+            for ct, desc, nc, tt in sorted(functions, key=lambda x: -x[0])[:top]
+        ]
+        return report
+
+    def dump(self, directory: str) -> Dict[str, str]:
+        """Write the aggregated profile as <stamp>.pstats and <stamp>.json"""
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, f"ml-profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        paths = {'json': stem + '.json'}
+        if self.sampled_calls:
+            paths['pstats'] = stem + '.pstats'
+            pstats.Stats(self.profile).dump_stats(paths['pstats'])
+        with open(paths['json'], 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        return paths
+
+
+class CompiledRules:
+    """Emotion rules and feature weights compiled into dense (emotion × feature) arrays.
+
+    Scoring matches the rule loop it replaces: a rule counts towards an
+    emotion's total weight when its feature is present, and scores
+    weight × min(2, value / threshold) when the threshold is met. Each
+    instance gets a process-unique `generation`, so results cached against
+    one rule set can never be served for its replacement.
+    """
+
+    _generations = itertools.count(1)
+
+    def __init__(self, rules: Dict, weights: Dict):
+        self.generation = next(self._generations)
+        self.emotions = tuple(rules)
+        shape = (len(self.emotions), len(FEATURE_SCHEMA))
+        self.min_thresholds = np.full(shape, np.nan)
+        self.max_thresholds = np.full(shape, np.nan)
+        self.weights = np.zeros(shape)
+        self.has_rule = np.zeros(shape, dtype=bool)
+
+        for e, emotion in enumerate(self.emotions):
+            for feature, (min_val, max_val) in rules[emotion].items():
+                if feature not in FEATURE_INDEX:
+                    raise ValueError(f"Unknown feature in {emotion} rules: {feature}")
+                f = FEATURE_INDEX[feature]
+                self.has_rule[e, f] = True
+                self.weights[e, f] = weights.get(emotion, {}).get(feature, 1.0)
+                if min_val is not None:
+                    self.min_thresholds[e, f] = min_val
+                if max_val is not None:
+                    self.max_thresholds[e, f] = max_val
+
+    @staticmethod
+    def rule_scores(values: np.ndarray, active: np.ndarray, min_thresholds: np.ndarray,
+                    max_thresholds: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Raw (score, total_weight) summed over the last (feature) axis.
+
+        Arguments broadcast together, so callers can score many rule sets at
+        once (candidate thresholds on a leading axis, see tune-emotion-rules.py).
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            above = active & (values >= min_thresholds)
+            below = active & ~above & (values <= max_thresholds)
+            above_mult = np.where(min_thresholds > 0, np.minimum(2.0, values / min_thresholds), 1.0)
+            below_mult = np.where(values > 0, np.minimum(2.0, max_thresholds / values), 1.0)
+            contribution = np.where(above, above_mult, 0.0) + np.where(below, below_mult, 0.0)
+        return (weights * contribution).sum(axis=-1), (weights * active).sum(axis=-1)
+
+    def score_vector(self, values: np.ndarray, present: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Raw (score, total_weight) per emotion; values/present broadcast over leading axes"""
+        active = self.has_rule & present[..., None, :]
+        return self.rule_scores(values[..., None, :], active, self.min_thresholds, self.max_thresholds, self.weights)
+
+    def score(self, features: Dict[str, float]) -> Dict[str, float]:
+        """Rule score per emotion (emotions with no present features are omitted)"""
+        score, total = self.score_vector(*feature_vector(features))
+        return {
+            emotion: min(1.0, float(score[e] / total[e]))
+            for e, emotion in enumerate(self.emotions) if total[e] > 0
+        }
 
-class BehavioralFeatureExtractor:
-    """Transforms raw telemetry into ML features"""
-
-    def __init__(self):
-        self.window_size = 20  # Last N events to consider
-        self.feature_cache = {}
-
-    def extract_features(self, events: List[dict]) -> Dict[str, float]:
-        """Extract behavioral features from event sequence"""
-
-        if len(events) < 3:
-            return self._empty_features()
-
-        # Convert to DataFrame for easier analysis
-        df = pd.DataFrame(events)
-
-        features = {}
-
-        # Time-based features
-        features['session_duration'] = self._calculate_duration(df)
-        features['event_frequency'] = len(df) / max(features['session_duration'], 1)
-        features['idle_ratio'] = self._calculate_idle_ratio(df)
-
-        # Mouse movement patterns
-        mouse_events = df[df['type'].str.contains('mouse', na=False)]
-        if len(mouse_events) > 0:
-            features['avg_mouse_velocity'] = self._safe_mean(mouse_events, 'velocity')
-            features['velocity_variance'] = self._safe_std(mouse_events, 'velocity')
-            features['acceleration_spikes'] = self._count_spikes(mouse_events, 'acceleration')
-            features['movement_entropy'] = self._calculate_entropy(mouse_events)
-
-        # Scroll patterns
-        scroll_events = df[df['type'] == 'scroll']
-        if len(scroll_events) > 0:
-            features['scroll_depth'] = self._safe_max(scroll_events, 'scrollPercentage')
-            features['scroll_velocity'] = self._safe_mean(scroll_events, 'scrollSpeed')
-            features['scroll_reversals'] = self._count_reversals(scroll_events)
-            features['reading_pattern'] = self._detect_reading_pattern(scroll_events)
-
-        # Interaction patterns
-        features['rage_click_count'] = len(df[df['type'] == 'rage_click'])
-        features['circular_motions'] = len(df[df['type'] == 'circular_motion'])
-        features['direction_changes'] = len(df[df['type'] == 'direction_changes'])
-        features['text_selection'] = len(df[df['type'] == 'text_selection'])
-        features['tab_switch'] = len(df[df['type'] == 'tab_switch'])  # Added for comparison detection
-
-        # Proximity patterns (KEY for intent detection)
-        features['price_proximity_time'] = self._calculate_proximity_time(df, 'price_proximity')
-        features['cta_proximity_time'] = self._calculate_proximity_time(df, 'cta_proximity')
-        features['form_proximity_time'] = self._calculate_proximity_time(df, 'form_proximity')
-        features['nav_proximity_time'] = self._calculate_proximity_time(df, 'nav_proximity')
-
-        # Exit signals
-        features['exit_signal_strength'] = self._calculate_exit_strength(df)
-        features['viewport_approaches'] = len(df[df['type'] == 'viewport_approach'])
-
-        # Behavioral complexity
-        features['unique_event_types'] = df['type'].nunique()
-        features['pattern_complexity'] = self._calculate_complexity(df)
-
-        # Hesitation patterns
-        features['micro_hesitations'] = self._detect_hesitations(df)
-        features['dwell_time_variance'] = self._calculate_dwell_variance(df)
-
-        # CRITICAL COMBINATION PATTERNS
-        features['mouse_exit_after_idle'] = self._detect_exit_after_idle(df)
-        features['price_hover_duration'] = self._calculate_price_hover_duration(df)
-        features['confident_scroll_rate'] = self._calculate_confident_scrolling(df)
-        features['comparison_pattern_strength'] = self._detect_comparison_behavior(df)
-
-        return features
-
-    def _empty_features(self) -> Dict[str, float]:
-        """Return zero-valued features for new sessions"""
-        return defaultdict(float)
-
-    def _calculate_duration(self, df: pd.DataFrame) -> float:
-        """Calculate session duration in seconds"""
-        if 'timestamp' in df.columns and len(df) > 1:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            return (df['timestamp'].max() - df['timestamp'].min()).total_seconds()
-        return 0
-
-    def _calculate_idle_ratio(self, df: pd.DataFrame) -> float:
-        """Ratio of idle time to active time"""
-        idle_events = len(df[df['type'] == 'idle'])
-        total_events = len(df)
-        return idle_events / max(total_events, 1)
-
-    def _safe_mean(self, df: pd.DataFrame, column: str) -> float:
-        """Safely extract mean from nested data"""
-        try:
-            values = df['data'].apply(lambda x: x.get(column, 0) if isinstance(x, dict) else 0)
-            return values.mean() if len(values) > 0 else 0
-        except:
-            return 0
-
-    def _safe_std(self, df: pd.DataFrame, column: str) -> float:
-        """Safely extract standard deviation from nested data"""
-        try:
-            values = df['data'].apply(lambda x: x.get(column, 0) if isinstance(x, dict) else 0)
-            return values.std() if len(values) > 1 else 0
-        except:
-            return 0
-
-    def _safe_max(self, df: pd.DataFrame, column: str) -> float:
-        """Safely extract max from nested data"""
-        try:
-            values = df['data'].apply(lambda x: x.get(column, 0) if isinstance(x, dict) else 0)
-            return values.max() if len(values) > 0 else 0
-        except:
-            return 0
-
-    def _count_spikes(self, df: pd.DataFrame, column: str, threshold: float = 2) -> int:
-        """Count number of spikes (values > threshold * std)"""
-        try:
-            values = df['data'].apply(lambda x: x.get(column, 0) if isinstance(x, dict) else 0)
-            if len(values) < 3:
-                return 0
-            mean = values.mean()
-            std = values.std()
-            if std == 0:
-                return 0
-            z_scores = np.abs((values - mean) / std)
-            return (z_scores > threshold).sum()
-        except:
-            return 0
-
-    def _calculate_entropy(self, df: pd.DataFrame) -> float:
-        """Calculate entropy of movement patterns"""
-        try:
-            if len(df) < 2:
-                return 0
-            # Use direction of movement as categories
-            directions = df['data'].apply(lambda x: x.get('direction', 'unknown') if isinstance(x, dict) else 'unknown')
-            probs = directions.value_counts(normalize=True)
-            return stats.entropy(probs)
-        except:
-            return 0
-
-    def _count_reversals(self, df: pd.DataFrame) -> int:
-        """Count scroll direction reversals"""
-        try:
-            directions = df['data'].apply(lambda x: x.get('direction', '') if isinstance(x, dict) else '')
-            reversals = 0
-            for i in range(1, len(directions)):
-                if directions.iloc[i] != directions.iloc[i-1] and directions.iloc[i] != '':
-                    reversals += 1
-            return reversals
-        except:
-            return 0
-
-    def _detect_reading_pattern(self, scroll_events: pd.DataFrame) -> float:
-        """Detect steady reading pattern (0-1 score)"""
-        try:
-            if len(scroll_events) < 3:
-                return 0
-            speeds = scroll_events['data'].apply(lambda x: x.get('scrollSpeed', 0) if isinstance(x, dict) else 0)
-            # Reading pattern: slow, steady scrolling
-            avg_speed = speeds.mean()
-            speed_variance = speeds.std()
-            if avg_speed > 0:
-                reading_score = 1 / (1 + speed_variance / avg_speed)  # Lower variance = higher score
-                return min(reading_score, 1.0)
-            return 0
-        except:
-            return 0
-
-    def _calculate_proximity_time(self, df: pd.DataFrame, event_type: str) -> float:
-        """Calculate weighted proximity score based on recency and frequency"""
-        proximity_events = df[df['type'] == event_type]
-        if len(proximity_events) == 0:
-            return 0
-
-        # Weight recent events more heavily
-        score = 0
-        for i, event in proximity_events.iterrows():
-            recency_weight = 1.0 - (i / len(df)) if len(df) > 0 else 1.0
-            score += recency_weight
-
-        return score
-
-    def _calculate_exit_strength(self, df: pd.DataFrame) -> float:
-        """Calculate strength of exit intent signals"""
-        exit_events = df[df['type'].isin(['viewport_approach', 'mouse_exit', 'tab_switch'])]
-        return len(exit_events)
-
-    def _calculate_complexity(self, df: pd.DataFrame) -> float:
-        """Calculate behavioral complexity score"""
-        try:
-            # More unique patterns = more complex behavior
-            unique_sequences = set()
-            for i in range(len(df) - 2):
-                sequence = tuple(df['type'].iloc[i:i+3])
-                unique_sequences.add(sequence)
-            return len(unique_sequences) / max(len(df), 1)
-        except:
-            return 0
-
-    def _detect_hesitations(self, df: pd.DataFrame) -> int:
-        """Detect micro-hesitations in movement"""
-        try:
-            mouse_events = df[df['type'].str.contains('mouse', na=False)]
-            if len(mouse_events) < 2:
-                return 0
-
-            velocities = mouse_events['data'].apply(lambda x: x.get('velocity', 0) if isinstance(x, dict) else 0)
-            hesitations = 0
-            for i in range(1, len(velocities)):
-                # Sudden velocity drop = hesitation
-                if velocities.iloc[i] < velocities.iloc[i-1] * 0.3:
-                    hesitations += 1
-            return hesitations
-        except:
-            return 0
-
-    def _calculate_dwell_variance(self, df: pd.DataFrame) -> float:
-        """Calculate variance in dwell times"""
-        try:
-            hover_events = df[df['type'] == 'element_hover']
-            if len(hover_events) < 2:
-                return 0
-            durations = hover_events['data'].apply(lambda x: x.get('duration', 0) if isinstance(x, dict) else 0)
-            return durations.std()
-        except:
-            return 0
-
-    def _detect_exit_after_idle(self, df: pd.DataFrame) -> float:
-        """Detect critical pattern: idle followed by exit"""
-        try:
-            score = 0
-            for i in range(len(df) - 1):
-                current = df.iloc[i]
-                next_event = df.iloc[i+1]
-
-                # Check for idle->exit pattern
-                if current['type'] == 'idle' and next_event['type'] in ['mouse_exit', 'viewport_approach', 'mouse']:
-                    idle_data = current.get('data', {})
-                    if isinstance(idle_data, dict):
-                        idle_duration = idle_data.get('duration', 0)
-                        # More sensitive scoring
-                        score = max(score, min(idle_duration / 1500, 1.0))  # Lower threshold
-
-                # Also check for slow movement upward (exit intent)
-                if current['type'] == 'mouse':
-                    mouse_data = current.get('data', {})
-                    if isinstance(mouse_data, dict):
-                        if mouse_data.get('direction') == 'up' and mouse_data.get('velocity', 0) > 300:
-                            score = max(score, 0.5)
-
-            return score
-        except:
-            return 0
-
-    def _calculate_price_hover_duration(self, df: pd.DataFrame) -> float:
-        """Calculate total time hovering on price elements"""
-        try:
-            price_hovers = df[(df['type'] == 'element_hover') | (df['type'] == 'price_proximity')]
-            total_duration = 0
-            for _, event in price_hovers.iterrows():
-                if isinstance(event.get('data'), dict):
-                    if 'price' in str(event['data'].get('element', '')):
-                        total_duration += event['data'].get('duration', 0)
-            return min(total_duration / 5000, 1.0)  # Normalize
-        except:
-            return 0
-
-    def _calculate_confident_scrolling(self, df: pd.DataFrame) -> float:
-        """Detect confident, purposeful scrolling vs hesitant scrolling"""
-        try:
-            scroll_events = df[df['type'] == 'scroll']
-            if len(scroll_events) < 2:
-                return 0
-
-            # Confident scrolling: consistent speed, same direction
-            speeds = scroll_events['data'].apply(lambda x: x.get('scrollSpeed', 0) if isinstance(x, dict) else 0)
-            directions = scroll_events['data'].apply(lambda x: x.get('direction', '') if isinstance(x, dict) else '')
-
-            # Calculate consistency
-            speed_consistency = 1 / (1 + speeds.std()) if len(speeds) > 1 else 0
-            direction_consistency = len(directions[directions == directions.mode()[0]]) / len(directions) if len(directions) > 0 else 0
 
-            return (speed_consistency + direction_consistency) / 2
-        except:
-            return 0
+class EmotionTimeline:
+    """Per-session emotion history as fixed-size int arrays (ring buffer).
 
-    def _detect_comparison_behavior(self, df: pd.DataFrame) -> float:
-        """Detect comparison shopping patterns"""
-        try:
-            comparison_signals = 0
+    Each entry is (timestamp in epoch ms, emotion code, confidence in
+    per-mille); codes index EmotionalIntelligence.emotion_codes, -1 for
+    emotions outside the table. `version` bumps on every append so snapshot
+    builders can reuse unchanged copies.
+    """
 
-            # Tab switches
-            comparison_signals += len(df[df['type'] == 'tab_switch']) * 0.3
+    def __init__(self, capacity: int = 256):
+        self.ts = np.zeros(capacity, dtype=np.int64)
+        self.code = np.zeros(capacity, dtype=np.int16)
+        self.confidence = np.zeros(capacity, dtype=np.int16)
+        self.size = 0
+        self.head = 0  # Next slot to write
+        self.version = 0
 
-            # Navigation proximity (looking for competitor links)
-            comparison_signals += len(df[df['type'] == 'nav_proximity']) * 0.2
+    def __len__(self) -> int:
+        return self.size
 
-            # Price re-checks (returning to price after scrolling away)
-            price_events = df[df['type'].str.contains('price', na=False)]
-            if len(price_events) > 1:
-                # Check for price revisits
-                for i in range(1, len(price_events)):
-                    time_diff = i  # Simplified - would use actual timestamps
-                    if time_diff > 5:  # Returned to price after time away
-                        comparison_signals += 0.5
+    def append(self, timestamp: float, code: int, confidence: float):
+        i = self.head
+        self.ts[i] = int(timestamp * 1000)
+        self.code[i] = code
+        self.confidence[i] = int(round(confidence * 1000))
+        self.head = (i + 1) % len(self.ts)
+        self.size = min(self.size + 1, len(self.ts))
+        self.version += 1
 
-            return min(comparison_signals, 1.0)
-        except:
-            return 0
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(ts, code, confidence) copies, oldest first"""
+        order = (np.arange(self.size) + self.head - self.size) % len(self.ts)
+        return self.ts[order], self.code[order], self.confidence[order]
 
 
 class EmotionalIntelligence:
     """ML models for emotion detection and behavioral understanding"""
 
+    # Emotions mapped to the interventions actually deployed for them
+    INTERVENTION_MAP = {
+        # Discount Modal: price_shock, sticker_shock
+        'price_shock': ['discount_modal'],
+        'sticker_shock': ['discount_modal'],
+        # Trust Badges: skeptical, evaluation
+        'skeptical': ['trust_badges'],
+        'evaluation': ['trust_badges'],
+        # Urgency Banner: hesitation, cart_review
+        'hesitation': ['urgency_banner'],
+        'cart_review': ['urgency_banner'],
+        # Social Toast: evaluation, comparison_shopping
+        'comparison_shopping': ['social_toast', 'comparison_modal'],
+        # Help Chat: confusion, frustration
+        'confusion': ['help_chat'],
+        'frustration': ['help_chat'],
+        # Value Highlight: cart_hesitation
+        'cart_hesitation': ['value_highlight'],
+        # Comparison Modal: comparison_shopping, anxiety
+        'anxiety': ['comparison_modal'],
+        # Exit Intent: abandonment_intent, exit_risk
+        'abandonment_intent': ['exit_intent'],
+        'exit_risk': ['exit_intent'],
+    }
+    URGENT_EMOTIONS = ('abandonment_intent', 'exit_risk', 'price_shock')  # Lower intervention threshold
+
     def __init__(self):
-        self.feature_extractor = BehavioralFeatureExtractor()
-        self.scaler = StandardScaler()
+        self.feature_extractor = ColumnarFeatureExtractor()
 
         # Anomaly detection for unusual patterns
         self.anomaly_detector = IsolationForest(
@@ -363,11 +439,43 @@ class EmotionalIntelligence:
         self.pattern_memory = defaultdict(deque)
         self.max_memory = 1000
 
-        # Emotion thresholds (will be learned over time)
+        # Model inputs: per-tenant running normalization and the most recent
+        # normalized vectors the anomaly detector and clusterer are fit on
+        self.normalizers = {}  # tenant_id -> OnlineNormalizer
+        self.max_training = 100
+        self.training_vectors = deque(maxlen=self.max_training)
+        self.patterns_seen = 0
+        self.anomaly_fitted_at = None  # patterns_seen at the last fit; refit once the buffer turns over
+
+        # Emotion thresholds (tuned offline by tune-emotion-rules.py; see set_tuned_rules)
         self.emotion_rules = self._initialize_emotion_rules()
+        self.feature_weights = self._initialize_feature_weights()
+        self.tuned_rules = {}
+        self.tuned_weights = {}
+        self.compiled_rules = self.compile_rules()
+        self.emotion_codes = {emotion: code for code, emotion in enumerate(self.compiled_rules.emotions)}
 
         # Session tracking
         self.sessions = {}
+        self.timeline_capacity = 256
+
+        # Sampled stage profiling (off unless switched on at runtime)
+        self.profiler = StageProfiler()
+
+        # Rules first; models only for ambiguous or low-confidence results
+        self.cascade = CascadePolicy()
+
+        # Nearest labelled library patterns and ordered template matching (built by the service at startup)
+        self.pattern_index = None
+        self.sequence_matcher = None
+        self.transition_model = None
+
+        # Offline-trained anomaly / segmentation / classifier models (ML_MODEL_DIR); when
+        # loaded they replace the detector and clusterer refit on recent sessions
+        self.models = None
+
+        # Skip-recompute memo hit counters (see _process_session)
+        self.memo_stats = Counter()
 
     def _initialize_emotion_rules(self) -> Dict:
         """Initialize enhanced emotion detection rules matching intervention triggers"""
@@ -473,60 +581,9 @@ class EmotionalIntelligence:
             },
         }
 
-    async def process_session(self, session_id: str, events: List[dict]) -> Dict:
-        """Process session events and return emotional state"""
-
-        # Extract features
-        features = self.feature_extractor.extract_features(events)
-
-        # Store in session history
-        if session_id not in self.sessions:
-            self.sessions[session_id] = {
-                'feature_history': [],
-                'emotion_history': [],
-                'cluster': None
-            }
-
-        self.sessions[session_id]['feature_history'].append(features)
-
-        # Detect emotions
-        emotions = self._detect_emotions(features)
-
-        # Detect anomalies (unusual behavior)
-        is_anomaly = self._detect_anomaly(features)
-        if is_anomaly:
-            emotions['confusion'] = max(emotions.get('confusion', 0), 0.7)
-
-        # Get behavior cluster
-        cluster = self._get_behavior_cluster(features)
-        self.sessions[session_id]['cluster'] = cluster
-
-        # Calculate confidence
-        confidence = self._calculate_confidence(features, emotions)
-
-        # Get dominant emotion
-        dominant_emotion = max(emotions.items(), key=lambda x: x[1])[0] if emotions else 'curiosity'
-
-        # Store pattern for learning
-        self._remember_pattern(features, dominant_emotion)
-
+    def _initialize_feature_weights(self) -> Dict:
+        """Weights for critical features per emotion (unlisted features weigh 1.0)"""
         return {
-            'session_id': session_id,
-            'dominant_emotion': dominant_emotion,
-            'emotion_scores': emotions,
-            'confidence': confidence,
-            'is_anomaly': is_anomaly,
-            'behavior_cluster': cluster,
-            'features': features,
-            'recommendations': self._get_intervention_recommendations(emotions)
-        }
-
-    def _detect_emotions(self, features: Dict[str, float]) -> Dict[str, float]:
-        """Detect emotions from features with weighted scoring"""
-        emotions = {}
-
-        # Define weights for critical features per emotion
-        feature_weights = {
             'price_shock': {
                 'price_proximity_time': 2.0,
                 'price_hover_duration': 1.5,
@@ -585,30 +642,223 @@ class EmotionalIntelligence:
             }
         }
 
-        for emotion, rules in self.emotion_rules.items():
-            score = 0
-            total_weight = 0
+    def compile_rules(self, rule_overrides: Optional[Dict] = None,
+                      weight_overrides: Optional[Dict] = None) -> 'CompiledRules':
+        """Compile the base rules, with tuned and then optional per-emotion overrides merged in"""
+        rules = {emotion: dict(feature_rules) for emotion, feature_rules in self.emotion_rules.items()}
+        for overrides in (self.tuned_rules, rule_overrides or {}):
+            for emotion, feature_rules in overrides.items():
+                rules.setdefault(emotion, {}).update(
+                    {feature: tuple(bounds) for feature, bounds in feature_rules.items()}
+                )
+        weights = {emotion: dict(w) for emotion, w in self.feature_weights.items()}
+        for overrides in (self.tuned_weights, weight_overrides or {}):
+            for emotion, w in overrides.items():
+                weights.setdefault(emotion, {}).update(w)
+        return CompiledRules(rules, weights)
+
+    def set_tuned_rules(self, rules: Optional[Dict] = None, weights: Optional[Dict] = None):
+        """Swap in tuned base thresholds / weights (tenant overrides still apply on top).
+
+        The emotion table is fixed at startup (codes, publish policy, binary
+        payloads), so tuned rules may only adjust emotions that already exist.
+        """
+        unknown = sorted((set(rules or {}) | set(weights or {})) - set(self.emotion_rules))
+        if unknown:
+            raise ValueError(f"Tuned rules for unknown emotions: {', '.join(unknown)}")
+        previous = self.tuned_rules, self.tuned_weights
+        self.tuned_rules, self.tuned_weights = rules or {}, weights or {}
+        try:
+            self.compiled_rules = self.compile_rules()
+        except ValueError:
+            self.tuned_rules, self.tuned_weights = previous
+            raise
+
+    async def process_session(self, session_id: str, events: List[dict],
+                              skip_anomaly: bool = False, skip_clustering: bool = False,
+                              rules: Optional['CompiledRules'] = None,
+                              fingerprint: Optional[Tuple[int, int]] = None,
+                              timestamp: Optional[float] = None,
+                              tenant_id: str = DEFAULT_TENANT,
+                              sequence_evidence: Optional[Dict[str, float]] = None,
+                              rows: Optional[List[Optional[tuple]]] = None) -> Dict:
+        """Process session events and return emotional state
+
+        skip_anomaly / skip_clustering drop the expensive model stages when the
+        service is shedding load; `rules` selects a tenant's compiled rule set.
+        `fingerprint` identifies the event window - an unchanged window reuses
+        the previous result without re-extracting features. New results are
+        appended to the session's emotion timeline at `timestamp`. Model
+        inputs are normalized against `tenant_id`'s running feature baseline.
+        `sequence_evidence` carries event-order score floors (TransitionModel).
+        `rows` are the events already encoded for columnar_features (the live
+        window keeps them), so they are not encoded again.
+        """
+        memo = self.sessions.get(session_id, {}).get('memo')
+        memo_key = self._memo_key(rules, skip_anomaly, skip_clustering, sequence_evidence)
+        if fingerprint is not None and memo and memo['window'] == fingerprint and memo['key'] == memo_key:
+            self.memo_stats['window_hits'] += 1
+            return dict(memo['result'])
+
+        if not self.profiler.should_sample():
+            result = self._process_session(session_id, events, skip_anomaly, skip_clustering, rules,
+                                           tenant_id=tenant_id, sequence_evidence=sequence_evidence, rows=rows)
+        else:
+            profiler = self.profiler
+            profiler.sampled_calls += 1
+            profiler.profile.enable()
+            try:
+                result = self._process_session(session_id, events, skip_anomaly, skip_clustering, rules,
+                                               profiler.stage_timer(), tenant_id, sequence_evidence, rows)
+            finally:
+                profiler.profile.disable()
+
+        session = self.sessions[session_id]
+        session['memo']['window'] = fingerprint
+        if timestamp is not None:
+            session['emotion_history'].append(
+                timestamp, self.emotion_codes.get(result['dominant_emotion'], -1), result['confidence']
+            )
+        return result
+
+    def _memo_key(self, rules: Optional['CompiledRules'], skip_anomaly: bool, skip_clustering: bool,
+                  sequence_evidence: Optional[Dict[str, float]]) -> Tuple:
+        """What a cached result depends on besides the events (rule sets by generation, not id)"""
+        return ((rules or self.compiled_rules).generation, skip_anomaly, skip_clustering,
+                tuple(sorted((sequence_evidence or {}).items())))
+
+    def _process_session(self, session_id: str, events: List[dict],
+                         skip_anomaly: bool = False, skip_clustering: bool = False,
+                         rules: Optional['CompiledRules'] = None,
+                         mark: Optional[Callable[[str], None]] = None,
+                         tenant_id: str = DEFAULT_TENANT,
+                         sequence_evidence: Optional[Dict[str, float]] = None,
+                         rows: Optional[List[Optional[tuple]]] = None) -> Dict:
+        """Scoring pipeline; `mark(stage)` is only passed for profiled calls"""
 
-            weights = feature_weights.get(emotion, {})
+        # Extract features
+        features = self.feature_extractor.extract_features(events, rows)
+        if mark:
+            mark('extract_features')
 
-            for feature_name, (min_val, max_val) in rules.items():
-                if feature_name in features:
-                    value = features[feature_name]
-                    weight = weights.get(feature_name, 1.0)
+        # Store in session history
+        if session_id not in self.sessions:
+            self.sessions[session_id] = {
+                'feature_history': [],
+                'emotion_history': EmotionTimeline(self.timeline_capacity),
+                'cluster': None,
+                'prediction': None,
+                'memo': {}
+            }
+        session = self.sessions[session_id]
+
+        # Same feature vector as last time -> same scores; skip the models
+        values, present = feature_vector(features)
+        feature_key = hashlib.blake2b(values.tobytes() + present.tobytes(), digest_size=16).digest()
+        memo_key = self._memo_key(rules, skip_anomaly, skip_clustering, sequence_evidence)
+        memo = session['memo']
+        if memo.get('features') == feature_key and memo.get('key') == memo_key:
+            self.memo_stats['feature_hits'] += 1
+            result = dict(memo['result'], features=features)
+            memo['result'] = result
+            return result
+        self.memo_stats['misses'] += 1
+
+        session['feature_history'].append(features)
+
+        # Nearest library patterns (before values are normalized in place below)
+        pattern_match = self.pattern_index.match(values, present) if self.pattern_index else None
+        if mark:
+            mark('pattern_match')
+
+        # Trained models see the training baseline they were fit on; the
+        # in-process fallbacks see the vector z-scored against the tenant's traffic
+        model_input = self.models.prepare(values, present) if self.models else None
+        normalizer = self.normalizer(tenant_id)
+        normalizer.update(values, present)
+        normalized = normalizer.normalize(values, present)
+        if model_input is None:
+            model_input = normalized
+        if mark:
+            mark('normalize')
 
-                    if min_val is not None and value >= min_val:
-                        # Scale score based on how much it exceeds threshold
-                        multiplier = min(2.0, value / min_val) if min_val > 0 else 1.0
-                        score += weight * multiplier
-                    elif max_val is not None and value <= max_val:
-                        # Scale score based on how much below threshold
-                        multiplier = min(2.0, max_val / value) if value > 0 else 1.0
-                        score += weight * multiplier
+        # Detect emotions
+        emotions = self._detect_emotions(features, rules, sequence_evidence)
+        if mark:
+            mark('detect_emotions')
 
-                    total_weight += weight
+        # Cascade: stop after the rules when they are clear (overload tiers still apply)
+        confidence = self._calculate_confidence(features, emotions)
+        run_models = not (skip_anomaly and skip_clustering) and self.cascade.needs_models(emotions, confidence)
+        if run_models:
+            models_started = time.perf_counter()
 
-            if total_weight > 0:
-                emotions[emotion] = min(1.0, score / total_weight)
+        # Detect anomalies (unusual behavior)
+        is_anomaly = self._detect_anomaly(model_input) if run_models and not skip_anomaly else False
+        if is_anomaly:
+            emotions['confusion'] = max(emotions.get('confusion', 0), 0.7)
+            confidence = self._calculate_confidence(features, emotions)
+        if mark:
+            mark('detect_anomaly')
+
+        # Get behavior cluster (keep the last known one while shedding load or after a cascade exit)
+        if run_models and not skip_clustering:
+            cluster = self._get_behavior_cluster(model_input)
+            session['cluster'] = cluster
+        else:
+            cluster = session['cluster']
+        # Trained classifier's opinion (reported alongside the rules, like pattern_match)
+        prediction = self.models.classify(model_input) if run_models and self.models else session['prediction']
+        session['prediction'] = prediction
+        if run_models:
+            self.cascade.record_models(time.perf_counter() - models_started)
+        if mark:
+            mark('behavior_cluster')
+
+        # Get dominant emotion
+        dominant_emotion = max(emotions.items(), key=lambda x: x[1])[0] if emotions else 'curiosity'
+
+        # Store pattern for learning
+        self._remember_pattern(features, dominant_emotion, normalized)
+        if mark:
+            mark('confidence_and_memory')
+
+        recommendations = self._get_intervention_recommendations(emotions)
+        if mark:
+            mark('recommendations')
+
+        result = {
+            'session_id': session_id,
+            'dominant_emotion': dominant_emotion,
+            'emotion_scores': emotions,
+            'confidence': confidence,
+            'is_anomaly': is_anomaly,
+            'behavior_cluster': cluster,
+            'features': features,
+            'recommendations': recommendations,
+            'pattern_match': pattern_match,
+            'classifier': prediction
+        }
+        session['memo'] = {'features': feature_key, 'key': memo_key, 'result': result}
+        return result
+
+    def memo_report(self) -> Dict:
+        """Skip-recompute cache hit rates"""
+        window_hits = self.memo_stats['window_hits']
+        feature_hits = self.memo_stats['feature_hits']
+        total = window_hits + feature_hits + self.memo_stats['misses']
+        return {
+            'window_hits': window_hits,
+            'feature_hits': feature_hits,
+            'misses': self.memo_stats['misses'],
+            'hit_rate': (window_hits + feature_hits) / total if total else 0.0,
+        }
+
+    def _detect_emotions(self, features: Dict[str, float],
+                         rules: Optional['CompiledRules'] = None,
+                         sequence_evidence: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+        """Detect emotions from features with weighted scoring (plus event-order evidence, see TransitionModel)"""
+        emotions = (rules or self.compiled_rules).score(features)
 
         # Price shock should only trigger with STRONG signals (not just any price proximity)
         price_signal_strength = features.get('price_proximity_time', 0) * features.get('acceleration_spikes', 0)
@@ -638,59 +888,120 @@ class EmotionalIntelligence:
         if features.get('scroll_depth', 0) > 10 or features.get('session_duration', 0) > 3:
             emotions['engagement'] = max(emotions.get('engagement', 0), 0.5)
 
+        # Event order the transition models clearly attribute to an emotion
+        for emotion, floor in (sequence_evidence or {}).items():
+            emotions[emotion] = max(emotions.get(emotion, 0), floor)
+
         # Default to curiosity if nothing strong detected
         if not emotions or max(emotions.values()) < 0.4:
             emotions['curiosity'] = 0.6
 
         return emotions
 
-    def _detect_anomaly(self, features: Dict[str, float]) -> bool:
-        """Detect if behavior is anomalous"""
+    def score_batch(self, values: np.ndarray, present: np.ndarray,
+                    rules: Optional['CompiledRules'] = None,
+                    sequence_evidence: Optional[List[Dict[str, float]]] = None) -> Dict:
+        """Rule-stage scoring for many sessions at once (rows from feature_vector).
+
+        Array form of _detect_emotions, _calculate_confidence and
+        _get_intervention_recommendations. The anomaly and clustering stages
+        are left out: they refit on live pattern memory, which batch work
+        must not touch. Scores are NaN where an emotion was not scored.
+        """
+        rules = rules or self.compiled_rules
+        column = {emotion: c for c, emotion in enumerate(rules.emotions)}
+        score, total = rules.score_vector(values, present)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.where(total > 0, np.minimum(1.0, score / total), np.nan)
+
+        def feature(name):
+            return values[:, FEATURE_INDEX[name]]
+
+        def boost(emotion, mask, floor):
+            c = column[emotion]
+            scores[:, c] = np.where(mask, np.fmax(scores[:, c], floor), scores[:, c])
+
+        price_shock = (feature('price_proximity_time') * feature('acceleration_spikes') > 1) & \
+                      (feature('exit_signal_strength') > 0)
+        boost('price_shock', price_shock, 0.8)
+        boost('sticker_shock', ~price_shock & (feature('price_hover_duration') > 0.5) & (feature('idle_ratio') > 0.3), 0.7)
+        exit_after_idle = feature('mouse_exit_after_idle') > 0.3
+        boost('abandonment_intent', exit_after_idle, 0.75)
+        boost('exit_risk', exit_after_idle, 0.7)
+        boost('hesitation', (feature('cta_proximity_time') > 0) & (feature('micro_hesitations') > 2), 0.6)
+        cart = (feature('form_proximity_time') > 0) & (feature('idle_ratio') > 0.15)
+        boost('cart_hesitation', cart, 0.6)
+        boost('cart_review', cart, 0.5)
+        boost('engagement', (feature('scroll_depth') > 10) | (feature('session_duration') > 3), 0.5)
+        for row, evidence in enumerate(sequence_evidence or ()):
+            for emotion, floor in evidence.items():
+                scores[row, column[emotion]] = np.fmax(scores[row, column[emotion]], floor)
+
+        filled = np.where(np.isnan(scores), -np.inf, scores)
+        scores[filled.max(axis=1) < 0.4, column['curiosity']] = 0.6
+        filled = np.where(np.isnan(scores), -np.inf, scores)
+        dominant = filled.argmax(axis=1)
+        best = filled.max(axis=1)
+
+        feature_count = (values > 0).sum(axis=1)
+        confidence = np.minimum(0.5 + np.minimum(feature_count * 0.02, 0.3) + best * 0.2, 1.0)
+
+        # Interventions: (sessions × emotions) over-threshold mask @ (emotions × interventions) map
+        interventions = sorted({i for actions in self.INTERVENTION_MAP.values() for i in actions})
+        action_map = np.zeros((len(rules.emotions), len(interventions)), dtype=bool)
+        for emotion, actions in self.INTERVENTION_MAP.items():
+            if emotion in column:
+                action_map[column[emotion], [interventions.index(a) for a in actions]] = True
+        thresholds = np.array([0.4 if e in self.URGENT_EMOTIONS else 0.5 for e in rules.emotions])
+        triggered = (np.nan_to_num(scores, nan=-1.0) > thresholds).astype(np.int32) @ action_map.astype(np.int32) > 0
+        recommendations = [[interventions[i] for i in np.flatnonzero(row)] for row in triggered]
+
+        return {
+            'emotions': rules.emotions,
+            'scores': scores,
+            'dominant': dominant,
+            'confidence': confidence,
+            'recommendations': recommendations,
+        }
+
+    def normalizer(self, tenant_id: str) -> OnlineNormalizer:
+        normalizer = self.normalizers.get(tenant_id)
+        if normalizer is None:
+            normalizer = self.normalizers[tenant_id] = OnlineNormalizer()
+        return normalizer
+
+    def _detect_anomaly(self, vector: np.ndarray) -> bool:
+        """Detect if behavior is anomalous (vector is a model input, in FEATURE_SCHEMA order)"""
         try:
+            if self.models:
+                return self.models.is_anomaly(vector)
+
             # Need at least some training data
-            if len(self.pattern_memory) < 10:
+            if len(self.training_vectors) < 10:
                 return False
 
-            # Convert to array
-            feature_array = np.array(list(features.values())).reshape(1, -1)
+            # Refit on the recent patterns once they have turned over
+            if self.anomaly_fitted_at is None or self.patterns_seen - self.anomaly_fitted_at >= self.max_training:
+                self.anomaly_detector.fit(np.array(self.training_vectors))
+                self.anomaly_fitted_at = self.patterns_seen
 
-            # Check if we have enough samples to fit
-            if hasattr(self.anomaly_detector, 'fit'):
-                # Get recent patterns for training
-                recent_patterns = list(self.pattern_memory.values())[:100]
-                if len(recent_patterns) > 5:
-                    X = np.array([list(p[0].values()) for p in recent_patterns if p])
-                    if X.shape[0] > 5:
-                        self.anomaly_detector.fit(X)
-                        prediction = self.anomaly_detector.predict(feature_array)
-                        return prediction[0] == -1
-
-            return False
-        except:
+            return bool(self.anomaly_detector.predict(vector.reshape(1, -1))[0] == -1)
+        except Exception:
             return False
 
-    def _get_behavior_cluster(self, features: Dict[str, float]) -> Optional[int]:
-        """Get behavior cluster for segmentation"""
+    def _get_behavior_cluster(self, vector: np.ndarray) -> Optional[int]:
+        """Get behavior cluster for segmentation (vector is a model input, in FEATURE_SCHEMA order)"""
         try:
-            if len(self.pattern_memory) < 10:
-                return None
+            if self.models:
+                return self.models.cluster(vector)
 
-            # Get recent patterns
-            recent_patterns = list(self.pattern_memory.values())[:100]
-            if len(recent_patterns) > 5:
-                X = np.array([list(p[0].values()) for p in recent_patterns if p])
-                if X.shape[0] > 5:
-                    self.behavior_clusterer.fit(X)
-                    feature_array = np.array(list(features.values())).reshape(1, -1)
-
-                    # Predict cluster
-                    distances = self.behavior_clusterer.fit_predict(
-                        np.vstack([X, feature_array])
-                    )
-                    return distances[-1]
+            if len(self.training_vectors) < 10:
+                return None
 
-            return None
-        except:
+            # DBSCAN has no predict: cluster the recent patterns plus this one
+            labels = self.behavior_clusterer.fit_predict(np.vstack([np.array(self.training_vectors), vector]))
+            return int(labels[-1])
+        except Exception:
             return None
 
     def _calculate_confidence(self, features: Dict[str, float], emotions: Dict[str, float]) -> float:
@@ -709,92 +1020,705 @@ class EmotionalIntelligence:
 
         return min(base_confidence, 1.0)
 
-    def _remember_pattern(self, features: Dict[str, float], emotion: str):
+    def _remember_pattern(self, features: Dict[str, float], emotion: str,
+                          vector: Optional[np.ndarray] = None):
         """Store pattern for future learning"""
         if emotion not in self.pattern_memory:
             self.pattern_memory[emotion] = deque(maxlen=self.max_memory)
 
         self.pattern_memory[emotion].append((features, datetime.now()))
+        if vector is not None:
+            self.training_vectors.append(vector.copy())
+            self.patterns_seen += 1
+
+    def checkpoint_state(self) -> Dict[str, np.ndarray]:
+        """Learned state as plain arrays: tenant normalizers and the model training buffer.
+
+        The anomaly detector and clusterer are refit from the training
+        buffer, so restoring it brings the models back as well.
+        """
+        tenants = sorted(self.normalizers)
+        return {
+            'schema': np.array(FEATURE_SCHEMA),
+            'tenants': np.array(tenants, dtype=str),
+            'normalizers': (np.stack([self.normalizers[t].state() for t in tenants]) if tenants
+                            else np.zeros((0, 3, len(FEATURE_SCHEMA)))),
+            'training_vectors': (np.array(self.training_vectors) if self.training_vectors
+                                 else np.zeros((0, len(FEATURE_SCHEMA)))),
+        }
+
+    def restore_state(self, state: Dict[str, np.ndarray]):
+        if tuple(state['schema']) != FEATURE_SCHEMA:
+            raise ValueError('checkpoint was written for a different feature schema')
+        self.normalizers = {
+            str(tenant_id): OnlineNormalizer.from_state(normalizer)
+            for tenant_id, normalizer in zip(state['tenants'], state['normalizers'])
+        }
+        self.training_vectors = deque((np.array(v) for v in state['training_vectors']), maxlen=self.max_training)
+        self.anomaly_fitted_at = None  # Refit on first use
 
     def _get_intervention_recommendations(self, emotions: Dict[str, float]) -> List[str]:
         """Recommend interventions based on emotional state - aligned with real deployments"""
         recommendations = []
 
-        # Map emotions to actual intervention deployments
-        intervention_map = {
-            # Discount Modal: price_shock, sticker_shock
-            'price_shock': ['discount_modal'],
-            'sticker_shock': ['discount_modal'],
-            # Trust Badges: skeptical, evaluation
-            'skeptical': ['trust_badges'],
-            'evaluation': ['trust_badges'],
-            # Urgency Banner: hesitation, cart_review
-            'hesitation': ['urgency_banner'],
-            'cart_review': ['urgency_banner'],
-            # Social Toast: evaluation, comparison_shopping
-            'comparison_shopping': ['social_toast', 'comparison_modal'],
-            # Help Chat: confusion, frustration
-            'confusion': ['help_chat'],
-            'frustration': ['help_chat'],
-            # Value Highlight: cart_hesitation
-            'cart_hesitation': ['value_highlight'],
-            # Comparison Modal: comparison_shopping, anxiety
-            'anxiety': ['comparison_modal'],
-            # Exit Intent: abandonment_intent, exit_risk
-            'abandonment_intent': ['exit_intent'],
-            'exit_risk': ['exit_intent'],
-        }
-
         # Get recommendations based on emotion scores
         for emotion, score in emotions.items():
             # Use lower threshold for critical interventions
-            threshold = 0.4 if emotion in ['abandonment_intent', 'exit_risk', 'price_shock'] else 0.5
-            if score > threshold and emotion in intervention_map:
-                recommendations.extend(intervention_map[emotion])
+            threshold = 0.4 if emotion in self.URGENT_EMOTIONS else 0.5
+            if score > threshold and emotion in self.INTERVENTION_MAP:
+                recommendations.extend(self.INTERVENTION_MAP[emotion])
+
+        return sorted(set(recommendations))  # Remove duplicates (stable order for diffing)
+
+
+def _percentiles(values, points=(50, 90, 99)) -> Dict[str, float]:
+    """Percentile summary of a sample (empty sample -> zeros)"""
+    if len(values) == 0:
+        return {f'p{p}': 0.0 for p in points}
+    arr = np.asarray(values, dtype=float)
+    summary = {f'p{p}': float(v) for p, v in zip(points, np.percentile(arr, points))}
+    summary['max'] = float(arr.max())
+    return summary
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (seconds) - O(log buckets) per observation"""
+
+    BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile (capped at the max seen)"""
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def report(self) -> Dict:
+        cumulative, buckets = 0, {}
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += n
+            buckets['+Inf' if bound == float('inf') else f'{bound:g}'] = cumulative
+        return {
+            'count': self.count,
+            'mean_ms': self.sum / self.count * 1000 if self.count else 0.0,
+            **{f'p{p}_ms': self.quantile(p / 100) * 1000 for p in (50, 90, 99)},
+            'max_ms': self.max * 1000,
+            'buckets': buckets,  # Cumulative counts per upper bound (seconds)
+        }
 
-        return list(set(recommendations))  # Remove duplicates
+
+class ServiceMetrics:
+    """In-process metrics registry - counters, gauges, latency samples and histograms"""
+
+    def __init__(self, sample_size: int = 2048):
+        self.counters = defaultdict(float)
+        self.gauges = {}
+        self.samples = defaultdict(lambda: deque(maxlen=sample_size))
+        self.histograms = defaultdict(dict)  # name -> (tenant, emotion) -> LatencyHistogram
+        self.collectors = {}  # name -> callable returning a dict for the snapshot
+
+    def inc(self, name: str, value: float = 1.0):
+        self.counters[name] += value
+
+    def set(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        self.samples[name].append(value)
+
+    def observe_latency(self, name: str, value: float, tenant_id: str, emotion: str):
+        """Record a latency overall and in the (tenant, emotion) histogram"""
+        value = max(value, 0.0)  # Client clocks can run ahead of ours
+        self.samples[name].append(value)
+        histogram = self.histograms[name].get((tenant_id, emotion))
+        if histogram is None:
+            histogram = self.histograms[name][(tenant_id, emotion)] = LatencyHistogram()
+        histogram.observe(value)
+
+    def register(self, name: str, collector: Callable[[], Dict]):
+        """Attach a component report to every snapshot"""
+        self.collectors[name] = collector
+
+    def snapshot(self) -> Dict:
+        """Point-in-time view of all metrics"""
+        snapshot = {
+            'timestamp': datetime.now().isoformat(),
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+            'latency_ms': {name: _percentiles([v * 1000 for v in values])
+                           for name, values in self.samples.items()},
+            'histograms': {},
+        }
+        for name, by_label in self.histograms.items():
+            tenants = snapshot['histograms'][name] = defaultdict(dict)
+            for (tenant_id, emotion), histogram in by_label.items():
+                tenants[tenant_id][emotion] = histogram.report()
+            snapshot['histograms'][name] = dict(tenants)
+        for name, collector in self.collectors.items():
+            try:
+                snapshot[name] = collector()
+            except Exception as e:
+                snapshot[name] = {'error': str(e)}
+        return snapshot
+
+
+class LoopLagWatchdog:
+    """Measures asyncio loop scheduling lag and captures what is blocking it.
+
+    A probe coroutine sleeps for `interval` and records how late it wakes up.
+    A helper thread watches the probe's heartbeat; while the loop is stalled
+    longer than `threshold` it samples the main thread's stack, so the report
+    shows which call sites (sklearn fits, pandas extraction...) hold the loop.
+    """
+
+    # Frames in these files are the service's own: this script and its package
+    OWN_SOURCES = (__file__, os.path.dirname(sys.modules['emotion_ml'].__file__))
+
+    def __init__(self, interval: float = 0.05, threshold: float = 0.1, history: int = 4096):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags = deque(maxlen=history)
+        self.blocking_sites = Counter()
+        self.stall_count = 0
+        self.stack_samples = 0
+        self._lock = threading.Lock()
+        self._heartbeat = time.monotonic()
+        self._main_thread_id = None
+        self._stop = threading.Event()
+        self._task = None
+        self._thread = None
+
+    def start(self):
+        """Start probing the running loop (call from the loop's thread)"""
+        self._main_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.ensure_future(self._probe())
+        self._thread = threading.Thread(target=self._monitor, name='loop-lag-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _probe(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - expected))
+            self._heartbeat = time.monotonic()
+
+    def _monitor(self):
+        """Helper thread: sample the main stack while the loop is stalled"""
+        last_stalled_beat = None
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._heartbeat
+            if time.monotonic() - beat - self.interval < self.threshold:
+                continue
+
+            frame = sys._current_frames().get(self._main_thread_id)
+            if frame is None:
+                continue
+
+            site = self._call_site(frame)
+            with self._lock:
+                if beat != last_stalled_beat:
+                    # Count each stall once, but keep sampling while it lasts
+                    last_stalled_beat = beat
+                    self.stall_count += 1
+                self.stack_samples += 1
+                self.blocking_sites[site] += 1
+
+    @staticmethod
+    def _call_site(frame) -> str:
+        """Describe a stack as 'service frame → innermost frame'"""
+        stack = traceback.extract_stack(frame)
+        leaf = stack[-1]
+        own = next((f for f in reversed(stack) if f.filename.startswith(LoopLagWatchdog.OWN_SOURCES)), None)
+        leaf_desc = f"{leaf.name} ({os.path.basename(leaf.filename)}:{leaf.lineno})"
+        if own is None or own is leaf:
+            return leaf_desc
+        return f"{own.name}:{own.lineno} → {leaf_desc}"
+
+    def report(self, top: int = 10) -> Dict:
+        """Lag percentiles and the most frequently sampled blocking call sites"""
+        with self._lock:
+            sites = self.blocking_sites.most_common(top)
+            stalls, samples = self.stall_count, self.stack_samples
+        return {
+            'lag_ms': _percentiles([lag * 1000 for lag in list(self.lags)]),
+            'threshold_ms': self.threshold * 1000,
+            'stalls': stalls,
+            'stack_samples': samples,
+            'top_blocking': [{'site': site, 'samples': count} for site, count in sites],
+        }
+
+    def reset(self):
+        with self._lock:
+            self.lags.clear()
+            self.blocking_sites.clear()
+            self.stall_count = 0
+            self.stack_samples = 0
+
+
+class TenantRegistry:
+    """Per-tenant scheduling weights, quotas and compiled rule overrides.
+
+    Config (JSON, path in ML_TENANT_CONFIG):
+        {"default": {"weight": 1, "max_sessions": 5000, "max_buffered_events": 100000},
+         "tenants": {"acme": {"weight": 3, "max_sessions": 20000,
+                              "rules": {"price_shock": {"price_proximity_time": [2, null]}},
+                              "weights": {"price_shock": {"price_hover_duration": 2.0}}}}}
+
+    Tenants with rule or weight overrides get their own CompiledRules, built on
+    first use and cached; everyone else shares the base rule set.
+    """
+
+    DEFAULTS = {'weight': 1.0, 'max_sessions': 5000, 'max_buffered_events': 100000}
+
+    def __init__(self, config: Optional[Dict], intelligence: 'EmotionalIntelligence'):
+        config = config or {}
+        self.intelligence = intelligence
+        self.defaults = {**self.DEFAULTS, **config.get('default', {})}
+        self.tenants = config.get('tenants', {})
+        self._rules = {}
+
+    @classmethod
+    def from_file(cls, path: Optional[str], intelligence: 'EmotionalIntelligence') -> 'TenantRegistry':
+        if not path:
+            return cls(None, intelligence)
+        with open(path) as f:
+            registry = cls(json.load(f), intelligence)
+        print(f"🏢 Loaded tenant config for {len(registry.tenants)} tenants from {path}")
+        return registry
+
+    def _setting(self, tenant_id: str, key: str):
+        return self.tenants.get(tenant_id, {}).get(key, self.defaults[key])
+
+    def weight(self, tenant_id: str) -> float:
+        return float(self._setting(tenant_id, 'weight'))
+
+    def max_sessions(self, tenant_id: str) -> int:
+        return int(self._setting(tenant_id, 'max_sessions'))
+
+    def max_buffered_events(self, tenant_id: str) -> int:
+        return int(self._setting(tenant_id, 'max_buffered_events'))
+
+    def rules_for(self, tenant_id: str) -> 'CompiledRules':
+        """The tenant's compiled rule set (compiled once, then cached)"""
+        rules = self._rules.get(tenant_id)
+        if rules is None:
+            overrides = self.tenants.get(tenant_id, {})
+            if overrides.get('rules') or overrides.get('weights'):
+                rules = self.intelligence.compile_rules(overrides.get('rules'), overrides.get('weights'))
+            else:
+                rules = self.intelligence.compiled_rules
+            self._rules[tenant_id] = rules
+        return rules
+
+    def invalidate(self):
+        """Drop cached rule sets (after the base rules change, e.g. a rules file reload)"""
+        self._rules.clear()
+
+
+class SessionStateSnapshot:
+    """Immutable view of per-session state for the read API.
+
+    Rebuilt every snapshot interval from the previous snapshot plus the
+    sessions that changed, then swapped in with one assignment, so queries
+    read a consistent picture without touching anything the scoring loop
+    mutates. Entries are never modified after construction - a changed
+    session gets a new entry.
+    """
+
+    def __init__(self, created_at: float, emotions: Tuple[str, ...], sessions: Dict[str, Tuple]):
+        self.created_at = created_at
+        self.emotions = emotions
+        self.sessions = sessions  # session_id -> (state dict, timeline version, (ts, code, confidence))
+
+    def session(self, session_id: str, timeline: bool = True, limit: Optional[int] = None) -> Optional[Dict]:
+        entry = self.sessions.get(session_id)
+        if entry is None:
+            return None
+        state, _, (ts, code, confidence) = entry
+        reply = dict(state)
+        if timeline:
+            start = -limit if limit else 0
+            reply['timeline'] = {
+                'ts': ts[start:].tolist(),
+                'code': code[start:].tolist(),
+                'confidence': confidence[start:].tolist(),
+            }
+        return reply
+
+    def search(self, tenant_id: Optional[str] = None, emotion: Optional[str] = None,
+               limit: int = 100) -> List[Dict]:
+        matches = []
+        for state, _, _ in self.sessions.values():
+            if tenant_id is not None and state['tenant_id'] != tenant_id:
+                continue
+            if emotion is not None and state['emotion'] != emotion:
+                continue
+            matches.append(state)
+            if len(matches) >= limit:
+                break
+        return matches
 
 
 class MLEmotionService:
     """Main service that connects to NATS and processes telemetry"""
 
-    def __init__(self):
+    # Event types that lower the scoring threshold and keep full scoring under load
+    CRITICAL_EVENT_TYPES = ('price_proximity', 'mouse_exit', 'viewport_approach', 'tab_switch')
+
+    def __init__(self, clock: Callable[[], float] = time.time):
         self.nc = None
+        self.clock = clock  # Wall clock by default; the replay harness injects virtual time
         self.intelligence = EmotionalIntelligence()
-        self.event_buffer = defaultdict(list)
+        self.event_buffer = {}  # session_id -> EventTimeWindow
         self.max_buffer_size = 50
+        self.window_span = float(os.getenv('ML_WINDOW_SECONDS', '30'))  # Seconds of event time per window
+        self.allowed_lateness = float(os.getenv('ML_ALLOWED_LATENESS', '5'))  # Reorder bound behind the newest event
         self.last_process_time = defaultdict(float)
         self.process_debounce = 5.0  # Process at most every 5 seconds per session
+        self.deferred_sessions = {}  # session -> tenant: out-of-order events waiting out the debounce
         self.last_emotions = defaultdict(lambda: 'none')
-        self.last_published = defaultdict(dict)  # Track last published state
+        self.last_published = {}  # session_id -> PublishPolicy state
+        self.last_event_time = {}
+        self.session_ttl = 1800.0  # Evict sessions idle for 30 minutes
+
+        # Tenants: fair scoring queue, quotas and rule overrides
+        self.tenants = TenantRegistry.from_file(os.getenv('ML_TENANT_CONFIG'), self.intelligence)
+        self.scheduler = TenantScheduler(self.tenants.weight)
+        self.session_tenant = {}
+        self.tenant_sessions = defaultdict(set)
+        self.tenant_buffered = defaultdict(int)
+        self._scoring = False
+
+        # Tuned base rules (tune-emotion-rules.py --out), reloaded when the file changes
+        self.rules_file = os.getenv('ML_RULES_FILE')
+        self.rules_poll = float(os.getenv('ML_RULES_POLL', '5'))
+        self.rules_info = {'source': None}
+        self._rules_mtime = None
+
+        # Ingestion dedup (fixed memory, rotating generations)
+        self.dedup = None
+        if os.getenv('ML_DEDUP', '1') != '0':
+            self.dedup = RotatingBloomFilter(
+                memory_bytes=int(float(os.getenv('ML_DEDUP_MEMORY_MB', '4')) * (1 << 20))
+            )
+
+        # Outbound subjects: EMOTIONS.state.<tenant>.<emotion> (JSON or binary),
+        # mirrored as JSON to the flat EMOTIONS.state until consumers move over
+        self.hierarchical_subjects = os.getenv('ML_HIERARCHICAL_SUBJECTS', '1') != '0'
+        self.legacy_subject = os.getenv('ML_LEGACY_SUBJECT', '1') != '0'
+        self.payload_format = os.getenv('ML_PAYLOAD_FORMAT', 'json')
+        if self.payload_format not in ('json', 'binary'):
+            raise ValueError(f"ML_PAYLOAD_FORMAT must be json or binary, not {self.payload_format!r}")
+        self.emotion_codes = self.intelligence.emotion_codes
+
+        # Outbound coalescing: latest result per session, flushed in bulk every interval
+        self.publish_interval = float(os.getenv('ML_PUBLISH_FLUSH_MS', '20')) / 1000  # 0 publishes inline
+        self._outbox = {}  # session_id -> latest result awaiting the next flush
+        self._outbox_ready = asyncio.Event()
+
+        # Publish suppression (hysteresis, dwell, rate and delta per emotion)
+        self.publish_policy = PublishPolicy.from_file(
+            os.getenv('ML_PUBLISH_POLICY'), self.intelligence.compiled_rules.emotions
+        )
+
+        # Observability
+        self.metrics = ServiceMetrics()
+        self.metrics_interval = 10.0  # Publish a metrics snapshot every N seconds
+        self.watchdog = None
+        if os.getenv('ML_WATCHDOG', '1') != '0':
+            self.watchdog = LoopLagWatchdog(
+                threshold=float(os.getenv('ML_WATCHDOG_THRESHOLD_MS', '100')) / 1000
+            )
+            self.metrics.register('watchdog', self.watchdog.report)
+
+        # Load shedding
+        self.overload = OverloadController(
+            latency_budget=float(os.getenv('ML_LATENCY_BUDGET_MS', '250')) / 1000
+        )
+        self.overload_interval = float(os.getenv('ML_OVERLOAD_TICK_MS', '500')) / 1000
+        self.metrics.register('overload', self.overload.report)
+        self.metrics.register('tenants', self._tenant_report)
+        self.metrics.register('memo', self.intelligence.memo_report)
+        self.metrics.register('publish', self.publish_policy.report)
+        if self.dedup:
+            self.metrics.register('dedup', self.dedup.report)
+        self.metrics.set('overload_tier', 0)
+
+        # Cascade inference: models only when the rules are ambiguous or unsure
+        self.intelligence.cascade = CascadePolicy(
+            enabled=os.getenv('ML_CASCADE', '1') != '0',
+            margin=float(os.getenv('ML_CASCADE_MARGIN', '0.15')),
+            min_confidence=float(os.getenv('ML_CASCADE_CONFIDENCE', '0.8')),
+            sample_every=int(os.getenv('ML_CASCADE_SAMPLE', '20'))
+        )
+        self.metrics.register('cascade', self.intelligence.cascade.report)
+
+        # Pattern-library models (kNN index, sequence templates, transition models):
+        # built by start() in a worker thread, so constructing the service stays cheap
+        self.sequence_states = {}  # session_id -> SequenceState
+        self.transition_states = {}  # session_id -> TransitionState
+        self._library_built = False
+
+        # Offline-trained models (train-emotion-models.py --out DIR)
+        model_dir = os.getenv('ML_MODEL_DIR')
+        if model_dir:
+            try:
+                self.intelligence.models = ModelArtifacts.load(model_dir)
+                self.metrics.register('models', self.intelligence.models.report)
+                print(f"🧠 Trained models {self.intelligence.models.version} from {self.intelligence.models.path}")
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Trained models not loaded from {model_dir}: {e}")
+
+        # Learned model state (tenant normalizers, training buffer), restored at startup
+        self.checkpoint_path = os.getenv('ML_CHECKPOINT')
+        self.checkpoint_interval = float(os.getenv('ML_CHECKPOINT_INTERVAL', '300'))
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            self.load_checkpoint(self.checkpoint_path)
+        if self.rules_file and os.path.exists(self.rules_file):
+            self.reload_rules_file()
+
+        # Per-tenant traffic sketches (feature quantiles, event types, active sessions), 0 disables
+        self.sketch_interval = float(os.getenv('ML_SKETCH_INTERVAL', '60'))
+        self.drift_threshold = float(os.getenv('ML_DRIFT_THRESHOLD', '0.25'))  # KS distance worth a warning
+        self.sketches = {}  # tenant_id -> TrafficSketches for the current interval
+        self.sketch_snapshots = {}  # tenant_id -> last closed interval
+        self.sketch_started = None
+        if self.sketch_interval > 0:
+            self.metrics.register('sketches', self._sketch_report)
+
+        # Read API: queries are answered from an immutable snapshot swapped in every interval
+        self.snapshot_interval = float(os.getenv('ML_SNAPSHOT_INTERVAL', '1'))
+        self.state_snapshot = SessionStateSnapshot(0.0, self.intelligence.compiled_rules.emotions, {})
+        self._snapshot_dirty = set()
+
+        # Offline batch scoring (ML.score.batch / POST /api/score), isolated from live state
+        self.batch_scorer = BatchScorer(
+            self.intelligence, workers=int(os.getenv('ML_BATCH_WORKERS', str(os.cpu_count() or 1))),
+            max_events=self.max_buffer_size
+        )
+
+        # Optional in-process ingest (HTTP + WebSocket) that bypasses the gateway and NATS
+        self.ingest_queue = asyncio.Queue(maxsize=int(os.getenv('ML_INGEST_QUEUE', '10000')))
+        self.ingest_server = None
+        if os.getenv('ML_INGEST_PORT'):
+            self.ingest_server = IngestServer(
+                self.ingest_queue, self.metrics,
+                host=os.getenv('ML_INGEST_HOST', '127.0.0.1'), port=int(os.getenv('ML_INGEST_PORT')),
+                query=self.query_session, score=self.score_batch, token=os.getenv('ML_INGEST_TOKEN')
+            )
+            self.metrics.register('ingest', self.ingest_server.report)
+
+        # Control plane: ML.control.<command> -> handler(payload) -> reply dict
+        self.control_handlers = {
+            'metrics': lambda payload: self.metrics.snapshot(),
+            'watchdog': self._control_watchdog,
+            'profile': self._control_profile,
+            'schema': self._control_schema,
+            'session': self._control_session,
+            'sessions': self._control_sessions,
+            'sketches': self._control_sketches,
+            'rules': self._control_rules,
+        }
+        self.profile_dir = os.getenv('ML_PROFILE_DIR', '/tmp')
+        self._tasks = []  # Background tasks cancelled by stop()
+
+    def build_library_models(self):
+        """Pattern index, sequence templates and transition models from the pattern library.
+
+        The kNN index extracts features for every library pattern and variation
+        (seconds); a trained model version that carries those points
+        (ModelArtifacts.patterns) skips that, and one that carries fitted
+        transition tables (ModelArtifacts.transitions) skips fitting the
+        Markov models. Idempotent; start() runs it.
+        """
+        if self._library_built:
+            return
+        self._library_built = True
+        library = os.getenv('ML_PATTERN_LIBRARY')
+        models = self.intelligence.models
+
+        # kNN over the labelled pattern library and its simulated variations
+        if os.getenv('ML_PATTERN_INDEX', '1') != '0':
+            started = time.perf_counter()
+            k = int(os.getenv('ML_PATTERN_K', '5'))
+            try:
+                if models and models.patterns:
+                    self.intelligence.pattern_index = PatternIndex(*models.patterns, k=k)
+                    source = f"models {models.version}"
+                else:
+                    self.intelligence.pattern_index = PatternIndex.from_library(
+                        library, variations=int(os.getenv('ML_PATTERN_VARIATIONS', '20')), k=k
+                    )
+                    source = 'pattern library'
+                print(f"🗂️ Pattern index: {len(self.intelligence.pattern_index)} labelled patterns "
+                      f"from {source} in {time.perf_counter() - started:.1f}s")
+            except (OSError, ImportError, ValueError) as e:
+                print(f"⚠️ Pattern index disabled: {e}")
+
+        # Ordered matching of each session's event stream against the library sequences
+        if os.getenv('ML_SEQUENCE_MATCH', '1') != '0':
+            try:
+                self.intelligence.sequence_matcher = SequenceMatcher.from_library(
+                    library,
+                    variations=int(os.getenv('ML_SEQUENCE_VARIATIONS', '0')),
+                    min_similarity=float(os.getenv('ML_SEQUENCE_MIN_SIMILARITY', '0.6'))
+                )
+            except (OSError, ImportError, ValueError) as e:
+                print(f"⚠️ Sequence matching disabled: {e}")
+
+        # Per-emotion Markov models of event order, updated incrementally per session
+        if os.getenv('ML_TRANSITION_MODEL', '1') != '0':
+            decay = float(os.getenv('ML_TRANSITION_DECAY', '0.8'))
+            threshold = float(os.getenv('ML_TRANSITION_THRESHOLD', '0.85'))
+            try:
+                if models and models.transitions:
+                    self.intelligence.transition_model = TransitionModel(
+                        *models.transitions, decay=decay, threshold=threshold
+                    )
+                else:
+                    self.intelligence.transition_model = TransitionModel.from_library(
+                        library, variations=int(os.getenv('ML_TRANSITION_VARIATIONS', '20')),
+                        decay=decay, threshold=threshold
+                    )
+            except (OSError, ImportError, ValueError) as e:
+                print(f"⚠️ Transition models disabled: {e}")
 
-    async def start(self):
-        """Start the ML emotion service"""
+    async def start(self, nc=None):
+        """Start the ML emotion service (optionally on an existing connection)"""
         print("🧠 Starting ML Emotion Service...")
         print("📚 Learning from behavioral patterns...")
         print(f"⚡ Debounce: {self.process_debounce}s per session")
-        print(f"📊 Publish threshold: 15% confidence delta")
+        print(f"📊 Publish policy: {len(self.publish_policy.emotions)} emotions, hysteresis + dwell + rate limits")
+        if self.hierarchical_subjects:
+            mirror = f" + {EMOTIONS_SUBJECT} mirror" if self.legacy_subject else ""
+            print(f"📮 Publishing to {EMOTIONS_SUBJECT}.<tenant>.<emotion> ({self.payload_format}){mirror}")
+
+        # Library models before any telemetry, but off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.build_library_models)
 
         # Connect to NATS
-        self.nc = await nats.connect("nats://localhost:4222")
+        self.nc = nc or await nats.connect("nats://localhost:4222")
         print("✅ Connected to NATS")
 
+        # Control plane and metrics
+        await self.nc.subscribe(f"{CONTROL_SUBJECT}.>", cb=self.handle_control)
+        await self.nc.subscribe(SCORE_SUBJECT, cb=self.handle_batch_score)
+        self._tasks.append(asyncio.ensure_future(self._publish_metrics_loop()))
+        self._tasks.append(asyncio.ensure_future(self._scoring_loop()))
+        self._tasks.append(asyncio.ensure_future(self._deferred_scoring_loop()))
+        self._tasks.append(asyncio.ensure_future(self._overload_loop()))
+        self._tasks.append(asyncio.ensure_future(self._evict_idle_sessions_loop()))
+        self._tasks.append(asyncio.ensure_future(self._snapshot_loop()))
+        if self.checkpoint_path and self.checkpoint_interval > 0:
+            self._tasks.append(asyncio.ensure_future(self._checkpoint_loop()))
+        if self.rules_file and self.rules_poll > 0:
+            self._tasks.append(asyncio.ensure_future(self._rules_watch_loop()))
+        if self.sketch_interval > 0:
+            self.sketch_started = self.clock()
+            self._tasks.append(asyncio.ensure_future(self._sketch_loop()))
+        if self.publish_interval > 0:
+            self._tasks.append(asyncio.ensure_future(self._publish_loop()))
+        if self.watchdog:
+            self.watchdog.start()
+            print(f"🐕 Loop watchdog: {self.watchdog.threshold * 1000:.0f}ms stall threshold")
+        if self.ingest_server:
+            await self.ingest_server.start()
+            self._tasks.append(asyncio.ensure_future(self._ingest_loop()))
+            print(f"🌐 Ingest server: http://{self.ingest_server.host}:{self.ingest_server.port}/api/telemetry, "
+                  f"ws://{self.ingest_server.host}:{self.ingest_server.port}/ws")
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR2, self._toggle_profiling)
+        except (NotImplementedError, AttributeError, RuntimeError):
+            pass  # No signal support on this platform - NATS control only
+
         # Subscribe to telemetry events
-        sub = await self.nc.subscribe("TELEMETRY.events")
+        sub = await self.nc.subscribe(TELEMETRY_SUBJECT)
         print("📡 Listening for telemetry events...")
 
         # Process events
         async for msg in sub.messages:
+            started = time.perf_counter()
             try:
                 await self.process_message(msg)
             except Exception as e:
                 print(f"❌ Error processing message: {e}")
+            self.metrics.observe('message_handling', time.perf_counter() - started)
+            await asyncio.sleep(0)  # Let the scoring worker run between messages
+
+    async def _ingest_loop(self):
+        """Feed batches from the built-in ingest server through the normal telemetry path"""
+        while True:
+            events = await self.ingest_queue.get()
+            started = time.perf_counter()
+            await self.process_payload({'events': events})
+            self.metrics.observe('message_handling', time.perf_counter() - started)
+            await asyncio.sleep(0)  # Let the scoring worker run between batches
+
+    def _observe_load(self, scoring_time: float, backlog: int):
+        """Feed one scoring time to the overload controller"""
+        self.metrics.observe('session_scoring', scoring_time)
+        self.overload.record(scoring_time)
+        self._evaluate_load(backlog)
+
+    def _evaluate_load(self, backlog: int):
+        """Re-evaluate the overload tier and export it"""
+        if self.overload.evaluate(backlog, self.clock()):
+            tier = self.overload.tier
+            self.metrics.set('overload_tier', tier)
+            self.metrics.inc('overload_tier_changes')
+            print(f"🚦 Overload tier {tier} ({self.overload.TIERS[tier]}) - "
+                  f"queue delay {self.overload.queue_delay * 1000:.0f}ms")
+
+    async def stop(self):
+        """Cancel background tasks (the subscription loop ends with the connection)"""
+        await self.flush_emotions()
+        if self.checkpoint_path:
+            self.save_checkpoint(self.checkpoint_path)
+        if self.ingest_server:
+            await self.ingest_server.stop()
+        self.batch_scorer.close()
+        if self.watchdog:
+            self.watchdog.stop()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
 
     async def process_message(self, msg):
         """Process incoming telemetry message"""
         try:
             data = json.loads(msg.data.decode())
+        except Exception as e:
+            print(f"❌ Processing error: {e}")
+            return
+        await self.process_payload(data)
 
+    async def process_payload(self, data: Dict):
+        """Buffer one telemetry event or {events: [...]} envelope and queue sessions for scoring"""
+        try:
             # Handle batch or single event
             events = data.get('events', [data])
 
@@ -806,127 +1730,730 @@ class MLEmotionService:
                     print(f"📥 {session_id[-4:]}: {event_types}")
 
             for event in events:
-                session_id = event.get('sessionId')
+                session_id = event.get('sessionId') or data.get('sessionId')
                 if not session_id:
                     continue
+                tenant_id = event.get('tenantId') or data.get('tenantId') or DEFAULT_TENANT
+
+                # Drop client retries / resends before they touch any counters. The
+                # key is only recorded once the event is buffered, so a retry of an
+                # event rejected by a quota or the watermark still gets through.
+                digest = event_fingerprint(event)
+                if self.dedup and self.dedup.seen_recently(digest, self.clock()):
+                    self.metrics.inc('duplicate_events')
+                    continue
+
+                # Enforce per-tenant quotas before buffering
+                tenant_id = self._admit_event(session_id, tenant_id)
+                if tenant_id is None:
+                    continue
+                if self.sketch_interval > 0:
+                    self._tenant_sketches(tenant_id).observe_event(session_id, event.get('type'))
+
+                # Buffer events in event-time order
+                arrival = self.clock()
+                window = self.event_buffer.get(session_id)
+                if window is None:
+                    window = self.event_buffer[session_id] = EventTimeWindow(
+                        self.window_span, self.allowed_lateness, self.max_buffer_size
+                    )
+                event_time = parse_event_time(event.get('timestamp'), arrival)
+                out_of_order = window.max_event_time is not None and event_time < window.max_event_time
+
+                accepted, evicted = window.add(event, event_time, digest, ingest_time=arrival)
+                self.tenant_buffered[tenant_id] -= evicted
+                if not accepted:
+                    self.metrics.inc('late_events_dropped')
+                    continue
+                self.tenant_buffered[tenant_id] += 1
+                if self.dedup:
+                    self.dedup.add(digest, arrival)
+                self.last_event_time[session_id] = arrival
+                matcher = self.intelligence.sequence_matcher
+                if matcher:
+                    state = self.sequence_states.get(session_id)
+                    if state is None:
+                        state = self.sequence_states[session_id] = matcher.new_state()
+                    if out_of_order:
+                        state.stale = True  # Rebuilt from the window at the next score
+                    else:
+                        matcher.push(state, matcher.code(event))
+                model = self.intelligence.transition_model
+                if model:
+                    state = self.transition_states.get(session_id)
+                    if state is None:
+                        state = self.transition_states[session_id] = model.new_state()
+                    if out_of_order:
+                        state.stale = True
+                    else:
+                        model.update(state, model.code(event))
+                if out_of_order:
+                    # Slotted into place. It may be the session's last event, so a
+                    # debounced session is handed to the deferred-scoring loop
+                    # rather than waiting for an event that never comes
+                    self.metrics.inc('reordered_events')
+                    if not self._schedule_session(session_id, tenant_id, arrival):
+                        self.deferred_sessions[session_id] = tenant_id
+                    continue
+                self._schedule_session(session_id, tenant_id, arrival)
 
-                # Buffer events
-                self.event_buffer[session_id].append(event)
+        except Exception as e:
+            print(f"❌ Processing error: {e}")
 
-                # Trim buffer
-                if len(self.event_buffer[session_id]) > self.max_buffer_size:
-                    self.event_buffer[session_id] = self.event_buffer[session_id][-self.max_buffer_size:]
+    def _schedule_session(self, session_id: str, tenant_id: str, now: float) -> bool:
+        """Queue a session for scoring if it has enough events and is past its debounce.
 
-                # Check debounce - don't process too frequently
-                current_time = time.time()
-                last_processed = self.last_process_time[session_id]
-                time_since_last = current_time - last_processed
+        Returns False only when the debounce held it back.
+        """
+        window = self.event_buffer[session_id]
 
-                # Process if we have enough events AND debounce time has passed
-                # Lower threshold for critical events
-                has_critical_events = any(e.get('type') in ['price_proximity', 'mouse_exit', 'viewport_approach', 'tab_switch']
-                                         for e in self.event_buffer[session_id])
-                min_events = 2 if has_critical_events else 3
+        # Process if we have enough events AND debounce time has passed
+        # Lower threshold for critical events
+        has_critical_events = window.has_any(self.CRITICAL_EVENT_TYPES)
+        min_events = 2 if has_critical_events else 3
+        if len(window) < min_events:
+            return True
 
-                if len(self.event_buffer[session_id]) >= min_events and time_since_last >= self.process_debounce:
-                    self.last_process_time[session_id] = current_time
+        # Check debounce - don't process too frequently
+        debounce = self.overload.debounce(self.process_debounce, has_critical_events)
+        if now - self.last_process_time[session_id] < debounce:
+            return False
+        self.last_process_time[session_id] = now
+        self.deferred_sessions.pop(session_id, None)
+
+        if self.overload.should_shed(session_id, has_critical_events, self.last_emotions[session_id]):
+            self.metrics.inc('shed_sessions')
+            return True
+
+        # Queue for scoring - the worker serves tenants fairly
+        self.scheduler.push(tenant_id, session_id)
+        return True
+
+    def schedule_deferred_sessions(self):
+        """Queue debounced sessions whose out-of-order events have not been scored yet"""
+        now = self.clock()
+        for session_id, tenant_id in list(self.deferred_sessions.items()):
+            if session_id not in self.event_buffer or self._schedule_session(session_id, tenant_id, now):
+                self.deferred_sessions.pop(session_id, None)
+
+    async def _deferred_scoring_loop(self):
+        """Re-check deferred sessions often enough to score them soon after their debounce"""
+        while True:
+            await asyncio.sleep(min(self.process_debounce, 1.0))
+            self.schedule_deferred_sessions()
+
+    def _admit_event(self, session_id: str, tenant_id: str) -> Optional[str]:
+        """Apply the tenant's live-session and buffered-event caps.
+
+        Returns the tenant that owns the session, or None if the event is rejected.
+        """
+        known_tenant = self.session_tenant.get(session_id)
+        if known_tenant is None:
+            if len(self.tenant_sessions[tenant_id]) >= self.tenants.max_sessions(tenant_id):
+                self.metrics.inc('tenant_session_rejections')
+                return None
+            self.session_tenant[session_id] = tenant_id
+            self.tenant_sessions[tenant_id].add(session_id)
+        else:
+            tenant_id = known_tenant  # A session belongs to the tenant that opened it
 
-                    result = await self.intelligence.process_session(
-                        session_id,
-                        self.event_buffer[session_id]
-                    )
+        if self.tenant_buffered[tenant_id] >= self.tenants.max_buffered_events(tenant_id):
+            self.metrics.inc('tenant_event_rejections')
+            return None
+        return tenant_id
+
+    async def _scoring_loop(self):
+        """Score queued sessions, picking tenants by weighted fair queuing"""
+        while True:
+            tenant_id, session_id = await self.scheduler.get()
+            self._scoring = True
+            started = time.perf_counter()
+            try:
+                await self.score_session(session_id, tenant_id)
+            except Exception as e:
+                print(f"❌ Scoring error: {e}")
+            finally:
+                self._scoring = False
+            self._observe_load(time.perf_counter() - started, self.scheduler.depth)
+            await asyncio.sleep(0)  # Let ingestion run between scores
+
+    async def _overload_loop(self):
+        """Re-evaluate the overload tier on the clock, so recovery does not need scoring traffic"""
+        while True:
+            await asyncio.sleep(self.overload_interval)
+            self._evaluate_load(self.scheduler.depth)
+
+    async def wait_idle(self):
+        """Wait until no session is queued or being scored, then flush pending publishes"""
+        while self.scheduler.depth or self._scoring:
+            await asyncio.sleep(0)
+        await self.flush_emotions()
+
+    async def score_session(self, session_id: str, tenant_id: str):
+        """Score a session's current buffer and publish meaningful changes"""
+        window = self.event_buffer.get(session_id)
+        if not window:
+            return  # Evicted while queued
+        events = window.events
+
+        has_critical_events = window.has_any(self.CRITICAL_EVENT_TYPES)
+        skip_anomaly = self.overload.skip_anomaly(has_critical_events)
+        skip_clustering = self.overload.skip_clustering(has_critical_events)
+        if skip_anomaly or skip_clustering:
+            self.metrics.inc('degraded_scores')
+
+        evidence = None
+        transitions = self.transition_states.get(session_id)
+        if transitions is not None:
+            model = self.intelligence.transition_model
+            if transitions.stale:
+                model.rebuild(transitions, events)
+            evidence = model.evidence(transitions)
+
+        result = await self.intelligence.process_session(
+            session_id,
+            events,
+            skip_anomaly=skip_anomaly,
+            skip_clustering=skip_clustering,
+            rules=self.tenants.rules_for(tenant_id),
+            fingerprint=window.fingerprint,
+            timestamp=window.max_event_time,
+            tenant_id=tenant_id,
+            sequence_evidence=evidence,
+            rows=window.rows
+        )
+        result['tenant_id'] = tenant_id
+        self._snapshot_dirty.add(session_id)
+        result['event_time'] = window.max_event_time
+        result['ingest_time'] = window.newest_ingest_time
+        self.metrics.inc('sessions_scored')
+        state = self.sequence_states.get(session_id)
+        if state is not None:
+            matcher = self.intelligence.sequence_matcher
+            result['sequence_match'] = matcher.matches(matcher.advance(state, events))
+        if self.sketch_interval > 0:
+            self._tenant_sketches(tenant_id).observe_features(*feature_vector(result['features']))
+
+        # Debug: log key features for price events
+        if any(e.get('type') in ['price_proximity', 'mouse_exit'] for e in events):
+            features = result.get('features', {})
+            print(f"🔬 {session_id[-4:]}: price_prox={features.get('price_proximity_time', 0):.1f}, hover={features.get('price_hover_duration', 0):.1f}, exit={features.get('mouse_exit_after_idle', 0):.1f}")
+
+        # Check if this is a meaningful change before publishing
+        last_emotion = self.last_emotions[session_id]
+        current_emotion = result['dominant_emotion']
+
+        # Publish only meaningful changes (see PublishPolicy)
+        now = self.clock()
+        last_pub = self.last_published.get(session_id)
+        should_publish, reason = self.publish_policy.decide(
+            last_pub, current_emotion, result['confidence'], result['emotion_scores'], now
+        )
 
-                    # Debug: log key features for price events
-                    if any(e.get('type') in ['price_proximity', 'mouse_exit'] for e in self.event_buffer[session_id]):
-                        features = result.get('features', {})
-                        print(f"🔬 {session_id[-4:]}: price_prox={features.get('price_proximity_time', 0):.1f}, hover={features.get('price_hover_duration', 0):.1f}, exit={features.get('mouse_exit_after_idle', 0):.1f}")
-
-                    # Check if this is a meaningful change before publishing
-                    last_emotion = self.last_emotions[session_id]
-                    current_emotion = result['dominant_emotion']
-
-                    # Only publish if emotion changed significantly
-                    should_publish = False
-                    last_pub = self.last_published[session_id]
-
-                    # Check if this is truly a new emotion or confidence change
-                    if current_emotion != last_emotion:
-                        should_publish = True
-                    elif (current_emotion == last_pub.get('emotion') and
-                          abs(result['confidence'] - last_pub.get('confidence', 0)) > 0.10):
-                        should_publish = True  # Significant confidence change (10%+)
-                    elif current_emotion in ['price_shock', 'sticker_shock', 'abandonment_intent', 'frustration', 'confusion'] and result['confidence'] > 0.65:
-                        # Always publish critical emotions with good confidence
-                        should_publish = True
-                    elif current_emotion in ['engagement', 'curiosity'] and last_emotion == 'none':
-                        # Always publish initial positive states
-                        should_publish = True
-
-                    if should_publish:
-                        # Publish ML-enhanced emotion
-                        await self.publish_emotion(result)
-                        self.last_published[session_id] = {
-                            'emotion': current_emotion,
-                            'confidence': result['confidence']
-                        }
-
-                    # Update last emotion ALWAYS to prevent re-detection
-                    if current_emotion != last_emotion:
-                        self.last_emotions[session_id] = current_emotion
-
-                        # Log all meaningful changes
-                        if should_publish and result['confidence'] > 0.50:
-                            # Add emotion details for critical states
-                            details = ""
-                            if current_emotion == 'price_shock':
-                                details = " 💰"
-                            elif current_emotion == 'abandonment_intent':
-                                details = " 🚪"
-                            elif current_emotion == 'frustration':
-                                details = " 😤"
-                            elif current_emotion == 'confusion':
-                                details = " 🤔"
-                            elif current_emotion == 'engagement':
-                                details = " 📖"
-                            elif current_emotion == 'comparison_shopping':
-                                details = " 🔍"
-                            elif current_emotion == 'skeptical':
-                                details = " 🤨"
-                            elif current_emotion == 'evaluation':
-                                details = " 🧐"
-                            elif current_emotion == 'hesitation':
-                                details = " ⏸️"
-                            elif current_emotion == 'cart_review':
-                                details = " 🛒"
-                            elif current_emotion == 'cart_hesitation':
-                                details = " 🛒❓"
-                            elif current_emotion == 'anxiety':
-                                details = " 😰"
-                            elif current_emotion == 'exit_risk':
-                                details = " 🚨"
-                            elif current_emotion == 'sticker_shock':
-                                details = " 😱💰"
-
-                            print(f"🎯 {session_id[-4:]}: {last_emotion} → {current_emotion}{details} ({result['confidence']*100:.0f}%)")
+        if should_publish:
+            # Publish ML-enhanced emotion
+            self.metrics.observe_latency('event_to_decision', now - result['event_time'], tenant_id, current_emotion)
+            await self.publish_emotion(result)
+            self.last_published[session_id] = self.publish_policy.record(
+                last_pub, current_emotion, result['confidence'], now
+            )
+        else:
+            self.metrics.inc(f'publish_suppressed_{reason}')
+
+        # Update last emotion ALWAYS to prevent re-detection
+        if current_emotion != last_emotion:
+            self.last_emotions[session_id] = current_emotion
+
+            # Log all meaningful changes
+            if should_publish and result['confidence'] > 0.50:
+                # Add emotion details for critical states
+                details = ""
+                if current_emotion == 'price_shock':
+                    details = " 💰"
+                elif current_emotion == 'abandonment_intent':
+                    details = " 🚪"
+                elif current_emotion == 'frustration':
+                    details = " 😤"
+                elif current_emotion == 'confusion':
+                    details = " 🤔"
+                elif current_emotion == 'engagement':
+                    details = " 📖"
+                elif current_emotion == 'comparison_shopping':
+                    details = " 🔍"
+                elif current_emotion == 'skeptical':
+                    details = " 🤨"
+                elif current_emotion == 'evaluation':
+                    details = " 🧐"
+                elif current_emotion == 'hesitation':
+                    details = " ⏸️"
+                elif current_emotion == 'cart_review':
+                    details = " 🛒"
+                elif current_emotion == 'cart_hesitation':
+                    details = " 🛒❓"
+                elif current_emotion == 'anxiety':
+                    details = " 😰"
+                elif current_emotion == 'exit_risk':
+                    details = " 🚨"
+                elif current_emotion == 'sticker_shock':
+                    details = " 😱💰"
+
+                print(f"🎯 {session_id[-4:]}: {last_emotion} → {current_emotion}{details} ({result['confidence']*100:.0f}%)")
+
+    def _tenant_report(self) -> Dict:
+        queued = self.scheduler.report()
+        return {
+            tenant_id: {
+                'sessions': len(sessions),
+                'buffered_events': self.tenant_buffered[tenant_id],
+                'weight': self.tenants.weight(tenant_id),
+                **queued.get(tenant_id, {}),
+            }
+            for tenant_id, sessions in self.tenant_sessions.items()
+        }
 
-        except Exception as e:
-            print(f"❌ Processing error: {e}")
+    async def _evict_idle_sessions_loop(self):
+        """Drop sessions that have been quiet for longer than session_ttl"""
+        while True:
+            await asyncio.sleep(min(self.session_ttl, 60.0))
+            cutoff = self.clock() - self.session_ttl
+            idle = [sid for sid, last in self.last_event_time.items() if last < cutoff]
+            for session_id in idle:
+                self.evict_session(session_id)
+            if idle:
+                self.metrics.inc('sessions_evicted', len(idle))
+
+    def evict_session(self, session_id: str):
+        """Forget all per-session state and release the tenant's quota"""
+        tenant_id = self.session_tenant.pop(session_id, None)
+        buffer = self.event_buffer.pop(session_id, ())
+        if tenant_id is not None:
+            self.tenant_sessions[tenant_id].discard(session_id)
+            self.tenant_buffered[tenant_id] -= len(buffer)
+        for state in (self.last_event_time, self.last_process_time, self.last_emotions, self.last_published,
+                      self.sequence_states, self.transition_states, self.deferred_sessions):
+            state.pop(session_id, None)
+        self.intelligence.sessions.pop(session_id, None)
+        self._snapshot_dirty.add(session_id)
 
     async def publish_emotion(self, result: Dict):
-        """Publish ML-detected emotion to NATS"""
-        emotion_event = {
-            'sessionId': result['session_id'],
+        """Queue an ML-detected emotion for the next flush (latest result per session wins)"""
+        if self.publish_interval <= 0:
+            await self._publish_batch([result])
+            return
+        session_id = result['session_id']
+        if session_id in self._outbox:
+            self.metrics.inc('publishes_coalesced')
+        self._outbox[session_id] = result
+        self._outbox_ready.set()
+
+    async def _publish_loop(self):
+        """Flush the outbox at most publish_interval after its first entry"""
+        while True:
+            await self._outbox_ready.wait()
+            await asyncio.sleep(self.publish_interval)
+            await self.flush_emotions()
+
+    async def flush_emotions(self):
+        """Publish everything in the outbox with one connection flush"""
+        self._outbox_ready.clear()
+        if not self._outbox:
+            return
+        batch = list(self._outbox.values())
+        self._outbox = {}
+        started = time.perf_counter()
+        await self._publish_batch(batch)
+        try:
+            await self.nc.flush()
+        except Exception as e:
+            print(f"⚠️ Publish flush failed: {e}")
+        self.metrics.inc('publish_flushes')
+        self.metrics.observe('publish_flush', time.perf_counter() - started)
+
+    async def _publish_batch(self, results: List[Dict]):
+        """Publish ML-detected emotions to NATS (one clock read per batch)"""
+        now = self.clock()
+        timestamp = datetime.fromtimestamp(now).isoformat()
+        for result in results:
+            event_time, ingest_time = result.get('event_time'), result.get('ingest_time')
+            emotion_event = {
+                'sessionId': result['session_id'],
+                'tenantId': result.get('tenant_id'),
+                'emotion': result['dominant_emotion'],
+                'confidence': result['confidence'] * 100,  # Convert to percentage
+                'ml_scores': result['emotion_scores'],
+                'is_anomaly': result['is_anomaly'],
+                'behavior_cluster': result['behavior_cluster'],
+                'interventions': result['recommendations'],
+                'pattern_match': result.get('pattern_match'),  # kNN vote of labelled library patterns
+                'classifier': result.get('classifier'),  # Offline-trained classifier (ML_MODEL_DIR)
+                'sequence_match': result.get('sequence_match'),  # Library sequences matched in order
+                'source': 'ml',
+                'timestamp': timestamp,
+                'eventTime': _isoformat(event_time),    # Newest contributing event (client clock)
+                'ingestTime': _isoformat(ingest_time),  # When that event reached the service
+            }
+
+            encoded = None
+            if self.hierarchical_subjects:
+                if self.payload_format == 'binary':
+                    payload = encode_emotion_payload(emotion_event, self.emotion_codes, now, event_time, ingest_time)
+                else:
+                    payload = encoded = json.dumps(emotion_event).encode()
+                await self.nc.publish(self.emotion_subject(result.get('tenant_id'), result['dominant_emotion']), payload)
+            if self.legacy_subject or not self.hierarchical_subjects:
+                await self.nc.publish(EMOTIONS_SUBJECT, encoded or json.dumps(emotion_event).encode())
+            if ingest_time is not None:
+                self.metrics.observe_latency('ingest_to_publish', now - ingest_time,
+                                             result.get('tenant_id'), result['dominant_emotion'])
+        self.metrics.inc('emotions_published', len(results))
+
+    @staticmethod
+    def emotion_subject(tenant_id: Optional[str], emotion: str) -> str:
+        """EMOTIONS.state.<tenant>.<emotion> - consumers filter with wildcards server-side"""
+        return f"{EMOTIONS_SUBJECT}.{subject_token(tenant_id or DEFAULT_TENANT)}.{subject_token(emotion)}"
+
+    async def score_batch(self, request: Dict):
+        """Score complete sessions without touching live state; yields reply chunks.
+
+        Request: {"sessions": [{"session_id", "events", "tenant_id"?}, ...],
+                  "chunk_size": 1000, "window": true}
+        With "window" (default) each session is trimmed to the window live
+        scoring would have seen at its end. Yields {"chunk", "results"} per
+        chunk and a final {"done": true, ...} summary.
+
+        A request travels as one message, so its transport bounds it: NATS
+        max_payload (1 MiB by default) or the ingest server's 10 MiB body
+        limit - at ~10 KB of JSON per 30-event session, roughly 100 or 1,000
+        sessions. Extraction is one columnar pass per chunk, several thousand
+        30-event sessions/s per ML_BATCH_WORKERS process (sessions that fall
+        back to pandas run at about 100-150/s), so large backfills are many
+        requests bounded by transport, not extraction.
+        """
+        sessions = request.get('sessions') or []
+        span = self.window_span if request.get('window', True) else None
+        started = time.perf_counter()
+        scored = errors = 0
+        chunk_index = 0
+        async for results in self.batch_scorer.score(sessions, self.tenants.rules_for,
+                                                     chunk_size=max(int(request.get('chunk_size', 1000)), 1),
+                                                     span=span):
+            failed = sum(1 for r in results if 'error' in r)
+            scored += len(results) - failed
+            errors += failed
+            yield {'chunk': chunk_index, 'results': results}
+            chunk_index += 1
+            await asyncio.sleep(0)  # Keep the live loop responsive between chunks
+        elapsed = time.perf_counter() - started
+        self.metrics.inc('batch_sessions_scored', scored)
+        self.metrics.observe('batch_request', elapsed)
+        yield {'done': True, 'sessions': len(sessions), 'scored': scored, 'errors': errors,
+               'chunks': chunk_index, 'elapsed_ms': elapsed * 1000}
+
+    async def handle_batch_score(self, msg):
+        """ML.score.batch: stream result chunks to the reply inbox, ending with {"done": true}
+
+        A chunk whose encoding exceeds the connection's max_payload is sent
+        as several messages with the same "chunk" index.
+        """
+        if not msg.reply:
+            return
+        limit = getattr(self.nc, 'max_payload', None) or NATS_MAX_PAYLOAD
+        try:
+            request = json.loads(msg.data.decode())
+            async for reply in self.score_batch(request):
+                for data in split_reply(reply, limit):
+                    await self.nc.publish(msg.reply, data)
+        except Exception as e:
+            await self.nc.publish(msg.reply, json.dumps({'done': True, 'error': str(e)}).encode())
+        await self.nc.flush()
+
+    async def handle_control(self, msg):
+        """Dispatch ML.control.<command> requests and reply with JSON"""
+        command = msg.subject.rsplit('.', 1)[-1]
+        handler = self.control_handlers.get(command)
+        try:
+            payload = json.loads(msg.data.decode()) if msg.data else {}
+            if handler is None:
+                reply = {'error': f'unknown command: {command}', 'commands': sorted(self.control_handlers)}
+            else:
+                reply = handler(payload)
+                if asyncio.iscoroutine(reply):
+                    reply = await reply
+        except Exception as e:
+            reply = {'error': str(e)}
+
+        if msg.reply:
+            await msg.respond(json.dumps(reply, default=str).encode())
+
+    def save_checkpoint(self, path: str):
+        """Write the learned model state atomically (npz, no pickles)"""
+        try:
+            with open(f"{path}.tmp", 'wb') as f:
+                np.savez(f, **self.intelligence.checkpoint_state())
+            os.replace(f"{path}.tmp", path)
+            self.metrics.inc('checkpoints_saved')
+        except OSError as e:
+            print(f"⚠️ Checkpoint save failed: {e}")
+
+    def load_checkpoint(self, path: str):
+        try:
+            with np.load(path, allow_pickle=False) as state:
+                self.intelligence.restore_state(dict(state))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Ignoring checkpoint {path}: {e}")
+            return
+        print(f"💾 Restored model state for {len(self.intelligence.normalizers)} tenants from {path}")
+
+    async def _checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            self.save_checkpoint(self.checkpoint_path)
+
+    def apply_rules(self, spec: Dict, source: str) -> Dict:
+        """Install tuned rules ({"rules": ..., "weights": ...}) and recompile every tenant's rule set"""
+        self.intelligence.set_tuned_rules(spec.get('rules'), spec.get('weights'))
+        self.tenants.invalidate()
+        self.rules_info = {
+            'source': source,
+            'version': spec.get('version'),
+            'emotions': sorted(set(spec.get('rules') or {}) | set(spec.get('weights') or {})),
+            'loaded_at': self.clock(),
+        }
+        self.metrics.inc('rules_reloaded')
+        version = f" {spec['version']}" if spec.get('version') else ''
+        print(f"🎚️ Tuned rules{version} from {source}: {', '.join(self.rules_info['emotions']) or 'none'}")
+        return self.rules_info
+
+    def reload_rules_file(self) -> Optional[Dict]:
+        """Load ML_RULES_FILE; a bad file keeps the current rules"""
+        try:
+            mtime = os.stat(self.rules_file).st_mtime
+            with open(self.rules_file) as f:
+                spec = json.load(f)
+            self._rules_mtime = mtime
+            return self.apply_rules(spec, self.rules_file)
+        except (OSError, ValueError, TypeError) as e:
+            print(f"⚠️ Keeping current rules, {self.rules_file} not loaded: {e}")
+            return None
+
+    async def _rules_watch_loop(self):
+        while True:
+            await asyncio.sleep(self.rules_poll)
+            try:
+                mtime = os.stat(self.rules_file).st_mtime
+            except OSError:
+                continue
+            if mtime != self._rules_mtime:
+                self._rules_mtime = mtime  # Don't retry a broken file until it changes again
+                self.reload_rules_file()
+
+    def _control_rules(self, payload: Dict) -> Dict:
+        """Current tuned rules; {"rules": ..., "weights": ...} installs new ones, {"reload": true} re-reads ML_RULES_FILE"""
+        if payload.get('rules') is not None or payload.get('weights') is not None:
+            return self.apply_rules(payload, 'control')
+        if payload.get('reload'):
+            if not self.rules_file:
+                return {'error': 'ML_RULES_FILE is not set'}
+            return self.reload_rules_file() or {'error': f'could not load {self.rules_file}'}
+        return dict(self.rules_info, rules=self.intelligence.tuned_rules, weights=self.intelligence.tuned_weights)
+
+    def _tenant_sketches(self, tenant_id: str) -> TrafficSketches:
+        sketches = self.sketches.get(tenant_id)
+        if sketches is None:
+            sketches = self.sketches[tenant_id] = TrafficSketches(FEATURE_SCHEMA)
+        return sketches
+
+    async def _sketch_loop(self):
+        """Close a sketch interval every sketch_interval and publish it per tenant"""
+        while True:
+            await asyncio.sleep(self.sketch_interval)
+            try:
+                await self.publish_sketches()
+            except Exception as e:
+                print(f"⚠️ Sketch snapshot failed: {e}")
+
+    async def publish_sketches(self) -> Dict[str, Dict]:
+        """Snapshot every tenant's sketches to ML.sketches.<tenant> and start a new interval"""
+        now = self.clock()
+        started, self.sketch_started = self.sketch_started or now, now
+        for tenant_id, sketches in self.sketches.items():
+            snapshot = sketches.snapshot(started, now)
+            snapshot['tenantId'] = tenant_id
+            self.sketch_snapshots[tenant_id] = snapshot
+            drifted = {name: d for name, d in snapshot['drift'].items() if d >= self.drift_threshold}
+            if drifted:
+                self.metrics.inc('feature_drift_alerts', len(drifted))
+                worst = max(drifted, key=drifted.get)
+                print(f"📉 Feature drift for {tenant_id}: {len(drifted)} features, worst {worst} (KS {drifted[worst]:.2f})")
+            await self.nc.publish(f"{SKETCH_SUBJECT}.{subject_token(tenant_id)}", json.dumps(snapshot).encode())
+        return self.sketch_snapshots
+
+    def _sketch_report(self) -> Dict:
+        return {
+            'tenants': len(self.sketches),
+            'memory_bytes': sum(s.memory_bytes for s in self.sketches.values()),
+            'interval_s': self.sketch_interval,
+            'drifting_features': {
+                tenant_id: sorted(name for name, d in snapshot['drift'].items() if d >= self.drift_threshold)
+                for tenant_id, snapshot in self.sketch_snapshots.items()
+            },
+        }
+
+    def _control_sketches(self, payload: Dict) -> Dict:
+        """Last closed interval per tenant, or {"tenant": id, "live": true} for the open one"""
+        tenant_id = payload.get('tenant')
+        if payload.get('live'):
+            sketches = self.sketches.get(tenant_id)
+            if sketches is None:
+                return {'error': f'unknown tenant: {tenant_id}'}
+            return {
+                'scored': sketches.scored,
+                'events': sketches.event_types.total,
+                'active_sessions': round(sketches.sessions.count()),
+                'event_types': sketches.event_types.heavy_hitters(),
+                'features': sketches.summary(sketches.features),
+                'baseline': sketches.summary(sketches.baseline),
+            }
+        if tenant_id is not None:
+            return self.sketch_snapshots.get(tenant_id) or {'error': f'no snapshot for tenant: {tenant_id}'}
+        return {'interval_s': self.sketch_interval, 'tenants': self.sketch_snapshots}
+
+    def _control_watchdog(self, payload: Dict) -> Dict:
+        """Report loop lag and blocking call sites; {"reset": true} clears them"""
+        if not self.watchdog:
+            return {'enabled': False}
+        report = self.watchdog.report(top=int(payload.get('top', 10)))
+        if payload.get('reset'):
+            self.watchdog.reset()
+        return report
+
+    def _control_schema(self, payload: Dict) -> Dict:
+        """Emotion codes and subject layout consumers need to decode EMOTIONS.state"""
+        return {
+            'emotions': list(self.intelligence.compiled_rules.emotions),
+            'features': list(FEATURE_SCHEMA),
+            'payload_version': EMOTION_PAYLOAD_VERSION,
+            'payload_format': self.payload_format,
+            'subjects': {
+                'hierarchical': f"{EMOTIONS_SUBJECT}.<tenant>.<emotion>" if self.hierarchical_subjects else None,
+                'legacy': EMOTIONS_SUBJECT if self.legacy_subject or not self.hierarchical_subjects else None,
+            },
+        }
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            self.refresh_snapshot()
+
+    def refresh_snapshot(self):
+        """Swap in a new read snapshot (only sessions scored or evicted since the last one are rebuilt)"""
+        previous = self.state_snapshot
+        sessions = dict(previous.sessions)
+        dirty, self._snapshot_dirty = self._snapshot_dirty, set()
+        for session_id in dirty:
+            entry = self._snapshot_entry(session_id, previous.sessions.get(session_id))
+            if entry is None:
+                sessions.pop(session_id, None)
+            else:
+                sessions[session_id] = entry
+        self.state_snapshot = SessionStateSnapshot(self.clock(), previous.emotions, sessions)
+
+    def _snapshot_entry(self, session_id: str, previous: Optional[Tuple]) -> Optional[Tuple]:
+        session = self.intelligence.sessions.get(session_id)
+        result = session and session['memo'].get('result')
+        if not result:
+            return None
+        published = self.last_published.get(session_id)
+        state = {
+            'session_id': session_id,
+            'tenant_id': self.session_tenant.get(session_id, result.get('tenant_id')),
             'emotion': result['dominant_emotion'],
-            'confidence': result['confidence'] * 100,  # Convert to percentage
-            'ml_scores': result['emotion_scores'],
+            'confidence': result['confidence'],
+            'emotion_scores': dict(result['emotion_scores']),
+            'recommendations': list(result['recommendations']),
             'is_anomaly': result['is_anomaly'],
-            'behavior_cluster': result['behavior_cluster'],
-            'interventions': result['recommendations'],
-            'source': 'ml',
-            'timestamp': datetime.now().isoformat()
+            'event_time': _isoformat(result.get('event_time')),
+            'published_emotion': self.publish_policy.emotions[published[0]] if published else None,
+            'published_at': _isoformat(published[3]) if published else None,
         }
-
-        await self.nc.publish('EMOTIONS.state', json.dumps(emotion_event).encode())
+        timeline = session['emotion_history']
+        if previous is not None and previous[1] == timeline.version:
+            arrays = previous[2]  # Unchanged timeline: share the old copies
+        else:
+            arrays = timeline.arrays()
+        return state, timeline.version, arrays
+
+    def query_session(self, session_id: str, timeline: bool = True, limit: Optional[int] = None) -> Optional[Dict]:
+        """Current state (and timeline) of one session from the read snapshot"""
+        snapshot = self.state_snapshot
+        reply = snapshot.session(session_id, timeline=timeline, limit=limit)
+        if reply is not None:
+            reply['snapshot_at'] = _isoformat(snapshot.created_at)
+            if timeline:
+                reply['timeline']['emotions'] = list(snapshot.emotions)
+        return reply
+
+    def _control_session(self, payload: Dict) -> Dict:
+        """{"session_id": ..., "timeline": true, "limit": 50} -> current state + compact timeline"""
+        session_id = payload.get('session_id')
+        if not session_id:
+            return {'error': 'session_id required'}
+        limit = payload.get('limit')
+        reply = self.query_session(session_id, bool(payload.get('timeline', True)), int(limit) if limit else None)
+        return reply if reply is not None else {'error': f'unknown session: {session_id}'}
+
+    def _control_sessions(self, payload: Dict) -> Dict:
+        """Current states filtered by {"tenant_id", "emotion"}, at most "limit" (100)"""
+        snapshot = self.state_snapshot
+        sessions = snapshot.search(payload.get('tenant_id'), payload.get('emotion'), int(payload.get('limit', 100)))
+        return {'snapshot_at': _isoformat(snapshot.created_at), 'total': len(snapshot.sessions), 'sessions': sessions}
+
+    def _control_profile(self, payload: Dict) -> Dict:
+        """Profiling control: {"action": "start"|"stop"|"report"|"dump"|"reset", "sample_every": N}"""
+        profiler = self.intelligence.profiler
+        action = payload.get('action', 'report')
+
+        if action == 'start':
+            profiler.start(payload.get('sample_every'))
+            print(f"🔬 Profiling on - sampling 1 in {profiler.sample_every} scoring calls")
+        elif action == 'stop':
+            profiler.stop()
+            print("🔬 Profiling off")
+        elif action == 'reset':
+            profiler.reset()
+        elif action == 'dump':
+            return {'files': profiler.dump(payload.get('directory', self.profile_dir))}
+        elif action != 'report':
+            return {'error': f'unknown action: {action}'}
+
+        return profiler.report(top=int(payload.get('top', 20)))
+
+    def _toggle_profiling(self):
+        """SIGUSR2: start profiling, or stop and dump the report"""
+        profiler = self.intelligence.profiler
+        if profiler.enabled:
+            profiler.stop()
+            files = profiler.dump(self.profile_dir)
+            print(f"🔬 Profiling off - report written to {', '.join(files.values())}")
+        else:
+            profiler.start()
+            print(f"🔬 Profiling on - sampling 1 in {profiler.sample_every} scoring calls")
+
+    async def _publish_metrics_loop(self):
+        """Periodically publish a metrics snapshot on ML.metrics"""
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            try:
+                snapshot = self.metrics.snapshot()
+                await self.nc.publish(METRICS_SUBJECT, json.dumps(snapshot, default=str).encode())
+
+                if self.watchdog and self.watchdog.stall_count:
+                    lag = snapshot['watchdog']['lag_ms']
+                    top = snapshot['watchdog']['top_blocking'][:1]
+                    print(f"🐕 Loop lag p99={lag['p99']:.0f}ms max={lag['max']:.0f}ms"
+                          + (f" - top blocker: {top[0]['site']}" if top else ""))
+            except Exception as e:
+                print(f"❌ Metrics publish error: {e}")
 
 
 async def main():
@@ -0,0 +1,7 @@
+"""
+ML Emotion Service Components
+
+Parts of emotion-ml-service.py that stand on their own. The service script
+is hyphenated and loaded by path, so these live in an importable package;
+the service re-exports everything it uses from here.
+"""
@@ -0,0 +1,173 @@
+"""
+Model Artifacts
+
+Versioned directories of offline-trained models (train-emotion-models.py)
+and the read side the service loads at startup.
+"""
+
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+from sklearn.ensemble import IsolationForest, RandomForestClassifier
+from sklearn.neighbors import BallTree
+
+from emotion_ml.features import EXTRACTOR_VERSION, FEATURE_SCHEMA
+from emotion_ml.normalization import OnlineNormalizer
+
+
+class ModelArtifacts:
+    """Offline-trained models (train-emotion-models.py), loaded at startup.
+
+    A version directory holds manifest.json, the fitted IsolationForest and
+    RandomForestClassifier (joblib; their arrays are memory-mapped on load,
+    so workers sharing a version share the pages) and the DBSCAN core
+    points with their cluster labels (.npy). DBSCAN has no predict: a
+    session joins the cluster of its nearest core point within eps, the way
+    DBSCAN labels a border point, or -1 (noise). The root's LATEST file
+    names the current version.
+
+    The models were fit on vectors z-scored against the whole training set,
+    so that baseline is saved with them (normalizer.npy) and frozen: every
+    input goes through prepare(), never a tenant's running normalizer.
+    Versions may also carry the pattern library's feature points
+    (PatternIndex.library_points) and fitted transition tables
+    (TransitionModel: vocab, emotions, table), so the service builds its
+    kNN index and Markov models without fitting them at startup.
+    """
+
+    FORMAT = 2
+
+    def __init__(self, path: str, manifest: Dict, anomaly: IsolationForest, classifier: RandomForestClassifier,
+                 core_points: np.ndarray, core_labels: np.ndarray, normalizer: OnlineNormalizer,
+                 patterns: Optional[Tuple[np.ndarray, np.ndarray, List[str], List[str]]] = None,
+                 transitions: Optional[Tuple[Dict[str, int], Tuple[str, ...], np.ndarray]] = None):
+        self.path = path
+        self.manifest = manifest
+        self.version = manifest['version']
+        self.normalizer = normalizer
+        self.patterns = patterns
+        self.transitions = transitions
+        self.anomaly = anomaly
+        self.classifier = classifier
+        self.eps = manifest['params']['eps']
+        self.core_labels = core_labels
+        self.core_tree = BallTree(core_points) if len(core_points) else None
+        self.loaded_at = time.time()
+
+    @classmethod
+    def save(cls, root: str, manifest: Dict, anomaly: IsolationForest, classifier: RandomForestClassifier,
+             core_points: np.ndarray, core_labels: np.ndarray, normalizer: OnlineNormalizer,
+             patterns: Optional[Tuple[np.ndarray, np.ndarray, List[str], List[str]]] = None,
+             transitions: Optional[Tuple[Dict[str, int], Tuple[str, ...], np.ndarray]] = None) -> str:
+        """Write a version directory atomically (replacing an existing one) and point LATEST at it"""
+        path = os.path.join(root, manifest['version'])
+        staging = f"{path}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)  # Leftovers of an interrupted save
+        os.makedirs(staging)
+        joblib.dump(anomaly, os.path.join(staging, 'anomaly.joblib'))
+        joblib.dump(classifier, os.path.join(staging, 'classifier.joblib'))
+        np.save(os.path.join(staging, 'core_points.npy'), core_points)
+        np.save(os.path.join(staging, 'core_labels.npy'), core_labels)
+        np.save(os.path.join(staging, 'normalizer.npy'), normalizer.state())
+        if patterns is not None:
+            values, present, emotions, names = patterns
+            np.save(os.path.join(staging, 'pattern_values.npy'), values)
+            np.save(os.path.join(staging, 'pattern_present.npy'), present)
+            with open(os.path.join(staging, 'patterns.json'), 'w') as f:
+                json.dump({'emotions': list(emotions), 'names': list(names)}, f)
+        if transitions is not None:
+            vocab, emotions, table = transitions
+            np.save(os.path.join(staging, 'transition_table.npy'), table)
+            with open(os.path.join(staging, 'transitions.json'), 'w') as f:
+                json.dump({'tokens': sorted(vocab, key=vocab.get), 'emotions': list(emotions)}, f)
+        with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+            json.dump(dict(manifest, format=cls.FORMAT, schema=list(FEATURE_SCHEMA),
+                           extractor_version=EXTRACTOR_VERSION), f, indent=2)
+        # rename() cannot replace a non-empty directory: move a retrained version aside first
+        retired = None
+        if os.path.exists(path):
+            retired = f"{path}.old-{os.getpid()}"
+            shutil.rmtree(retired, ignore_errors=True)
+            os.rename(path, retired)
+        os.rename(staging, path)
+        if retired:
+            shutil.rmtree(retired, ignore_errors=True)
+        cls.set_latest(root, manifest['version'])
+        return path
+
+    @staticmethod
+    def set_latest(root: str, version: str):
+        with open(os.path.join(root, 'LATEST.tmp'), 'w') as f:
+            f.write(version + '\n')
+        os.replace(os.path.join(root, 'LATEST.tmp'), os.path.join(root, 'LATEST'))
+
+    @classmethod
+    def load(cls, root: str) -> 'ModelArtifacts':
+        """Load a version directory, or the LATEST version under a root"""
+        path = root
+        if not os.path.exists(os.path.join(path, 'manifest.json')):
+            with open(os.path.join(root, 'LATEST')) as f:
+                path = os.path.join(root, f.read().strip())
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != cls.FORMAT:
+            raise ValueError(f"unsupported model format {manifest.get('format')}")
+        if tuple(manifest['schema']) != FEATURE_SCHEMA or manifest['extractor_version'] != EXTRACTOR_VERSION:
+            raise ValueError('models were trained for a different feature schema or extractor version')
+        patterns = None
+        if os.path.exists(os.path.join(path, 'patterns.json')):
+            with open(os.path.join(path, 'patterns.json')) as f:
+                labels = json.load(f)
+            patterns = (np.load(os.path.join(path, 'pattern_values.npy')),
+                        np.load(os.path.join(path, 'pattern_present.npy')),
+                        labels['emotions'], labels['names'])
+        transitions = None
+        if os.path.exists(os.path.join(path, 'transitions.json')):
+            with open(os.path.join(path, 'transitions.json')) as f:
+                labels = json.load(f)
+            transitions = ({token: code for code, token in enumerate(labels['tokens'])}, tuple(labels['emotions']),
+                           np.load(os.path.join(path, 'transition_table.npy')))
+        return cls(
+            path, manifest,
+            joblib.load(os.path.join(path, 'anomaly.joblib'), mmap_mode='r'),
+            joblib.load(os.path.join(path, 'classifier.joblib'), mmap_mode='r'),
+            np.load(os.path.join(path, 'core_points.npy'), mmap_mode='r'),
+            np.load(os.path.join(path, 'core_labels.npy'), mmap_mode='r'),
+            OnlineNormalizer.from_state(np.load(os.path.join(path, 'normalizer.npy'))),
+            patterns,
+            transitions,
+        )
+
+    def prepare(self, values: np.ndarray, present: np.ndarray) -> np.ndarray:
+        """Model input for a raw feature vector: z-scored against the training baseline (a copy)"""
+        return self.normalizer.normalize(np.array(values, dtype=float), present)
+
+    def is_anomaly(self, vector: np.ndarray) -> bool:
+        return bool(self.anomaly.predict(vector.reshape(1, -1))[0] == -1)
+
+    def cluster(self, vector: np.ndarray) -> int:
+        if self.core_tree is None:
+            return -1
+        distance, index = self.core_tree.query(vector.reshape(1, -1), k=1)
+        return int(self.core_labels[index[0, 0]]) if distance[0, 0] <= self.eps else -1
+
+    def classify(self, vector: np.ndarray) -> Dict:
+        """Classifier's emotion for a prepare()d vector, with its vote share"""
+        probabilities = self.classifier.predict_proba(vector.reshape(1, -1))[0]
+        best = int(np.argmax(probabilities))
+        return {'emotion': str(self.classifier.classes_[best]), 'score': round(float(probabilities[best]), 4)}
+
+    def report(self) -> Dict:
+        return {
+            'version': self.version,
+            'path': self.path,
+            'trained_at': self.manifest.get('created'),
+            'samples': self.manifest.get('samples'),
+            'clusters': self.manifest.get('clusters'),
+            'loaded_at': self.loaded_at,
+        }
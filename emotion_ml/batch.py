@@ -0,0 +1,191 @@
+"""
+Batch Scoring
+
+Offline scoring of complete sessions for backfills: feature extraction in
+a process pool, vectorized rule scoring, and replies split to fit the
+transport's message size limit.
+"""
+
+import asyncio
+import json
+import os
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from emotion_ml.features import BehavioralFeatureExtractor, columnar_features, encode_event, feature_vector
+from emotion_ml.scheduling import DEFAULT_TENANT
+from emotion_ml.windows import parse_event_time
+
+
+_block_extractor = None
+
+
+def split_reply(reply: Dict, limit: int) -> Iterator[bytes]:
+    """Encode a batch reply as messages of at most `limit` bytes, halving its results as needed"""
+    data = json.dumps(reply).encode()
+    results = reply.get('results')
+    if len(data) <= limit or not results or len(results) < 2:
+        yield data  # A single result over the limit fails at publish, reported as the request's error
+        return
+    half = len(results) // 2
+    for part in (results[:half], results[half:]):
+        yield from split_reply(dict(reply, results=part), limit)
+
+
+def session_window(events: List[dict], span: float, max_events: int) -> List[dict]:
+    """The events a live EventTimeWindow would hold once the session has ended"""
+    if not events:
+        return []
+    keyed = sorted(((parse_event_time(e.get('timestamp'), 0.0), i) for i, e in enumerate(events)))
+    newest = keyed[-1][0]
+    kept = [i for t, i in keyed if t >= newest - span][-max_events:]
+    return [events[i] for i in kept]
+
+
+def extract_feature_block(sessions: List[List[dict]], span: Optional[float] = None,
+                          max_events: int = 50) -> Tuple[np.ndarray, np.ndarray, List[Optional[str]]]:
+    """Feature vectors for a block of sessions - the unit of work for the batch process pool.
+
+    Returns (values, present, errors); a session whose extraction fails gets
+    an error string and an empty row. `span` trims each session to its
+    final live window first. The whole block goes through one
+    columnar_features() pass; only sessions it cannot handle run through
+    the pandas extractor.
+    """
+    global _block_extractor
+    if _block_extractor is None:
+        _block_extractor = BehavioralFeatureExtractor()
+    errors = [None] * len(sessions)
+    windows = [[] for _ in sessions]
+    rows, lengths = [], []
+    for i, events in enumerate(sessions):
+        try:
+            if span is not None:
+                events = session_window(events, span, max_events)
+            encoded = [encode_event(event) for event in events]
+        except Exception as e:
+            errors[i] = f"{type(e).__name__}: {e}"
+            encoded = []
+        windows[i] = events
+        rows.extend(encoded)
+        lengths.append(len(encoded))
+    values, present, ok = columnar_features(rows, lengths)
+    for i in np.flatnonzero(~ok):
+        try:
+            values[i], present[i] = feature_vector(_block_extractor.extract_features(windows[i]))
+        except Exception as e:
+            errors[i] = f"{type(e).__name__}: {e}"
+            values[i], present[i] = 0.0, False
+    return values, present, errors
+
+
+class BatchScorer:
+    """Offline scoring of complete sessions, yielded chunk by chunk.
+
+    Feature extraction (one columnar pass per block, extract_feature_block)
+    fans out over a process pool in blocks of `chunk_size`; each finished
+    block is scored in one vectorized pass (EmotionalIntelligence.score_batch)
+    and yielded in request order, with at most `workers * 2` blocks in
+    flight. Nothing here reads or writes live session state, so backfills
+    can run next to the live stream.
+    """
+
+    def __init__(self, intelligence: 'EmotionalIntelligence', workers: Optional[int] = None,
+                 max_events: int = 50):
+        self.intelligence = intelligence
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.max_events = max_events
+        self._pool = None
+
+    @property
+    def pool(self):
+        """Process pool (created on first use); None runs extraction on a thread"""
+        if self._pool is None and self.workers > 1:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def score(self, sessions: List[Dict], rules_for: Callable[[str], 'CompiledRules'],
+                    chunk_size: int = 1000, span: Optional[float] = None):
+        """Yield lists of per-session results, `chunk_size` sessions at a time.
+
+        Each session is {"session_id", "events", "tenant_id"?}; rules come
+        from rules_for(tenant_id).
+        """
+        loop = asyncio.get_running_loop()
+        chunks = [sessions[i:i + chunk_size] for i in range(0, len(sessions), chunk_size)]
+        pending = deque()
+        next_chunk = 0
+        try:
+            while next_chunk < len(chunks) or pending:
+                while next_chunk < len(chunks) and len(pending) < max(self.workers, 1) * 2:
+                    block = [s.get('events') or [] for s in chunks[next_chunk]]
+                    pending.append(loop.run_in_executor(self.pool, extract_feature_block, block, span, self.max_events))
+                    next_chunk += 1
+                chunk = chunks[next_chunk - len(pending)]
+                values, present, errors = await pending.popleft()
+                yield self._results(chunk, values, present, errors, rules_for, span)
+        finally:
+            # Failed or abandoned request: drop blocks still in flight
+            for future in pending:
+                if future.done() and not future.cancelled():
+                    future.exception()
+                else:
+                    future.cancel()
+
+    def _window(self, events: List[dict], span: Optional[float]) -> List[dict]:
+        """The session's events in event-time order, trimmed like extract_feature_block trims them"""
+        if span is None:
+            return session_window(events, float('inf'), len(events))
+        return session_window(events, span, self.max_events)
+
+    def _results(self, chunk: List[Dict], values: np.ndarray, present: np.ndarray,
+                 errors: List[Optional[str]], rules_for, span: Optional[float] = None) -> List[Dict]:
+        results = [None] * len(chunk)
+        # Features, transition evidence and sequence matches all see the same window
+        windows = [self._window(session.get('events') or [], span) for session in chunk]
+        groups = defaultdict(list)  # Rows sharing a compiled rule set are scored together
+        for i, session in enumerate(chunk):
+            if errors[i]:
+                results[i] = {'session_id': session.get('session_id'), 'error': errors[i]}
+            else:
+                rules = rules_for(session.get('tenant_id') or DEFAULT_TENANT)
+                groups[rules.generation].append((i, rules))
+        model = self.intelligence.transition_model
+        for rows in groups.values():
+            index = [i for i, _ in rows]
+            evidence = None
+            if model:
+                evidence = []
+                for i in index:
+                    state = model.new_state()
+                    model.rebuild(state, windows[i])
+                    evidence.append(model.evidence(state))
+            scored = self.intelligence.score_batch(values[index], present[index], rows[0][1], evidence)
+            emotions = scored['emotions']
+            for k, i in enumerate(index):
+                row = scored['scores'][k]
+                results[i] = {
+                    'session_id': chunk[i].get('session_id'),
+                    'tenant_id': chunk[i].get('tenant_id'),
+                    'dominant_emotion': emotions[scored['dominant'][k]],
+                    'confidence': float(scored['confidence'][k]),
+                    'emotion_scores': {e: float(row[c]) for c, e in enumerate(emotions) if row[c] == row[c]},
+                    'recommendations': scored['recommendations'][k],
+                }
+            if self.intelligence.pattern_index:
+                for i, match in zip(index, self.intelligence.pattern_index.match_block(values[index], present[index])):
+                    results[i]['pattern_match'] = match
+        matcher = self.intelligence.sequence_matcher
+        if matcher:
+            for i, result in enumerate(results):
+                if 'error' not in result:
+                    result['sequence_match'] = matcher.match_window(matcher.encode(windows[i]))
+        return results
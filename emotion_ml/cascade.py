@@ -0,0 +1,75 @@
+"""
+Cascade Inference
+
+Decides per scored session whether the rule scores settle it or the
+anomaly and clustering models need to run as well.
+"""
+
+import heapq
+from collections import Counter
+from typing import Dict, Optional
+
+
+class CascadePolicy:
+    """Decides when the rule scores are clear enough to skip the model stages.
+
+    Rules always run first. The anomaly detector and clusterer run only when
+    the top two emotions are within `margin`, the rule-based confidence is
+    under `min_confidence`, or the session is one of every `sample_every`
+    clear cases kept so the models keep seeing (and refitting on) typical
+    traffic. CPU saved is estimated from the measured cost of model runs.
+    """
+
+    REASONS = ('ambiguous', 'low_confidence', 'sampled', 'disabled')
+
+    def __init__(self, enabled: bool = True, margin: float = 0.15, min_confidence: float = 0.8,
+                 sample_every: int = 20, smoothing: float = 0.1):
+        self.enabled = enabled
+        self.margin = margin
+        self.min_confidence = min_confidence
+        self.sample_every = max(int(sample_every), 1)
+        self.smoothing = smoothing
+        self.stats = Counter()
+        self.model_time = 0.0  # EWMA seconds per model run
+        self.saved_time = 0.0
+
+    def needs_models(self, emotions: Dict[str, float], confidence: float) -> Optional[str]:
+        """Why the models must run for this result, or None to exit after the rules"""
+        self.stats['evaluated'] += 1
+        if not self.enabled:
+            reason = 'disabled'
+        else:
+            top = heapq.nlargest(2, emotions.values())
+            if len(top) == 2 and top[0] - top[1] < self.margin:
+                reason = 'ambiguous'
+            elif confidence < self.min_confidence:
+                reason = 'low_confidence'
+            elif self.stats['clear'] % self.sample_every == 0:
+                self.stats['clear'] += 1
+                reason = 'sampled'
+            else:
+                self.stats['clear'] += 1
+                self.stats['exits'] += 1
+                self.saved_time += self.model_time
+                return None
+        self.stats[reason] += 1
+        return reason
+
+    def record_models(self, elapsed: float):
+        if self.stats['model_runs'] == 0:
+            self.model_time = elapsed
+        else:
+            self.model_time += self.smoothing * (elapsed - self.model_time)
+        self.stats['model_runs'] += 1
+
+    def report(self) -> Dict:
+        evaluated = self.stats['evaluated']
+        return {
+            'enabled': self.enabled,
+            'evaluated': evaluated,
+            'exit_rate': self.stats['exits'] / evaluated if evaluated else 0.0,
+            'model_runs': self.stats['model_runs'],
+            'reasons': {reason: self.stats[reason] for reason in self.REASONS if self.stats[reason]},
+            'model_ms': self.model_time * 1000,
+            'cpu_saved_s': self.saved_time,
+        }
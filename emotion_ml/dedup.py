@@ -0,0 +1,92 @@
+"""
+Ingestion Deduplication
+
+Event fingerprints and the fixed-memory rotating Bloom filter that drops
+telemetry the gateway or a client has already delivered.
+"""
+
+import hashlib
+import json
+from typing import Dict, List
+
+
+def event_fingerprint(event: dict) -> bytes:
+    """Dedup key: (sessionId, type, timestamp, payload hash) folded into one digest"""
+    payload = json.dumps(event.get('data'), sort_keys=True, separators=(',', ':'), default=str)
+    key = f"{event.get('sessionId')}\x1f{event.get('type')}\x1f{event.get('timestamp')}\x1f{payload}"
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+
+class RotatingBloomFilter:
+    """Time-bucketed Bloom filter of recently seen keys in a fixed memory budget.
+
+    The budget is split into `generations` bit arrays, each covering
+    `bucket_seconds`. Inserts go to the newest generation, lookups check all
+    of them, and when the newest bucket ages out the oldest is cleared and
+    reused - so duplicates are caught for (generations - 1) to generations
+    buckets and memory never grows.
+    """
+
+    def __init__(self, memory_bytes: int = 4 << 20, generations: int = 4,
+                 bucket_seconds: float = 60.0, hashes: int = 7):
+        self.generations = generations
+        self.bucket_seconds = bucket_seconds
+        self.hashes = hashes
+        self.bytes_per_generation = max(memory_bytes // generations, 1)
+        self.bits = self.bytes_per_generation * 8
+        self.filters = [bytearray(self.bytes_per_generation) for _ in range(generations)]
+        self.current = 0
+        self.bucket_start = None
+        self.seen = 0
+        self.duplicates = 0
+
+    def _positions(self, digest: bytes) -> List[int]:
+        # Kirsch-Mitzenmacher: k positions from two 64-bit halves of one digest
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def _rotate(self, now: float):
+        if self.bucket_start is None:
+            self.bucket_start = now
+            return
+        elapsed = int((now - self.bucket_start) // self.bucket_seconds)
+        for _ in range(min(elapsed, self.generations)):
+            self.current = (self.current + 1) % self.generations
+            self.filters[self.current] = bytearray(self.bytes_per_generation)
+        if elapsed > 0:
+            self.bucket_start += elapsed * self.bucket_seconds
+
+    def seen_recently(self, digest: bytes, now: float) -> bool:
+        """True if the key was (probably) recorded recently; counts towards the dedup rate"""
+        self._rotate(now)
+        self.seen += 1
+        positions = self._positions(digest)
+        for bits in self.filters:
+            if all(bits[p >> 3] & (1 << (p & 7)) for p in positions):
+                self.duplicates += 1
+                return True
+        return False
+
+    def add(self, digest: bytes, now: float):
+        """Record a key (once its event has actually been accepted)"""
+        self._rotate(now)
+        bits = self.filters[self.current]
+        for p in self._positions(digest):
+            bits[p >> 3] |= 1 << (p & 7)
+
+    def check_and_add(self, digest: bytes, now: float) -> bool:
+        """True if the key was (probably) seen recently; otherwise records it"""
+        if self.seen_recently(digest, now):
+            return True
+        self.add(digest, now)
+        return False
+
+    def report(self) -> Dict:
+        return {
+            'seen': self.seen,
+            'duplicates': self.duplicates,
+            'dedup_rate': self.duplicates / self.seen if self.seen else 0.0,
+            'memory_bytes': self.bytes_per_generation * self.generations,
+            'retention_s': self.bucket_seconds * (self.generations - 1),
+        }
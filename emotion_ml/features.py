@@ -0,0 +1,622 @@
+"""
+Behavioral Features
+
+The fixed feature schema and the extractors that turn a session's telemetry
+into it: the pandas BehavioralFeatureExtractor and the columnar kernel that
+reproduces it for many sessions in one vectorized pass.
+"""
+
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+# Fixed feature order for vectors, compiled rules and models
+FEATURE_SCHEMA = (
+    'session_duration', 'event_frequency', 'idle_ratio',
+    'avg_mouse_velocity', 'velocity_variance', 'acceleration_spikes', 'movement_entropy',
+    'scroll_depth', 'scroll_velocity', 'scroll_reversals', 'reading_pattern',
+    'rage_click_count', 'circular_motions', 'direction_changes', 'text_selection', 'tab_switch',
+    'price_proximity_time', 'cta_proximity_time', 'form_proximity_time', 'nav_proximity_time',
+    'exit_signal_strength', 'viewport_approaches',
+    'unique_event_types', 'pattern_complexity',
+    'micro_hesitations', 'dwell_time_variance',
+    'mouse_exit_after_idle', 'price_hover_duration', 'confident_scroll_rate', 'comparison_pattern_strength',
+)
+FEATURE_INDEX = {name: i for i, name in enumerate(FEATURE_SCHEMA)}
+
+# Bump when BehavioralFeatureExtractor's output changes: invalidates cached
+# training features and models trained on them (train-emotion-models.py)
+EXTRACTOR_VERSION = 1
+
+
+def feature_vector(features: Dict[str, float]) -> Tuple[np.ndarray, np.ndarray]:
+    """Feature dict -> (values, present) arrays in FEATURE_SCHEMA order.
+
+    Mouse and scroll features are only extracted when those events exist, so
+    `present` keeps "missing" distinct from "zero".
+    """
+    values = np.array([features.get(name, 0.0) for name in FEATURE_SCHEMA], dtype=float)
+    present = np.array([name in features for name in FEATURE_SCHEMA], dtype=bool)
+    return values, present
+
+
+class BehavioralFeatureExtractor:
+    """Transforms raw telemetry into ML features"""
+
+    def __init__(self):
+        self.window_size = 20  # Last N events to consider
+        self.feature_cache = {}
+
+    def extract_features(self, events: List[dict]) -> Dict[str, float]:
+        """Extract behavioral features from event sequence"""
+
+        if len(events) < 3:
+            return self._empty_features()
+
+        # Convert to DataFrame for easier analysis
+        df = pd.DataFrame(events)
+
+        features = {}
+
+        # Time-based features
+        features['session_duration'] = self._calculate_duration(df)
+        features['event_frequency'] = len(df) / max(features['session_duration'], 1)
+        features['idle_ratio'] = self._calculate_idle_ratio(df)
+
+        # Mouse movement patterns
+        mouse_events = df[df['type'].str.contains('mouse', na=False)]
+        if len(mouse_events) > 0:
+            features['avg_mouse_velocity'] = self._safe_mean(mouse_events, 'velocity')
+            features['velocity_variance'] = self._safe_std(mouse_events, 'velocity')
+            features['acceleration_spikes'] = self._count_spikes(mouse_events, 'acceleration')
+            features['movement_entropy'] = self._calculate_entropy(mouse_events)
+
+        # Scroll patterns
+        scroll_events = df[df['type'] == 'scroll']
+        if len(scroll_events) > 0:
+            features['scroll_depth'] = self._safe_max(scroll_events, 'scrollPercentage')
+            features['scroll_velocity'] = self._safe_mean(scroll_events, 'scrollSpeed')
+            features['scroll_reversals'] = self._count_reversals(scroll_events)
+            features['reading_pattern'] = self._detect_reading_pattern(scroll_events)
+
+        # Interaction patterns
+        features['rage_click_count'] = len(df[df['type'] == 'rage_click'])
+        features['circular_motions'] = len(df[df['type'] == 'circular_motion'])
+        features['direction_changes'] = len(df[df['type'] == 'direction_changes'])
+        features['text_selection'] = len(df[df['type'] == 'text_selection'])
+        features['tab_switch'] = len(df[df['type'] == 'tab_switch'])  # Added for comparison detection
+
+        # Proximity patterns (KEY for intent detection)
+        features['price_proximity_time'] = self._calculate_proximity_time(df, 'price_proximity')
+        features['cta_proximity_time'] = self._calculate_proximity_time(df, 'cta_proximity')
+        features['form_proximity_time'] = self._calculate_proximity_time(df, 'form_proximity')
+        features['nav_proximity_time'] = self._calculate_proximity_time(df, 'nav_proximity')
+
+        # Exit signals
+        features['exit_signal_strength'] = self._calculate_exit_strength(df)
+        features['viewport_approaches'] = len(df[df['type'] == 'viewport_approach'])
+
+        # Behavioral complexity
+        features['unique_event_types'] = df['type'].nunique()
+        features['pattern_complexity'] = self._calculate_complexity(df)
+
+        # Hesitation patterns
+        features['micro_hesitations'] = self._detect_hesitations(df)
+        features['dwell_time_variance'] = self._calculate_dwell_variance(df)
+
+        # CRITICAL COMBINATION PATTERNS
+        features['mouse_exit_after_idle'] = self._detect_exit_after_idle(df)
+        features['price_hover_duration'] = self._calculate_price_hover_duration(df)
+        features['confident_scroll_rate'] = self._calculate_confident_scrolling(df)
+        features['comparison_pattern_strength'] = self._detect_comparison_behavior(df)
+
+        return features
+
+    def _empty_features(self) -> Dict[str, float]:
+        """Return zero-valued features for new sessions"""
+        return defaultdict(float)
+
+    def _calculate_duration(self, df: pd.DataFrame) -> float:
+        """Calculate session duration in seconds"""
+        if 'timestamp' in df.columns and len(df) > 1:
+            df['timestamp'] = pd.to_datetime(df['timestamp'])
+            return (df['timestamp'].max() - df['timestamp'].min()).total_seconds()
+        return 0
+
+    def _calculate_idle_ratio(self, df: pd.DataFrame) -> float:
+        """Ratio of idle time to active time"""
+        idle_events = len(df[df['type'] == 'idle'])
+        total_events = len(df)
+        return idle_events / max(total_events, 1)
+
+    def _safe_mean(self, df: pd.DataFrame, column: str) -> float:
+        """Safely extract mean from nested data"""
+        try:
+            values = df['data'].apply(lambda x: x.get(column, 0) if isinstance(x, dict) else 0)
+            return values.mean() if len(values) > 0 else 0
+        except:
+            return 0
+
+    def _safe_std(self, df: pd.DataFrame, column: str) -> float:
+        """Safely extract standard deviation from nested data"""
+        try:
+            values = df['data'].apply(lambda x: x.get(column, 0) if isinstance(x, dict) else 0)
+            return values.std() if len(values) > 1 else 0
+        except:
+            return 0
+
+    def _safe_max(self, df: pd.DataFrame, column: str) -> float:
+        """Safely extract max from nested data"""
+        try:
+            values = df['data'].apply(lambda x: x.get(column, 0) if isinstance(x, dict) else 0)
+            return values.max() if len(values) > 0 else 0
+        except:
+            return 0
+
+    def _count_spikes(self, df: pd.DataFrame, column: str, threshold: float = 2) -> int:
+        """Count number of spikes (values > threshold * std)"""
+        try:
+            values = df['data'].apply(lambda x: x.get(column, 0) if isinstance(x, dict) else 0)
+            if len(values) < 3:
+                return 0
+            mean = values.mean()
+            std = values.std()
+            if std == 0:
+                return 0
+            z_scores = np.abs((values - mean) / std)
+            return (z_scores > threshold).sum()
+        except:
+            return 0
+
+    def _calculate_entropy(self, df: pd.DataFrame) -> float:
+        """Calculate entropy of movement patterns"""
+        try:
+            if len(df) < 2:
+                return 0
+            # Use direction of movement as categories
+            directions = df['data'].apply(lambda x: x.get('direction', 'unknown') if isinstance(x, dict) else 'unknown')
+            probs = directions.value_counts(normalize=True)
+            return stats.entropy(probs)
+        except:
+            return 0
+
+    def _count_reversals(self, df: pd.DataFrame) -> int:
+        """Count scroll direction reversals"""
+        try:
+            directions = df['data'].apply(lambda x: x.get('direction', '') if isinstance(x, dict) else '')
+            reversals = 0
+            for i in range(1, len(directions)):
+                if directions.iloc[i] != directions.iloc[i-1] and directions.iloc[i] != '':
+                    reversals += 1
+            return reversals
+        except:
+            return 0
+
+    def _detect_reading_pattern(self, scroll_events: pd.DataFrame) -> float:
+        """Detect steady reading pattern (0-1 score)"""
+        try:
+            if len(scroll_events) < 3:
+                return 0
+            speeds = scroll_events['data'].apply(lambda x: x.get('scrollSpeed', 0) if isinstance(x, dict) else 0)
+            # Reading pattern: slow, steady scrolling
+            avg_speed = speeds.mean()
+            speed_variance = speeds.std()
+            if avg_speed > 0:
+                reading_score = 1 / (1 + speed_variance / avg_speed)  # Lower variance = higher score
+                return min(reading_score, 1.0)
+            return 0
+        except:
+            return 0
+
+    def _calculate_proximity_time(self, df: pd.DataFrame, event_type: str) -> float:
+        """Calculate weighted proximity score based on recency and frequency"""
+        proximity_events = df[df['type'] == event_type]
+        if len(proximity_events) == 0:
+            return 0
+
+        # Weight recent events more heavily
+        score = 0
+        for i, event in proximity_events.iterrows():
+            recency_weight = 1.0 - (i / len(df)) if len(df) > 0 else 1.0
+            score += recency_weight
+
+        return score
+
+    def _calculate_exit_strength(self, df: pd.DataFrame) -> float:
+        """Calculate strength of exit intent signals"""
+        exit_events = df[df['type'].isin(['viewport_approach', 'mouse_exit', 'tab_switch'])]
+        return len(exit_events)
+
+    def _calculate_complexity(self, df: pd.DataFrame) -> float:
+        """Calculate behavioral complexity score"""
+        try:
+            # More unique patterns = more complex behavior
+            unique_sequences = set()
+            for i in range(len(df) - 2):
+                sequence = tuple(df['type'].iloc[i:i+3])
+                unique_sequences.add(sequence)
+            return len(unique_sequences) / max(len(df), 1)
+        except:
+            return 0
+
+    def _detect_hesitations(self, df: pd.DataFrame) -> int:
+        """Detect micro-hesitations in movement"""
+        try:
+            mouse_events = df[df['type'].str.contains('mouse', na=False)]
+            if len(mouse_events) < 2:
+                return 0
+
+            velocities = mouse_events['data'].apply(lambda x: x.get('velocity', 0) if isinstance(x, dict) else 0)
+            hesitations = 0
+            for i in range(1, len(velocities)):
+                # Sudden velocity drop = hesitation
+                if velocities.iloc[i] < velocities.iloc[i-1] * 0.3:
+                    hesitations += 1
+            return hesitations
+        except:
+            return 0
+
+    def _calculate_dwell_variance(self, df: pd.DataFrame) -> float:
+        """Calculate variance in dwell times"""
+        try:
+            hover_events = df[df['type'] == 'element_hover']
+            if len(hover_events) < 2:
+                return 0
+            durations = hover_events['data'].apply(lambda x: x.get('duration', 0) if isinstance(x, dict) else 0)
+            return durations.std()
+        except:
+            return 0
+
+    def _detect_exit_after_idle(self, df: pd.DataFrame) -> float:
+        """Detect critical pattern: idle followed by exit"""
+        try:
+            score = 0
+            for i in range(len(df) - 1):
+                current = df.iloc[i]
+                next_event = df.iloc[i+1]
+
+                # Check for idle->exit pattern
+                if current['type'] == 'idle' and next_event['type'] in ['mouse_exit', 'viewport_approach', 'mouse']:
+                    idle_data = current.get('data', {})
+                    if isinstance(idle_data, dict):
+                        idle_duration = idle_data.get('duration', 0)
+                        # More sensitive scoring
+                        score = max(score, min(idle_duration / 1500, 1.0))  # Lower threshold
+
+                # Also check for slow movement upward (exit intent)
+                if current['type'] == 'mouse':
+                    mouse_data = current.get('data', {})
+                    if isinstance(mouse_data, dict):
+                        if mouse_data.get('direction') == 'up' and mouse_data.get('velocity', 0) > 300:
+                            score = max(score, 0.5)
+
+            return score
+        except:
+            return 0
+
+    def _calculate_price_hover_duration(self, df: pd.DataFrame) -> float:
+        """Calculate total time hovering on price elements"""
+        try:
+            price_hovers = df[(df['type'] == 'element_hover') | (df['type'] == 'price_proximity')]
+            total_duration = 0
+            for _, event in price_hovers.iterrows():
+                if isinstance(event.get('data'), dict):
+                    if 'price' in str(event['data'].get('element', '')):
+                        total_duration += event['data'].get('duration', 0)
+            return min(total_duration / 5000, 1.0)  # Normalize
+        except:
+            return 0
+
+    def _calculate_confident_scrolling(self, df: pd.DataFrame) -> float:
+        """Detect confident, purposeful scrolling vs hesitant scrolling"""
+        try:
+            scroll_events = df[df['type'] == 'scroll']
+            if len(scroll_events) < 2:
+                return 0
+
+            # Confident scrolling: consistent speed, same direction
+            speeds = scroll_events['data'].apply(lambda x: x.get('scrollSpeed', 0) if isinstance(x, dict) else 0)
+            directions = scroll_events['data'].apply(lambda x: x.get('direction', '') if isinstance(x, dict) else '')
+
+            # Calculate consistency
+            speed_consistency = 1 / (1 + speeds.std()) if len(speeds) > 1 else 0
+            direction_consistency = len(directions[directions == directions.mode()[0]]) / len(directions) if len(directions) > 0 else 0
+
+            return (speed_consistency + direction_consistency) / 2
+        except:
+            return 0
+
+    def _detect_comparison_behavior(self, df: pd.DataFrame) -> float:
+        """Detect comparison shopping patterns"""
+        try:
+            comparison_signals = 0
+
+            # Tab switches
+            comparison_signals += len(df[df['type'] == 'tab_switch']) * 0.3
+
+            # Navigation proximity (looking for competitor links)
+            comparison_signals += len(df[df['type'] == 'nav_proximity']) * 0.2
+
+            # Price re-checks (returning to price after scrolling away)
+            price_events = df[df['type'].str.contains('price', na=False)]
+            if len(price_events) > 1:
+                # Check for price revisits
+                for i in range(1, len(price_events)):
+                    time_diff = i  # Simplified - would use actual timestamps
+                    if time_diff > 5:  # Returned to price after time away
+                        comparison_signals += 0.5
+
+            return min(comparison_signals, 1.0)
+        except:
+            return 0
+
+
+# Columnar feature extraction. encode_event() turns an event into a flat row
+# once (when it is buffered); columnar_features() computes the features of any
+# number of sessions from their rows in one vectorized pass. It reproduces
+# BehavioralFeatureExtractor exactly (tests/test_columnar_features.py) for the
+# input it accepts - JSON-typed fields and, per session, timestamps that are
+# all epoch integers or all ISO strings of one shape - and leaves anything
+# else (where pandas' coercions or errors decide the result) to pandas.
+
+_ISO_TIMESTAMP = re.compile(r'\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,9})?)?)?Z?')
+_TIMESTAMP_SHAPE = str.maketrans('123456789', '000000000')
+_BAD_VALUE = object()  # A direction pandas would treat specially (None, numbers, ...)
+
+
+def _number(data: dict, name: str) -> float:
+    """data[name] (default 0) as a float, NaN unless it is a plain, exactly representable number"""
+    value = data.get(name, 0)
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and -2 ** 53 <= value <= 2 ** 53:
+        return float(value)
+    return float('nan')
+
+
+def encode_event(event: dict) -> Optional[tuple]:
+    """An event as a columnar_features() row, or None if it needs the pandas extractor.
+
+    Row: (type, timestamp shape, timestamp ns, velocity, acceleration,
+    scrollPercentage, scrollSpeed, duration, direction, price element, has data)
+    """
+    if not isinstance(event, dict) or not isinstance(event.get('type'), str):
+        return None
+    timestamp = event.get('timestamp')
+    if isinstance(timestamp, str):
+        # pd.to_datetime infers one format per column: same-shaped ISO strings only
+        if not _ISO_TIMESTAMP.fullmatch(timestamp) or not 1678 <= int(timestamp[:4]) <= 2261:
+            return None
+        try:
+            stamp = int(np.datetime64(timestamp.rstrip('Z'), 'ns').astype(np.int64))
+        except ValueError:
+            return None
+        shape = timestamp.translate(_TIMESTAMP_SHAPE)
+    elif isinstance(timestamp, int) and not isinstance(timestamp, bool) and abs(timestamp) < 1 << 62:
+        stamp, shape = timestamp, 'ns'  # pandas reads integers as epoch nanoseconds
+    else:
+        return None
+    data = event.get('data')
+    if not isinstance(data, dict):
+        data = {}  # The pandas helpers treat non-dict data as empty
+    direction = data.get('direction')  # None: missing
+    if 'direction' in data and not isinstance(direction, str):
+        direction = _BAD_VALUE
+    return (event['type'], shape, stamp, _number(data, 'velocity'), _number(data, 'acceleration'),
+            _number(data, 'scrollPercentage'), _number(data, 'scrollSpeed'), _number(data, 'duration'),
+            direction, 'price' in str(data.get('element', '')), 'data' in event)
+
+
+_UNENCODED_ROW = ('', '', 0, 0.0, 0.0, 0.0, 0.0, 0.0, None, False, True)
+
+
+def _segment_reduce(ufunc, x: np.ndarray, seg: np.ndarray, size: int, fill=0) -> np.ndarray:
+    """ufunc.reduce of x per segment id (seg sorted), `fill` for empty segments"""
+    out = np.full(size, fill, dtype=x.dtype)
+    if len(x):
+        starts = np.flatnonzero(np.r_[True, seg[1:] != seg[:-1]])
+        out[seg[starts]] = ufunc.reduceat(x, starts)
+    return out
+
+
+def _segment_moments(x: np.ndarray, seg: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(count, mean, sample std) per segment; std is 0 below two values"""
+    count = np.bincount(seg, minlength=size)
+    mean = np.bincount(seg, x, size) / np.maximum(count, 1)
+    deviation = x - mean[seg]
+    std = np.sqrt(np.bincount(seg, deviation * deviation, size) / np.maximum(count - 1, 1))
+    return count, mean, np.where(count > 1, std, 0.0)
+
+
+def columnar_features(rows: List[Optional[tuple]], lengths) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Feature vectors for consecutive sessions of encode_event() rows.
+
+    `lengths` splits `rows` into sessions. Returns (values, present, ok) in
+    FEATURE_SCHEMA order; ok is False for sessions the pandas extractor has
+    to handle (unencodable rows, mixed timestamp shapes, non-numeric fields
+    the features read).
+    """
+    lengths = np.asarray(lengths, dtype=np.intp)
+    size, total = len(lengths), int(lengths.sum())
+    values = np.zeros((size, len(FEATURE_SCHEMA)))
+    present = np.zeros((size, len(FEATURE_SCHEMA)), dtype=bool)
+    ok = np.ones(size, dtype=bool)
+    scored = lengths >= 3  # Shorter sessions have no features at all
+    if not scored.any():
+        return values, present, ok
+
+    seg = np.repeat(np.arange(size), lengths)
+    unencoded = np.fromiter((row is None for row in rows), bool, total)
+    if unencoded.any():
+        ok &= np.bincount(seg[unencoded], minlength=size) == 0
+        rows = [_UNENCODED_ROW if row is None else row for row in rows]
+    (types, shapes, stamps, velocity, acceleration, depth, speed, duration,
+     directions, price_element, has_data) = zip(*rows)
+    velocity, acceleration = np.array(velocity), np.array(acceleration)
+    depth, speed, duration = np.array(depth), np.array(speed), np.array(duration)
+    price_element = np.array(price_element)
+    n = lengths.astype(float)
+    position = np.arange(total) - (np.cumsum(lengths) - lengths)[seg]
+    n_event = lengths[seg]
+
+    def count(mask):
+        return np.bincount(seg[mask], minlength=size)
+
+    def invalid(mask):
+        ok[:] &= count(mask) == 0
+
+    # Event types and directions as codes, so the grouping below is integer work
+    codes = {}
+    code = np.fromiter((codes.setdefault(t, len(codes)) for t in types), np.intp, total)
+    names = list(codes)
+
+    def is_type(name):
+        return code == codes.get(name, -1)
+
+    def type_contains(text):
+        return np.array([text in name for name in names], dtype=bool)[code]
+
+    direction_codes = {}
+    direction = np.fromiter((direction_codes.setdefault(d, len(direction_codes)) for d in directions),
+                            np.intp, total)
+    missing = direction == direction_codes.get(None, -1)
+    entropy_direction = np.where(missing, direction_codes.setdefault('unknown', len(direction_codes)), direction)
+    scroll_direction = np.where(missing, direction_codes.setdefault('', len(direction_codes)), direction)
+    bad_direction = direction == direction_codes.get(_BAD_VALUE, -1)
+    moving_up = direction == direction_codes.get('up', -1)
+    kinds = len(direction_codes)
+
+    # Timestamps: one shape per session; pandas floors durations to microseconds
+    shape_codes = {}
+    shape = np.fromiter((shape_codes.setdefault(s, len(shape_codes)) for s in shapes), np.intp, total)
+    ok &= _segment_reduce(np.minimum, shape, seg, size) == _segment_reduce(np.maximum, shape, seg, size)
+    ok &= np.bincount(seg, np.array(has_data, dtype=float), size) > 0  # No data column: pandas helpers bail out
+    stamp = np.array(stamps, dtype=np.int64)
+    elapsed = _segment_reduce(np.maximum, stamp, seg, size) - _segment_reduce(np.minimum, stamp, seg, size)
+    session_duration = (elapsed // 1000) / 1e6
+
+    columns = {
+        'session_duration': session_duration,
+        'event_frequency': n / np.maximum(session_duration, 1),
+        'idle_ratio': count(is_type('idle')) / np.maximum(n, 1),
+    }
+
+    # Mouse movement patterns
+    mouse = type_contains('mouse')
+    invalid(mouse & (np.isnan(velocity) | np.isnan(acceleration) | bad_direction))
+    mouse_seg, mouse_velocity = seg[mouse], velocity[mouse]
+    mouse_count, velocity_mean, velocity_std = _segment_moments(mouse_velocity, mouse_seg, size)
+    mouse_acceleration = acceleration[mouse]
+    _, acceleration_mean, acceleration_std = _segment_moments(mouse_acceleration, mouse_seg, size)
+    z_scores = np.abs(mouse_acceleration - acceleration_mean[mouse_seg]) / \
+        np.where(acceleration_std > 0, acceleration_std, 1.0)[mouse_seg]
+    spikes = np.bincount(mouse_seg[z_scores > 2], minlength=size)
+    groups, group_counts = np.unique(mouse_seg * kinds + entropy_direction[mouse], return_counts=True)
+    owner = groups // kinds
+    share = group_counts / mouse_count[owner]
+    entropy = -np.bincount(owner, share * np.log(share), size)
+    follows = (mouse_seg[1:] == mouse_seg[:-1])
+    hesitations = np.bincount(mouse_seg[1:][follows & (mouse_velocity[1:] < mouse_velocity[:-1] * 0.3)],
+                              minlength=size)
+    mouse_columns = {
+        'avg_mouse_velocity': velocity_mean,
+        'velocity_variance': velocity_std,
+        'acceleration_spikes': np.where((mouse_count >= 3) & (acceleration_std != 0), spikes, 0),
+        'movement_entropy': np.where(mouse_count >= 2, entropy, 0.0),
+    }
+
+    # Scroll patterns
+    scroll = is_type('scroll')
+    invalid(scroll & (np.isnan(depth) | np.isnan(speed) | bad_direction))
+    scroll_seg, scroll_directions = seg[scroll], scroll_direction[scroll]
+    scroll_count, speed_mean, speed_std = _segment_moments(speed[scroll], scroll_seg, size)
+    follows = scroll_seg[1:] == scroll_seg[:-1]
+    reversed_ = follows & (scroll_directions[1:] != scroll_directions[:-1]) & \
+        (scroll_directions[1:] != direction_codes[''])
+    groups, group_counts = np.unique(scroll_seg * kinds + scroll_directions, return_counts=True)
+    mode_count = _segment_reduce(np.maximum, group_counts, groups // kinds, size)
+    steady = (scroll_count >= 3) & (speed_mean > 0)
+    scroll_columns = {
+        'scroll_depth': _segment_reduce(np.maximum, depth[scroll], scroll_seg, size, 0.0),
+        'scroll_velocity': speed_mean,
+        'scroll_reversals': np.bincount(scroll_seg[1:][reversed_], minlength=size),
+        'reading_pattern': np.where(
+            steady, np.minimum(1 / (1 + speed_std / np.where(steady, speed_mean, 1.0)), 1.0), 0.0
+        ),
+    }
+
+    # Interaction counts and recency-weighted proximity
+    for feature, name in (('rage_click_count', 'rage_click'), ('circular_motions', 'circular_motion'),
+                          ('direction_changes', 'direction_changes'), ('text_selection', 'text_selection'),
+                          ('tab_switch', 'tab_switch')):
+        columns[feature] = count(is_type(name))
+    recency = 1.0 - position / n_event
+    for name in ('price', 'cta', 'form', 'nav'):
+        proximity = is_type(f'{name}_proximity')
+        columns[f'{name}_proximity_time'] = np.bincount(seg[proximity], recency[proximity], size)
+    columns['exit_signal_strength'] = count(is_type('viewport_approach') | is_type('mouse_exit') |
+                                            is_type('tab_switch'))
+    columns['viewport_approaches'] = count(is_type('viewport_approach'))
+
+    # Behavioral complexity: distinct types and distinct 3-grams of types
+    columns['unique_event_types'] = np.bincount(np.unique(seg * len(codes) + code) // len(codes), minlength=size)
+    head = np.flatnonzero(position <= n_event - 3)
+    grams = np.unique(np.stack([seg[head], code[head], code[head + 1], code[head + 2]], axis=1), axis=0)
+    columns['pattern_complexity'] = np.bincount(grams[:, 0], minlength=size) / np.maximum(n, 1)
+
+    # Hesitation patterns
+    hover = is_type('element_hover')
+    price_proximity = is_type('price_proximity')
+    invalid((is_type('idle') | hover | price_proximity) & np.isnan(duration))
+    hover_count, _, hover_std = _segment_moments(duration[hover], seg[hover], size)
+    columns['micro_hesitations'] = np.where(mouse_count >= 2, hesitations, 0)
+    columns['dwell_time_variance'] = np.where(hover_count >= 2, hover_std, 0.0)
+
+    # Combination patterns. Idle -> exit/mouse, or a fast upward mouse move
+    # (the last event of a session is never considered, as in pandas)
+    has_next = position < n_event - 1
+    following = np.minimum(np.arange(total) + 1, total - 1)
+    leaves = is_type('mouse_exit') | is_type('viewport_approach') | is_type('mouse')
+    idle_exit = has_next & is_type('idle') & leaves[following]
+    exit_move = has_next & is_type('mouse') & moving_up & (velocity > 300)
+    signal = idle_exit | exit_move
+    exit_scores = np.where(idle_exit, np.minimum(duration / 1500, 1.0), 0.5)[signal]
+    columns['mouse_exit_after_idle'] = np.maximum(
+        _segment_reduce(np.maximum, exit_scores, seg[signal], size, 0.0), 0.0
+    )
+    priced = (hover | price_proximity) & price_element
+    columns['price_hover_duration'] = np.minimum(np.bincount(seg[priced], duration[priced], size) / 5000, 1.0)
+    columns['confident_scroll_rate'] = np.where(
+        scroll_count >= 2, (1 / (1 + speed_std) + mode_count / np.maximum(scroll_count, 1)) / 2, 0.0
+    )
+    revisits = np.maximum(count(type_contains('price')) - 6, 0)  # Price events after the sixth
+    columns['comparison_pattern_strength'] = np.minimum(
+        columns['tab_switch'] * 0.3 + count(is_type('nav_proximity')) * 0.2 + revisits * 0.5, 1.0
+    )
+
+    for group, where in ((columns, scored), (mouse_columns, scored & (mouse_count > 0)),
+                         (scroll_columns, scored & (scroll_count > 0))):
+        for name, column in group.items():
+            index = FEATURE_INDEX[name]
+            values[:, index] = np.where(where, column, 0.0)
+            present[:, index] = where
+    ok |= ~scored
+    return values, present, ok
+
+
+class ColumnarFeatureExtractor(BehavioralFeatureExtractor):
+    """BehavioralFeatureExtractor's features via columnar_features(), pandas only as a fallback"""
+
+    def extract_features(self, events: List[dict], rows: Optional[List[Optional[tuple]]] = None) -> Dict[str, float]:
+        """Features of one session; `rows` are its events' encode_event() rows, if already encoded"""
+        if len(events) < 3:
+            return self._empty_features()
+        if rows is None:
+            rows = [encode_event(event) for event in events]
+        values, present, ok = columnar_features(rows, [len(rows)])
+        if not ok[0]:
+            return super().extract_features(events)
+        return {name: float(values[0, i]) for i, name in enumerate(FEATURE_SCHEMA) if present[0, i]}
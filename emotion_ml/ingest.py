@@ -0,0 +1,328 @@
+"""
+Built-in Telemetry Ingest
+
+A stdlib-only HTTP + WebSocket endpoint that accepts what the telemetry
+gateway accepts and feeds the service in-process, for single-node installs.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import struct
+import time
+import urllib.parse
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from emotion_ml.scheduling import DEFAULT_TENANT
+
+
+def normalize_envelope(batch: Dict, session_id: Optional[str] = None, now: Optional[str] = None) -> List[Dict]:
+    """Gateway-shaped events from a {sessionId, tenantId, events} envelope.
+
+    Same normalization as telemetry-gateway-standalone.cjs, so events arriving
+    over the built-in ingest server score exactly like ones that went through
+    the gateway and NATS. Envelopes without a tenantId go to DEFAULT_TENANT,
+    like any other event the service receives without one.
+    """
+    now = now or datetime.now().isoformat()
+    return [
+        {
+            'sessionId': batch.get('sessionId') or session_id or 'unknown',
+            'tenantId': batch.get('tenantId') or DEFAULT_TENANT,
+            'timestamp': event.get('timestamp') or now,
+            'type': event.get('type'),
+            'data': event.get('data') or {},
+        }
+        for event in batch.get('events') or []
+    ]
+
+
+class IngestServer:
+    """Minimal asyncio HTTP + WebSocket telemetry endpoint (stdlib only).
+
+    Accepts what the browser SDK and simulators send to the gateway -
+    POST /api/telemetry and messages on ws://host:port/ws - and hands the
+    normalized batches to the service through a bounded in-memory queue, so
+    single-node installs skip the gateway -> NATS hop. When the queue is full
+    HTTP answers 503 and WebSocket clients get an error message.
+    GET /api/sessions/<id>[?timeline=0&limit=N] serves the read API and
+    POST /api/score streams batch scoring results as NDJSON.
+
+    Binds to loopback by default. The read and scoring endpoints need
+    `Authorization: Bearer <token>` when a token is set, and without one
+    they are only served on a loopback bind - listening on a public
+    address never exposes them unauthenticated.
+    """
+
+    WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+    MAX_HEADER_BYTES = 64 * 1024
+    MAX_BODY_BYTES = 10 * 1024 * 1024  # Matches the gateway's express.json limit
+    REASONS = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden',
+               404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large', 503: 'Service Unavailable'}
+    LOOPBACK_HOSTS = ('127.0.0.1', '::1', 'localhost')
+    PROTECTED_PATHS = ('/api/score', '/api/sessions/')
+
+    def __init__(self, queue: 'asyncio.Queue', metrics: 'ServiceMetrics',
+                 host: str = '127.0.0.1', port: int = 3002,
+                 query: Optional[Callable[..., Optional[Dict]]] = None,
+                 score: Optional[Callable[[Dict], object]] = None,
+                 token: Optional[str] = None):
+        self.queue = queue
+        self.metrics = metrics
+        self.query = query  # GET /api/sessions/<id> -> session state (see MLEmotionService.query_session)
+        self.score = score  # POST /api/score -> async iterator of reply chunks (see MLEmotionService.score_batch)
+        self.token = token  # Bearer token for the read and scoring endpoints
+        self.host = host
+        self.port = port
+        self.server = None
+        self.connections = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    def report(self) -> Dict:
+        return {'queued': self.queue.qsize(), 'capacity': self.queue.maxsize, 'connections': self.connections}
+
+    def submit(self, events: List[Dict]) -> bool:
+        """Queue a normalized batch for the service; False when the queue is full"""
+        if not events:
+            return True
+        try:
+            self.queue.put_nowait(events)
+        except asyncio.QueueFull:
+            self.metrics.inc('ingest_rejected_batches')
+            return False
+        self.metrics.inc('ingest_events', len(events))
+        return True
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:  # HTTP/1.1 keep-alive
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                path = target.split('?', 1)[0]
+                if body is None:
+                    await self._respond(writer, 413, {
+                        'error': f"request body is {headers.get('content-length')} bytes, over the "
+                                 f"{self.MAX_BODY_BYTES >> 20} MiB limit; split it into smaller requests"
+                    })
+                    break
+                if path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                    await self._websocket(reader, writer, headers)
+                    break
+                denied = self._authorize(path, method, headers)
+                if denied:
+                    await self._respond(writer, *denied)
+                elif path == '/api/score' and method == 'POST' and self.score:
+                    await self._stream_scores(writer, body)
+                else:
+                    status, payload = self._route(method, target, body)
+                    await self._respond(writer, status, payload)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    def _authorize(self, path: str, method: str, headers: Dict) -> Optional[Tuple[int, Dict]]:
+        """(status, error) when a protected endpoint may not be served to this request"""
+        if method == 'OPTIONS' or not path.startswith(self.PROTECTED_PATHS):
+            return None
+        if self.token:
+            scheme, _, credentials = headers.get('authorization', '').partition(' ')
+            if scheme.lower() == 'bearer' and hmac.compare_digest(credentials.strip().encode(), self.token.encode()):
+                return None
+            self.metrics.inc('ingest_unauthorized')
+            return 401, {'error': 'missing or invalid bearer token'}
+        if self.host in self.LOOPBACK_HOSTS:
+            return None
+        return 403, {'error': 'session and scoring endpoints need ML_INGEST_TOKEN on a non-loopback bind'}
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError:
+            return None  # Client closed the connection
+        except asyncio.LimitOverrunError:
+            raise ValueError('request head too large')
+        if len(head) > self.MAX_HEADER_BYTES:
+            raise ValueError('request head too large')
+        lines = head.decode('latin-1').split('\r\n')
+        method, target, _ = lines[0].split(' ', 2)
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        if length > self.MAX_BODY_BYTES:
+            return method.upper(), target, headers, None  # Answered with 413, body left unread
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target, headers, body
+
+    def _route(self, method: str, target: str, body: bytes) -> Tuple[int, Optional[Dict]]:
+        path, _, query = target.partition('?')
+        if method == 'OPTIONS':
+            return 204, None  # CORS preflight
+        if path.startswith('/api/sessions/') and self.query and method == 'GET':
+            params = urllib.parse.parse_qs(query)
+            try:
+                limit = int(params['limit'][0]) if 'limit' in params else None
+            except ValueError:
+                return 400, {'error': 'limit must be an integer'}
+            state = self.query(
+                urllib.parse.unquote(path[len('/api/sessions/'):]),
+                timeline=params.get('timeline', ['1'])[0] != '0',
+                limit=limit,
+            )
+            return (200, state) if state is not None else (404, {'error': 'unknown session'})
+        if path == '/health':
+            return 200, {'status': 'healthy', 'timestamp': int(time.time() * 1000),
+                         'queued': self.queue.qsize(), 'connections': self.connections}
+        if path != '/api/telemetry':
+            return 404, {'error': 'not found'}
+        if method != 'POST':
+            return 405, {'error': 'method not allowed'}
+        try:
+            batch = json.loads(body)
+        except ValueError as e:
+            return 400, {'error': f'invalid JSON: {e}'}
+        events = normalize_envelope(batch)
+        if not self.submit(events):
+            return 503, {'error': 'ingest queue full'}
+        return 200, {'success': True, 'published': len(events)}
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, payload: Optional[Dict]):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        head = (
+            f"HTTP/1.1 {status} {self.REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Access-Control-Allow-Origin: *\r\n"
+            "Access-Control-Allow-Methods: GET, POST, OPTIONS\r\n"
+            "Access-Control-Allow-Headers: Content-Type, Authorization\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+    async def _stream_scores(self, writer: asyncio.StreamWriter, body: bytes):
+        """Batch scoring over HTTP: one NDJSON line per chunk, sent with chunked transfer encoding"""
+        try:
+            request = json.loads(body)
+        except ValueError as e:
+            await self._respond(writer, 400, {'error': f'invalid JSON: {e}'})
+            return
+        writer.write((
+            "HTTP/1.1 200 OK\r\n"
+            "Content-Type: application/x-ndjson\r\n"
+            "Transfer-Encoding: chunked\r\n"
+            "Access-Control-Allow-Origin: *\r\n"
+            "\r\n"
+        ).encode())
+        try:
+            async for reply in self.score(request):
+                line = json.dumps(reply).encode() + b'\n'
+                writer.write(f"{len(line):x}\r\n".encode() + line + b'\r\n')
+                await writer.drain()
+        except Exception as e:
+            line = json.dumps({'done': True, 'error': str(e)}).encode() + b'\n'
+            writer.write(f"{len(line):x}\r\n".encode() + line + b'\r\n')
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def _websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, headers: Dict):
+        """RFC 6455 server side: text messages in, JSON acks out"""
+        key = headers.get('sec-websocket-key', '')
+        accept = base64.b64encode(hashlib.sha1((key + self.WS_GUID).encode()).digest()).decode()
+        writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n"
+            "\r\n"
+        ).encode())
+        await writer.drain()
+
+        session_id = None
+        fragments, buffered = [], 0
+        while True:
+            opcode, payload, fin, masked = await self._read_frame(reader)
+            if not masked:  # RFC 6455 5.1: clients must mask every frame
+                await self._send_frame(writer, 0x8, struct.pack('>H', 1002) + b'unmasked client frame')
+                return
+            if opcode == 0x8:  # Close
+                await self._send_frame(writer, 0x8, payload[:2])
+                return
+            if opcode == 0x9:  # Ping
+                await self._send_frame(writer, 0xA, payload)
+                continue
+            if opcode in (0x1, 0x2, 0x0):
+                fragments.append(payload)
+                buffered += len(payload)
+                if buffered > self.MAX_BODY_BYTES:  # A fragmented message gets the same cap as a frame
+                    await self._send_frame(writer, 0x8, struct.pack('>H', 1009) + b'message too big')
+                    return
+                if not fin:
+                    continue
+                message, fragments, buffered = b''.join(fragments), [], 0
+                try:
+                    data = json.loads(message)
+                    if data.get('type') == 'init':
+                        session_id = data.get('session_id')
+                        reply = {'type': 'ack', 'session_id': session_id}
+                    elif data.get('type') == 'telemetry' or data.get('events'):
+                        events = normalize_envelope(data.get('batch') or data, session_id)
+                        if self.submit(events):
+                            reply = {'type': 'ack', 'received': len(events)}
+                        else:
+                            reply = {'type': 'error', 'message': 'ingest queue full'}
+                    else:
+                        continue
+                except (ValueError, AttributeError) as e:
+                    reply = {'type': 'error', 'message': str(e)}
+                await self._send_frame(writer, 0x1, json.dumps(reply).encode())
+
+    async def _read_frame(self, reader: asyncio.StreamReader) -> Tuple[int, bytes, bool, bool]:
+        """(opcode, unmasked payload, fin, whether the frame was masked)"""
+        first, second = await reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack('>H', await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('>Q', await reader.readexactly(8))[0]
+        if length > self.MAX_BODY_BYTES:
+            raise ValueError('websocket frame too large')
+        mask = await reader.readexactly(4) if second & 0x80 else None
+        payload = await reader.readexactly(length)
+        if mask:
+            key = np.resize(np.frombuffer(mask, dtype=np.uint8), length)
+            payload = (np.frombuffer(payload, dtype=np.uint8) ^ key).tobytes()
+        return first & 0x0F, payload, bool(first & 0x80), mask is not None
+
+    async def _send_frame(self, writer: asyncio.StreamWriter, opcode: int, payload: bytes):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('>BB', 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack('>BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+        writer.write(header + payload)
+        await writer.drain()
@@ -0,0 +1,38 @@
+"""
+Pattern Library Access
+
+Loads behavioral-training-data.py, the labelled pattern library and its
+PatternSimulator, and maps the library's labels onto service emotions.
+"""
+
+import importlib.util
+import os
+import sys
+from typing import Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Library labels -> service emotions
+EMOTION_MAP = {
+    'price_shock': 'price_shock',
+    'abandonment_intent': 'abandonment_intent',
+    'confusion': 'confusion',
+    'frustration': 'frustration',
+    'engagement': 'engagement',
+    'comparison_shopping': 'comparison_shopping',
+    'trust_building': 'evaluation',
+    'purchase_intent': 'cart_review',
+    'skepticism': 'skeptical',
+}
+
+
+def load_training_module(path: Optional[str] = None):
+    """Import behavioral-training-data.py (hyphenated, so not importable by name)"""
+    path = path or os.path.join(ROOT, 'behavioral-training-data.py')
+    spec = importlib.util.spec_from_file_location('behavioral_training_data', path)
+    if spec is None:
+        raise ImportError(f"cannot load training data from {path}")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,52 @@
+"""
+Feature Normalization
+
+Streaming per-feature baselines for z-scoring FEATURE_SCHEMA vectors, kept
+per tenant by the service and frozen into trained model versions.
+"""
+
+import numpy as np
+
+from emotion_ml.features import FEATURE_SCHEMA
+
+
+class OnlineNormalizer:
+    """Running per-feature mean and variance (Welford) for z-scoring feature vectors.
+
+    One O(features) update per scored session. Absent features leave the
+    statistics alone and normalize to 0 (the mean), as do features that
+    have not varied yet.
+    """
+
+    def __init__(self, size: int = len(FEATURE_SCHEMA)):
+        self.count = np.zeros(size)
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+
+    def update(self, values: np.ndarray, present: np.ndarray):
+        mask = present & np.isfinite(values)
+        self.count += mask
+        delta = np.where(mask, values - self.mean, 0.0)
+        self.mean += delta / np.maximum(self.count, 1)
+        self.m2 += delta * np.where(mask, values - self.mean, 0.0)
+
+    def std(self) -> np.ndarray:
+        std = np.sqrt(self.m2 / np.maximum(self.count - 1, 1))
+        std[std < 1e-12] = 1.0
+        return std
+
+    def normalize(self, values: np.ndarray, present: np.ndarray) -> np.ndarray:
+        """z-score `values` in place (and return it)"""
+        values -= self.mean
+        values /= self.std()
+        values[~present | ~np.isfinite(values)] = 0.0
+        return values
+
+    def state(self) -> np.ndarray:
+        return np.stack([self.count, self.mean, self.m2])
+
+    @classmethod
+    def from_state(cls, state: np.ndarray) -> 'OnlineNormalizer':
+        normalizer = cls(state.shape[1])
+        normalizer.count, normalizer.mean, normalizer.m2 = (np.array(row, dtype=float) for row in state)
+        return normalizer
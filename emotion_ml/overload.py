@@ -0,0 +1,99 @@
+"""
+Overload Control
+
+Quality tiers the service steps down through when scoring falls behind the
+incoming traffic, and back up once the backlog has drained.
+"""
+
+import zlib
+from typing import Dict
+
+
+class OverloadController:
+    """Degrades scoring quality in steps when the service falls behind.
+
+    Load is the estimated queueing delay: sessions waiting in the scoring
+    queue (TenantScheduler.depth) times the smoothed per-session scoring
+    time. While it stays over `latency_budget` for `step_down_after` seconds
+    the controller drops one tier; once it stays under a quarter of the
+    budget for `step_up_after` seconds it climbs back one tier. Scoring
+    updates the timing (record); tiers are re-evaluated on a timer
+    (evaluate), so an idle service recovers on the clock instead of waiting
+    for the next burst to be scored at a degraded tier. Sessions with
+    critical events are always scored at full quality.
+
+    Tiers: 0 full, 1 skip clustering, 2 also skip anomaly detection,
+    3 also lengthen debounce for non-critical sessions, 4 also sample
+    low-value sessions.
+    """
+
+    TIERS = ('full', 'skip_clustering', 'skip_anomaly', 'long_debounce', 'sample_low_value')
+    LOW_VALUE_EMOTIONS = ('none', 'engagement', 'curiosity')
+
+    def __init__(self, latency_budget: float = 0.25, step_down_after: float = 2.0,
+                 step_up_after: float = 10.0, debounce_multiplier: float = 3.0,
+                 low_value_sample_rate: int = 4, smoothing: float = 0.2):
+        self.latency_budget = latency_budget
+        self.step_down_after = step_down_after
+        self.step_up_after = step_up_after
+        self.debounce_multiplier = debounce_multiplier
+        self.low_value_sample_rate = low_value_sample_rate
+        self.smoothing = smoothing
+
+        self.tier = 0
+        self.handling_time = 0.0  # EWMA seconds per message
+        self.queue_delay = 0.0
+        self._pressure_since = None
+        self._calm_since = None
+
+    def record(self, handling_time: float):
+        """Smooth in one session's scoring time"""
+        self.handling_time += self.smoothing * (handling_time - self.handling_time)
+
+    def evaluate(self, backlog: int, now: float) -> bool:
+        """Re-estimate the queueing delay for `backlog` waiting sessions; returns True if the tier changed"""
+        self.queue_delay = backlog * self.handling_time
+
+        if self.queue_delay > self.latency_budget:
+            self._calm_since = None
+            if self._pressure_since is None:
+                self._pressure_since = now
+            elif now - self._pressure_since >= self.step_down_after and self.tier < len(self.TIERS) - 1:
+                self.tier += 1
+                self._pressure_since = now
+                return True
+        elif self.queue_delay < self.latency_budget / 4:
+            self._pressure_since = None
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.step_up_after and self.tier > 0:
+                self.tier -= 1
+                self._calm_since = now
+                return True
+        else:
+            self._pressure_since = self._calm_since = None
+        return False
+
+    def skip_clustering(self, critical: bool) -> bool:
+        return not critical and self.tier >= 1
+
+    def skip_anomaly(self, critical: bool) -> bool:
+        return not critical and self.tier >= 2
+
+    def debounce(self, base: float, critical: bool) -> float:
+        return base * self.debounce_multiplier if not critical and self.tier >= 3 else base
+
+    def should_shed(self, session_id: str, critical: bool, last_emotion: str) -> bool:
+        """Tier 4: score only a stable 1-in-N subset of low-value sessions"""
+        if critical or self.tier < 4 or last_emotion not in self.LOW_VALUE_EMOTIONS:
+            return False
+        return zlib.crc32(session_id.encode()) % self.low_value_sample_rate != 0
+
+    def report(self) -> Dict:
+        return {
+            'tier': self.tier,
+            'tier_name': self.TIERS[self.tier],
+            'queue_delay_ms': self.queue_delay * 1000,
+            'handling_ms': self.handling_time * 1000,
+            'latency_budget_ms': self.latency_budget * 1000,
+        }
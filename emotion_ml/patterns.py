@@ -0,0 +1,113 @@
+"""
+Pattern Library Index
+
+k-nearest-neighbour matching of session feature vectors against the
+labelled behavioral pattern library and its simulated variations.
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sklearn.neighbors import BallTree
+
+from emotion_ml.features import BehavioralFeatureExtractor, feature_vector
+from emotion_ml.library import EMOTION_MAP, load_training_module
+from emotion_ml.normalization import OnlineNormalizer
+
+
+def pattern_events(sequence: List[Dict], start: float = 0.0, step: float = 0.5) -> List[Dict]:
+    """Timestamp a library sequence (events `step` seconds apart, idles last their duration)"""
+    events, now = [], start
+    for event in sequence:
+        events.append(dict(event, timestamp=datetime.fromtimestamp(now).isoformat(timespec='milliseconds')))
+        duration = (event.get('data') or {}).get('duration') if event.get('type') in ('idle', 'micro_hesitation') else None
+        now += duration / 1000 if isinstance(duration, (int, float)) and duration > 0 else step
+    return events
+
+
+class PatternIndex:
+    """k-nearest-neighbour matcher over the labelled behavioral pattern library.
+
+    Points are the FEATURE_SCHEMA vectors of every library pattern and its
+    simulated variations, z-scored with the library's own statistics and
+    held in a ball tree (better than a KD tree at 30 dimensions). A query
+    returns the inverse-distance-weighted vote of the k nearest labelled
+    patterns plus their names, so the signal explains itself.
+    """
+
+    EMOTION_MAP = EMOTION_MAP  # Library labels -> service emotions
+
+    def __init__(self, values: np.ndarray, present: np.ndarray, emotions: List[str], names: List[str], k: int = 5):
+        self.normalizer = OnlineNormalizer(values.shape[1])
+        for row, mask in zip(values, present):
+            self.normalizer.update(row, mask)
+        self.emotions = tuple(sorted(set(emotions)))
+        self.labels = np.array([self.emotions.index(e) for e in emotions])
+        self.names = names
+        self.k = min(k, len(names))
+        self.tree = BallTree(self._points(values, present))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def from_library(cls, path: Optional[str] = None, variations: int = 20, seed: int = 7,
+                     k: int = 5) -> 'PatternIndex':
+        """Index the library patterns plus `variations` PatternSimulator variations of each"""
+        return cls(*cls.library_points(path, variations, seed), k=k)
+
+    @classmethod
+    def library_points(cls, path: Optional[str] = None, variations: int = 20,
+                       seed: int = 7) -> Tuple[np.ndarray, np.ndarray, List[str], List[str]]:
+        """(values, present, emotions, names) of the library patterns and their variations.
+
+        The slow part of building an index (one feature extraction per point),
+        so train-emotion-models.py saves it with the models (ModelArtifacts.patterns).
+        """
+        training = load_training_module(path)
+        simulator = training.PatternSimulator(seed=seed)
+        extractor = BehavioralFeatureExtractor()
+        rows, emotions, names = [], [], []
+        for label, patterns in simulator.library.patterns.items():
+            emotion = cls.EMOTION_MAP.get(label, label)
+            for pattern in patterns:
+                sequence = pattern['sequence']
+                samples = [sequence] + simulator.generate_variations(sequence, variations)
+                for i, sample in enumerate(samples):
+                    rows.append(feature_vector(extractor.extract_features(pattern_events(sample))))
+                    emotions.append(emotion)
+                    names.append(pattern['name'] if i == 0 else f"{pattern['name']}~{i}")
+        values, present = (np.array(columns) for columns in zip(*rows))
+        return values, present, emotions, names
+
+    def _points(self, values: np.ndarray, present: np.ndarray) -> np.ndarray:
+        points = np.array(values, dtype=float, ndmin=2)
+        present = np.array(present, ndmin=2)
+        for row, mask in zip(points, present):
+            self.normalizer.normalize(row, mask)
+        return points
+
+    def votes(self, values: np.ndarray, present: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(N, emotions) vote shares and (N, k) neighbour indices for a vector or block"""
+        distances, neighbours = self.tree.query(self._points(values, present), k=self.k)
+        weights = 1.0 / (distances + 1e-6)
+        votes = np.zeros((len(neighbours), len(self.emotions)))
+        np.add.at(votes, (np.arange(len(neighbours))[:, None], self.labels[neighbours]), weights)
+        return votes / votes.sum(axis=1, keepdims=True), neighbours
+
+    def match_block(self, values: np.ndarray, present: np.ndarray) -> List[Dict]:
+        """Best pattern-library emotion per row, its vote share and the patterns behind it"""
+        votes, neighbours = self.votes(values, present)
+        best = votes.argmax(axis=1)
+        return [
+            {
+                'emotion': self.emotions[best[i]],
+                'score': float(votes[i, best[i]]),
+                'neighbors': [self.names[n] for n in neighbours[i]],
+            }
+            for i in range(len(best))
+        ]
+
+    def match(self, values: np.ndarray, present: np.ndarray) -> Dict:
+        return self.match_block(values, present)[0]
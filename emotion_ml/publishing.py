@@ -0,0 +1,129 @@
+"""
+Publish Policy
+
+Decides which scoring results are worth publishing on EMOTIONS.state, with
+per-emotion hysteresis, dwell times and rate limits.
+"""
+
+import json
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class PublishPolicy:
+    """Per-emotion publish rules compiled into arrays indexed by emotion code.
+
+    Replaces the chain of publish conditions with one table lookup per
+    decision. Each emotion has:
+        enter          - score the emotion needs to take over the published state
+        exit           - score below which the published emotion releases it early
+        min_dwell      - seconds the published emotion holds before others may replace it
+        max_per_minute - publish rate cap per session while the emotion holds
+        min_delta      - confidence change needed to republish the same emotion
+
+    The first publish for a session is never delayed, and a critical emotion
+    replacing a non-critical one skips dwell and rate limits.
+
+    Config (JSON, path in ML_PUBLISH_POLICY) overrides rows of the table:
+        {"default": {"min_delta": 0.1}, "emotions": {"price_shock": {"min_dwell": 2}}}
+    """
+
+    CRITICAL_EMOTIONS = ('price_shock', 'sticker_shock', 'abandonment_intent', 'exit_risk', 'frustration', 'confusion')
+    DEFAULTS = {'enter': 0.55, 'exit': 0.40, 'min_dwell': 15.0, 'max_per_minute': 4.0, 'min_delta': 0.10}
+    EMOTION_DEFAULTS = {
+        **{emotion: {'enter': 0.50, 'exit': 0.35, 'min_dwell': 5.0, 'max_per_minute': 12.0}
+           for emotion in CRITICAL_EMOTIONS},
+        'engagement': {'enter': 0.50, 'min_dwell': 30.0, 'max_per_minute': 2.0, 'min_delta': 0.15},
+        'curiosity': {'enter': 0.50, 'min_dwell': 30.0, 'max_per_minute': 2.0, 'min_delta': 0.15},
+    }
+    REASONS = ('first', 'switch', 'critical', 'confidence')
+    SUPPRESSIONS = ('enter', 'dwell', 'rate', 'delta')
+
+    def __init__(self, emotions, config: Optional[Dict] = None):
+        config = config or {}
+        defaults = {**self.DEFAULTS, **config.get('default', {})}
+        overrides = config.get('emotions', {})
+        # Last row serves emotions the table doesn't know (e.g. tenant-only rules)
+        self.emotions = tuple(emotions) + ('other',)
+        self.codes = {emotion: code for code, emotion in enumerate(self.emotions)}
+        rows = [
+            {**defaults, **self.EMOTION_DEFAULTS.get(emotion, {}), **overrides.get(emotion, {})}
+            for emotion in self.emotions
+        ]
+        self.enter = np.array([row['enter'] for row in rows], dtype=float)
+        self.exit = np.array([row['exit'] for row in rows], dtype=float)
+        self.min_dwell = np.array([row['min_dwell'] for row in rows], dtype=float)
+        self.min_interval = np.array([60.0 / max(row['max_per_minute'], 1e-6) for row in rows], dtype=float)
+        self.min_delta = np.array([row['min_delta'] for row in rows], dtype=float)
+        self.critical = np.array([emotion in self.CRITICAL_EMOTIONS for emotion in self.emotions])
+
+        self.published = Counter()
+        self.suppressed = Counter()
+
+    @classmethod
+    def from_file(cls, path: Optional[str], emotions) -> 'PublishPolicy':
+        if not path:
+            return cls(emotions)
+        with open(path) as f:
+            policy = cls(emotions, json.load(f))
+        print(f"📮 Loaded publish policy from {path}")
+        return policy
+
+    def code(self, emotion: str) -> int:
+        return self.codes.get(emotion, len(self.emotions) - 1)
+
+    def decide(self, state: Optional[List], emotion: str, confidence: float,
+               scores: Dict[str, float], now: float) -> Tuple[bool, str]:
+        """(publish, reason) for a session's new result.
+
+        `state` is the session's published state [code, confidence, entered_at,
+        published_at], or None before its first publish.
+        """
+        code = self.code(emotion)
+        if state is None:
+            return self._publish('first')
+
+        current, last_confidence, entered_at, published_at = state
+        if code == current:
+            if now - published_at < self.min_interval[code]:
+                return self._suppress('rate')
+            if abs(confidence - last_confidence) <= self.min_delta[code]:
+                return self._suppress('delta')
+            return self._publish('confidence')
+
+        if scores.get(emotion, 0.0) < self.enter[code]:
+            return self._suppress('enter')
+        if self.critical[code] and not self.critical[current]:
+            return self._publish('critical')
+        # Hysteresis: the published emotion holds for its dwell time unless its own score has dropped out
+        held = scores.get(self.emotions[current], 0.0) >= self.exit[current]
+        if held and now - entered_at < self.min_dwell[current]:
+            return self._suppress('dwell')
+        if now - published_at < self.min_interval[code]:
+            return self._suppress('rate')
+        return self._publish('switch')
+
+    def record(self, state: Optional[List], emotion: str, confidence: float, now: float) -> List:
+        """Published state after publishing `emotion` (entered_at kept while the emotion holds)"""
+        code = self.code(emotion)
+        entered_at = state[2] if state is not None and state[0] == code else now
+        return [code, confidence, entered_at, now]
+
+    def _publish(self, reason: str) -> Tuple[bool, str]:
+        self.published[reason] += 1
+        return True, reason
+
+    def _suppress(self, reason: str) -> Tuple[bool, str]:
+        self.suppressed[reason] += 1
+        return False, reason
+
+    def report(self) -> Dict:
+        published = sum(self.published.values())
+        suppressed = sum(self.suppressed.values())
+        return {
+            'published': {reason: self.published[reason] for reason in self.REASONS},
+            'suppressed': {reason: self.suppressed[reason] for reason in self.SUPPRESSIONS},
+            'suppression_rate': suppressed / max(published + suppressed, 1),
+        }
@@ -0,0 +1,80 @@
+"""
+Tenant Scheduling
+
+Weighted fair queuing of the sessions waiting to be scored, so one tenant's
+burst cannot starve the others. Weights come from the service's
+TenantRegistry.
+"""
+
+import asyncio
+import heapq
+from collections import defaultdict, deque
+from typing import Callable, Dict, Tuple
+
+DEFAULT_TENANT = 'default'  # Events that carry no tenantId
+
+
+class TenantScheduler:
+    """Weighted fair queue of sessions waiting to be scored.
+
+    Each tenant has a FIFO of session ids. Every queued session gets a virtual
+    finish tag of max(virtual_time, tenant's last tag) + 1 / weight, and the
+    scheduler always serves the smallest tag (self-clocked fair queuing), so
+    a tenant with a burst of sessions can't starve the others.
+    """
+
+    def __init__(self, weight: Callable[[str], float]):
+        self.weight = weight
+        self.queues = defaultdict(deque)  # tenant -> deque of (tag, session_id)
+        self.queued = set()
+        self.last_tag = defaultdict(float)
+        self.served = defaultdict(int)
+        self.virtual_time = 0.0
+        self._heap = []  # (head tag, seq, tenant) for tenants with queued sessions
+        self._seq = 0
+        self._ready = asyncio.Event()
+
+    @property
+    def depth(self) -> int:
+        return len(self.queued)
+
+    def push(self, tenant_id: str, session_id: str) -> bool:
+        """Queue a session for scoring (no-op if it is already queued)"""
+        if session_id in self.queued:
+            return False
+        tag = max(self.virtual_time, self.last_tag[tenant_id]) + 1.0 / max(self.weight(tenant_id), 1e-6)
+        self.last_tag[tenant_id] = tag
+        queue = self.queues[tenant_id]
+        if not queue:
+            self._push_head(tag, tenant_id)
+        queue.append((tag, session_id))
+        self.queued.add(session_id)
+        self._ready.set()
+        return True
+
+    def pop(self) -> Tuple[str, str]:
+        _, _, tenant_id = heapq.heappop(self._heap)
+        queue = self.queues[tenant_id]
+        tag, session_id = queue.popleft()
+        self.virtual_time = tag
+        if queue:
+            self._push_head(queue[0][0], tenant_id)
+        else:
+            del self.queues[tenant_id]
+        self.queued.discard(session_id)
+        self.served[tenant_id] += 1
+        return tenant_id, session_id
+
+    async def get(self) -> Tuple[str, str]:
+        while not self._heap:
+            self._ready.clear()
+            await self._ready.wait()
+        return self.pop()
+
+    def _push_head(self, tag: float, tenant_id: str):
+        self._seq += 1
+        heapq.heappush(self._heap, (tag, self._seq, tenant_id))
+
+    def report(self) -> Dict:
+        tenants = set(self.served) | set(self.queues)
+        return {t: {'queued': len(self.queues.get(t, ())), 'scored': self.served[t]} for t in tenants}
@@ -0,0 +1,304 @@
+"""
+Event Sequence Models
+
+Order-aware scoring of a session's event stream: semi-global edit distance
+against the library's event sequences (SequenceMatcher) and per-emotion
+Markov models of event transitions (TransitionModel). Both keep a small
+per-session state that is advanced as events arrive.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from emotion_ml.library import EMOTION_MAP, load_training_module
+
+
+def event_token(event: Dict) -> str:
+    """Event type, refined where the library's sequences hinge on it (mouse speed, scroll direction)"""
+    event_type = event.get('type') or 'unknown'
+    data = event.get('data') if isinstance(event.get('data'), dict) else {}
+    if event_type == 'mouse':
+        velocity = data.get('velocity')
+        if isinstance(velocity, (int, float)):
+            return 'mouse_fast' if velocity >= 500 else 'mouse_slow' if velocity < 50 else 'mouse'
+    elif event_type == 'scroll' and data.get('direction') in ('up', 'down'):
+        return f"scroll_{data['direction']}"
+    return event_type
+
+
+class SequenceState:
+    """One session's incremental alignment state against every template (see SequenceMatcher)"""
+
+    __slots__ = ('columns', 'best', 'active', 'pending', 'stale')
+
+    def __init__(self, columns: np.ndarray, best: np.ndarray, active: np.ndarray):
+        self.columns = columns  # (templates, max_len + 1) edit distance of each template prefix ending now
+        self.best = best        # (templates,) best full-template distance, aged by `decay` per event
+        self.active = active    # (templates,) column differs from the fresh one
+        self.pending = []       # Codes that arrived since the last advance (at most max_pending)
+        self.stale = False      # An event arrived out of order; rebuild from the window before reading
+
+
+class SequenceMatcher:
+    """Ordered template matching of a session's event stream against the pattern library.
+
+    Semi-global edit distance: a template must be matched in full but may
+    start anywhere in the stream. Missing or substituted template events
+    cost 1, extra stream events inside a match cost `gap_cost`, and a
+    match's distance ages by `decay` per later event.
+
+    The DP runs one template position at a time, vectorized over templates
+    and over every new stream event; the in-row dependency
+    D[i][j] = min(b[j], D[i][j-1] + gap) is a cumulative minimum
+    (D = cummin(b - gap*j) + gap*j). Sessions keep the last column, so only
+    events since the previous score are processed. Distances are capped
+    just past each template's cutoff, which leaves untouched templates at a
+    fixed "fresh" column: only templates mid-match or containing one of the
+    new codes are advanced.
+
+    Scoring a whole window (batch scoring) first prunes templates with a
+    bag-of-codes lower bound: each template code the window lacks costs at
+    least 1.
+    """
+
+    def __init__(self, templates: List[Tuple[str, str, List[str]]], min_similarity: float = 0.6,
+                 gap_cost: float = 0.5, decay: float = 0.1):
+        self.names = [name for name, _, _ in templates]
+        self.emotions = [emotion for _, emotion, _ in templates]
+        self.vocab = {}
+        for _, _, tokens in templates:
+            for token in tokens:
+                self.vocab.setdefault(token, len(self.vocab))
+        self.other = len(self.vocab)  # Code for tokens no template uses
+        self.gap_cost = gap_cost
+        self.decay = decay
+        self.min_similarity = min_similarity
+
+        n, width = len(templates), max(len(tokens) for _, _, tokens in templates)
+        self.lengths = np.array([len(tokens) for _, _, tokens in templates])
+        self.codes = np.full((n, width), -1, dtype=np.int32)
+        self.bags = np.zeros((n, self.other + 1), dtype=np.int32)
+        for i, (_, _, tokens) in enumerate(templates):
+            self.codes[i, :len(tokens)] = [self.vocab[token] for token in tokens]
+            np.add.at(self.bags[i], self.codes[i, :len(tokens)], 1)
+        self.contains = self.bags > 0
+        # Substitution cost of every code at every template position: (position, code, template)
+        self.mismatch = (self.codes.T[:, None, :] != np.arange(self.other + 1)[None, :, None]).astype(float)
+        self.valid = np.arange(1, width + 1)[None, :] <= self.lengths[:, None]
+        self.cutoff = (1 - min_similarity) * self.lengths  # Largest distance still reported
+        self.cap = self.cutoff + 1
+        self.fresh = np.minimum(np.arange(width + 1)[None, :], self.cap[:, None])
+        self.max_pending = width  # Codes a session buffers before they are folded in unscored
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def from_library(cls, path: Optional[str] = None, variations: int = 0, seed: int = 7,
+                     **kwargs) -> 'SequenceMatcher':
+        """Templates from every library pattern (plus optional simulated variations)"""
+        training = load_training_module(path)
+        simulator = training.PatternSimulator(seed=seed)
+        templates = []
+        for label, patterns in simulator.library.patterns.items():
+            emotion = EMOTION_MAP.get(label, label)
+            for pattern in patterns:
+                templates.append((pattern['name'], emotion, [event_token(e) for e in pattern['sequence']]))
+                for i, variation in enumerate(simulator.generate_variations(pattern['sequence'], variations)):
+                    templates.append((f"{pattern['name']}~{i + 1}", emotion, [event_token(e) for e in variation]))
+        return cls([tpl for tpl in templates if tpl[2]], **kwargs)
+
+    def code(self, event: Dict) -> int:
+        return self.vocab.get(event_token(event), self.other)
+
+    def encode(self, events: List[Dict]) -> np.ndarray:
+        return np.array([self.code(e) for e in events], dtype=np.intp)
+
+    def new_state(self) -> SequenceState:
+        return SequenceState(self.fresh.copy(), np.full(len(self), np.inf), np.zeros(len(self), dtype=bool))
+
+    def _run(self, columns: np.ndarray, rows: np.ndarray, codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Align templates `rows` from `columns` over `codes`: (final columns, best aged distance)"""
+        n = len(codes)
+        mismatch = self.mismatch[:, codes[:, None], rows[None, :]].transpose(0, 2, 1)  # (position, row, event)
+        ramp = self.gap_cost * np.arange(n + 1)
+        age = self.decay * np.arange(n - 1, -1, -1)  # Decay from each end event to the last one
+        cap = self.cap[rows, None]
+        lengths = self.lengths[rows]
+        final = np.empty_like(columns)
+        final[:, 0] = 0.0
+        best = np.full(len(rows), np.inf)
+        previous = np.zeros((len(rows), n + 1))  # Empty template prefix: free start anywhere
+        for i in range(1, columns.shape[1]):
+            row = np.empty_like(previous)
+            row[:, 0] = columns[:, i]
+            np.minimum(previous[:, :-1] + mismatch[i - 1], previous[:, 1:] + 1, out=row[:, 1:])
+            row -= ramp
+            np.minimum.accumulate(row, axis=1, out=row)
+            row += ramp
+            np.minimum(row, cap, out=row)
+            final[:, i] = row[:, -1]
+            ending = lengths == i
+            if ending.any():
+                best[ending] = (row[ending, 1:] + age).min(axis=1)
+            previous = row
+        return final, best
+
+    def extend(self, state: SequenceState, codes):
+        """Advance a session state over new event codes"""
+        codes = np.asarray(codes, dtype=np.intp)
+        if not len(codes):
+            return
+        state.best += self.decay * len(codes)
+        rows = np.flatnonzero(state.active | self.contains[:, codes].any(axis=1))
+        if len(rows):
+            columns, best = self._run(state.columns[rows], rows, codes)
+            state.columns[rows] = columns
+            state.active[rows] = ((columns[:, 1:] < self.fresh[rows, 1:]) & self.valid[rows]).any(axis=1)
+            state.best[rows] = np.minimum(state.best[rows], best)
+
+    def push(self, state: SequenceState, code: int):
+        """Queue an in-order event's code for the next advance.
+
+        Sessions that are shed or below min_events are not advanced, so once
+        a longest template's worth of codes is waiting they are folded in
+        here (the same result as folding them in later, in bounded memory).
+        """
+        if state.stale:
+            return  # Rebuilt from the window at the next advance
+        state.pending.append(code)
+        if len(state.pending) >= self.max_pending:
+            self.extend(state, state.pending)
+            state.pending = []
+
+    def advance(self, state: SequenceState, window: Optional[List[Dict]] = None) -> SequenceState:
+        """Apply pending codes, or rebuild from `window` after out-of-order delivery"""
+        if state.stale and window is not None:
+            fresh = self.new_state()
+            self.extend(fresh, self.encode(window))
+            state.columns, state.best, state.active, state.stale = fresh.columns, fresh.best, fresh.active, False
+        else:
+            self.extend(state, state.pending)
+        state.pending = []
+        return state
+
+    def match_window(self, codes: np.ndarray, top: int = 3) -> List[Dict]:
+        """Best template matches over a whole code sequence, pruned by the bag-of-codes bound"""
+        codes = np.asarray(codes, dtype=np.intp)
+        window_bag = np.bincount(codes, minlength=self.other + 1)
+        lower_bound = np.maximum(self.bags - window_bag, 0).sum(axis=1)
+        rows = np.flatnonzero(lower_bound <= self.cutoff)
+        best = np.full(len(self), np.inf)
+        if len(rows) and len(codes):
+            _, best[rows] = self._run(self.fresh[rows], rows, codes)
+        return self._top(best, top)
+
+    def matches(self, state: SequenceState, top: int = 3) -> List[Dict]:
+        return self._top(state.best, top)
+
+    def _top(self, best: np.ndarray, top: int) -> List[Dict]:
+        similarity = 1 - best / self.lengths
+        matched = best <= self.cutoff + 1e-9  # Decay is summed per event or per run: allow rounding
+        ranked = [i for i in np.argsort(-similarity, kind='stable')[:top] if matched[i]]
+        return [{'pattern': self.names[i], 'emotion': self.emotions[i], 'similarity': round(float(similarity[i]), 3)}
+                for i in ranked]
+
+
+class TransitionState:
+    """One session's decayed per-emotion log-likelihood ratios (see TransitionModel)"""
+
+    __slots__ = ('loglik', 'previous', 'stale')
+
+    def __init__(self, emotions: int, start: int):
+        self.loglik = np.zeros(emotions)
+        self.previous = start
+        self.stale = False  # An event arrived out of order; rebuild from the window before reading
+
+
+class TransitionModel:
+    """First-order Markov models of event-type transitions, one per emotion.
+
+    Fitted offline from labelled sequences: table[e, a, b] is
+    log P_e(b | a) - log P_background(b | a), with Laplace smoothing and the
+    background pooled over all emotions. A session's state is the decayed
+    sum of those log-ratios, so each event costs one lookup per emotion and
+    the score tracks the recent ordering of events rather than all of
+    history. evidence() maps the ratios through a sigmoid and reports the
+    emotions the sequence clearly favours, as floors for _detect_emotions.
+    """
+
+    def __init__(self, vocab: Dict[str, int], emotions: Tuple[str, ...], table: np.ndarray,
+                 decay: float = 0.8, temperature: float = 1.0, threshold: float = 0.85, weight: float = 0.75):
+        self.vocab = vocab
+        self.other = len(vocab)      # Code for tokens never seen in training
+        self.start = len(vocab) + 1  # Row for the first event of a session
+        self.emotions = emotions
+        self.table = table
+        self.decay = decay
+        self.temperature = temperature
+        self.threshold = threshold
+        self.weight = weight
+
+    @classmethod
+    def fit(cls, sequences: List[Tuple[List[str], str]], alpha: float = 0.5, **kwargs) -> 'TransitionModel':
+        """Fit from (token sequence, emotion) pairs"""
+        vocab = {}
+        for tokens, _ in sequences:
+            for token in tokens:
+                vocab.setdefault(token, len(vocab))
+        emotions = tuple(sorted({emotion for _, emotion in sequences}))
+        size = len(vocab) + 2  # Tokens, other, start
+        counts = np.zeros((len(emotions), size, size))
+        for tokens, emotion in sequences:
+            codes = [len(vocab) + 1] + [vocab[token] for token in tokens]
+            np.add.at(counts[emotions.index(emotion)], (codes[:-1], codes[1:]), 1)
+
+        def log_probs(c):
+            return np.log((c + alpha) / (c.sum(axis=-1, keepdims=True) + alpha * size))
+
+        table = log_probs(counts) - log_probs(counts.sum(axis=0))[None]
+        return cls(vocab, emotions, table, **kwargs)
+
+    @classmethod
+    def from_library(cls, path: Optional[str] = None, variations: int = 20, seed: int = 7,
+                     **kwargs) -> 'TransitionModel':
+        """Fit on every library pattern plus `variations` simulated variations of each"""
+        training = load_training_module(path)
+        simulator = training.PatternSimulator(seed=seed)
+        sequences = []
+        for label, patterns in simulator.library.patterns.items():
+            emotion = EMOTION_MAP.get(label, label)
+            for pattern in patterns:
+                sequences.append(([event_token(e) for e in pattern['sequence']], emotion))
+                for variation in simulator.generate_variations(pattern['sequence'], variations):
+                    sequences.append(([event_token(e) for e in variation], emotion))
+        return cls.fit(sequences, **kwargs)
+
+    def code(self, event: Dict) -> int:
+        return self.vocab.get(event_token(event), self.other)
+
+    def new_state(self) -> TransitionState:
+        return TransitionState(len(self.emotions), self.start)
+
+    def update(self, state: TransitionState, code: int):
+        state.loglik *= self.decay
+        state.loglik += self.table[:, state.previous, code]
+        state.previous = code
+
+    def rebuild(self, state: TransitionState, events: List[Dict]):
+        """Reset a state and replay a window (after out-of-order delivery)"""
+        state.loglik[:] = 0.0
+        state.previous = self.start
+        for event in events:
+            self.update(state, self.code(event))
+        state.stale = False
+
+    def scores(self, loglik: np.ndarray) -> np.ndarray:
+        return 1.0 / (1.0 + np.exp(-loglik / self.temperature))
+
+    def evidence(self, state: TransitionState) -> Dict[str, float]:
+        """Emotions the recent event order clearly favours -> score floor"""
+        scores = self.scores(state.loglik)
+        return {self.emotions[e]: round(float(self.weight * scores[e]), 4)
+                for e in np.flatnonzero(scores >= self.threshold)}
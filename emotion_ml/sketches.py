@@ -0,0 +1,300 @@
+"""
+Fixed-memory traffic sketches
+
+Quantile (DDSketch-style), count-min and HyperLogLog sketches, and the
+per-tenant TrafficSketches the service snapshots to ML.sketches.<tenant>.
+Every sketch merges with another of the same layout, so snapshots can be
+summed across intervals and instances.
+"""
+
+import hashlib
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+@lru_cache(maxsize=65536)
+def _sketch_hash(key: str) -> int:
+    """64-bit hash shared by the count-min and HyperLogLog sketches (cached: keys repeat a lot)"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+
+
+class QuantileSketch:
+    """Relative-error quantile sketches for a block of features (DDSketch-style).
+
+    A value x lands in bucket ceil(log_gamma(|x|)), gamma = (1 + a) / (1 - a),
+    so every quantile is returned within a relative error `a`. The bucket
+    range is fixed by (relative_accuracy, min_value, max_value): magnitudes
+    below min_value count as zero and ones above max_value land in the last
+    bucket. Memory is constant and sketches with the same layout merge (and
+    compare) bin by bin.
+    """
+
+    def __init__(self, features: Tuple[str, ...], relative_accuracy: float = 0.02,
+                 min_value: float = 1e-3, max_value: float = 1e7):
+        self.features = features
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(gamma)
+        self.key_offset = int(np.ceil(np.log(min_value) / self.log_gamma))
+        self.bins = int(np.ceil(np.log(max_value) / self.log_gamma)) - self.key_offset + 1
+        self.zero = self.bins  # Layout: [negative buckets, largest first | zero | positive buckets]
+        self.counts = np.zeros((len(features), 2 * self.bins + 1), dtype=np.float32)
+
+        # Representative value per bucket (DDSketch's midpoint estimate)
+        magnitudes = 2 * gamma ** np.arange(self.key_offset, self.key_offset + self.bins) / (gamma + 1)
+        self.bin_values = np.concatenate([-magnitudes[::-1], [0.0], magnitudes])
+
+    @property
+    def layout(self) -> Tuple:
+        return self.features, self.relative_accuracy, self.min_value, self.max_value
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.counts.nbytes
+
+    def _index(self, values: np.ndarray) -> np.ndarray:
+        magnitude = np.abs(values)
+        with np.errstate(divide='ignore'):
+            keys = np.ceil(np.log(np.maximum(magnitude, self.min_value)) / self.log_gamma) - self.key_offset
+        keys = np.clip(keys, 0, self.bins - 1).astype(np.intp)
+        index = np.where(values < 0, self.zero - 1 - keys, self.zero + 1 + keys)
+        return np.where(magnitude < self.min_value, self.zero, index)
+
+    def add(self, values: np.ndarray, present: np.ndarray):
+        """Count one feature vector, or an (N, features) block; absent features are skipped"""
+        present = present & np.isfinite(values)
+        if values.ndim == 1:
+            rows = np.flatnonzero(present)
+            self.counts[rows, self._index(values[rows])] += 1  # One bucket per row - no collisions
+        else:
+            _, rows = np.nonzero(present)
+            np.add.at(self.counts, (rows, self._index(values[present])), 1)
+
+    def merge(self, other: 'QuantileSketch', weight: float = 1.0):
+        if other.layout != self.layout:
+            raise ValueError('quantile sketches have different layouts')
+        self.counts += other.counts * weight
+
+    def scale(self, factor: float):
+        """Decay every count (old traffic weighs less in a running baseline)"""
+        self.counts *= factor
+
+    def clear(self):
+        self.counts[:] = 0
+
+    def totals(self) -> np.ndarray:
+        return self.counts.sum(axis=1)
+
+    def quantiles(self, qs=(0.5, 0.9, 0.99)) -> np.ndarray:
+        """(features, len(qs)) quantile estimates; NaN for features never seen"""
+        cumulative = np.cumsum(self.counts, axis=1)
+        totals = cumulative[:, -1:]
+        ranks = np.asarray(qs)[None, :] * np.maximum(totals - 1, 0)
+        index = np.minimum((cumulative[:, None, :] <= ranks[:, :, None]).sum(axis=2), self.counts.shape[1] - 1)
+        estimates = self.bin_values[index]
+        estimates[totals[:, 0] == 0] = np.nan
+        return estimates
+
+    def distance(self, other: 'QuantileSketch') -> np.ndarray:
+        """Per-feature Kolmogorov-Smirnov distance between two sketches (NaN if either is empty).
+
+        Both share one bucket grid, so the CDFs are compared exactly at every
+        bucket edge - drift detection without keeping raw values.
+        """
+        if other.layout != self.layout:
+            raise ValueError('quantile sketches have different layouts')
+        a, b = np.cumsum(self.counts, axis=1), np.cumsum(other.counts, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.abs(a / a[:, -1:] - b / b[:, -1:]).max(axis=1)
+
+    def to_dict(self) -> Dict:
+        """Sparse, JSON-safe form: {feature: [[bucket, count], ...]} plus the layout"""
+        rows, cols = np.nonzero(self.counts)
+        bins = defaultdict(list)
+        for row, col, count in zip(rows.tolist(), cols.tolist(), self.counts[rows, cols].tolist()):
+            bins[self.features[row]].append([col, count])
+        return {'relative_accuracy': self.relative_accuracy, 'min_value': self.min_value,
+                'max_value': self.max_value, 'bins': dict(bins)}
+
+    @classmethod
+    def from_dict(cls, data: Dict, features: Tuple[str, ...]) -> 'QuantileSketch':
+        sketch = cls(features, data['relative_accuracy'], data['min_value'], data['max_value'])
+        index = {name: i for i, name in enumerate(features)}
+        for name, pairs in data['bins'].items():
+            if name in index and pairs:
+                cols, counts = zip(*pairs)
+                sketch.counts[index[name], list(cols)] = counts
+        return sketch
+
+
+class CountMinSketch:
+    """Count-min frequency sketch with a small heavy-hitter table for reporting.
+
+    Each row takes its own bit slice of one 64-bit hash, so width must be a
+    power of two and depth * log2(width) <= 64.
+    """
+
+    def __init__(self, width: int = 512, depth: int = 4, top_k: int = 16):
+        self.bits = width.bit_length() - 1
+        if width != 1 << self.bits or depth * self.bits > 64:
+            raise ValueError('count-min width must be a power of two with depth * log2(width) <= 64')
+        self.width = width
+        self.depth = depth
+        self.top_k = top_k
+        self.table = np.zeros((depth, width), dtype=np.uint32)
+        self.rows = np.arange(depth)
+        self.shifts = (self.rows * self.bits).astype(np.uint64)
+        self.total = 0
+        self.top = {}  # key -> estimate, at most top_k entries
+
+    def _columns(self, key: str) -> np.ndarray:
+        return ((np.uint64(_sketch_hash(key)) >> self.shifts) & np.uint64(self.width - 1)).astype(np.intp)
+
+    def add(self, key: str, count: int = 1) -> int:
+        columns = self._columns(key)
+        self.table[self.rows, columns] += count
+        self.total += count
+        estimate = int(self.table[self.rows, columns].min())
+        if key in self.top or len(self.top) < self.top_k:
+            self.top[key] = estimate
+        else:
+            smallest = min(self.top, key=self.top.get)
+            if estimate > self.top[smallest]:
+                del self.top[smallest]
+                self.top[key] = estimate
+        return estimate
+
+    def estimate(self, key: str) -> int:
+        return int(self.table[self.rows, self._columns(key)].min())
+
+    def merge(self, other: 'CountMinSketch'):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError('count-min sketches have different shapes')
+        self.table += other.table
+        self.total += other.total
+        for key in set(self.top) | set(other.top):
+            self.top[key] = self.estimate(key)
+        for key in sorted(self.top, key=self.top.get)[:max(len(self.top) - self.top_k, 0)]:
+            del self.top[key]
+
+    def clear(self):
+        self.table[:] = 0
+        self.total = 0
+        self.top.clear()
+
+    def heavy_hitters(self) -> Dict[str, int]:
+        return dict(sorted(self.top.items(), key=lambda item: -item[1]))
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.table.nbytes
+
+
+class HyperLogLog:
+    """Distinct-count sketch: 2^precision one-byte registers, ~1.04/sqrt(2^p) standard error"""
+
+    def __init__(self, precision: int = 12):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = np.zeros(self.size, dtype=np.uint8)
+        self.alpha = 0.7213 / (1 + 1.079 / self.size)
+        self.rest_bits = 64 - precision
+
+    def add(self, key: str):
+        h = _sketch_hash(key)
+        index = h >> self.rest_bits
+        rank = self.rest_bits - (h & ((1 << self.rest_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> float:
+        estimate = self.alpha * self.size ** 2 / np.ldexp(1.0, -self.registers.astype(np.int32)).sum()
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.size and zeros:
+            return self.size * np.log(self.size / zeros)  # Linear counting for small cardinalities
+        return float(estimate)
+
+    def merge(self, other: 'HyperLogLog'):
+        if other.precision != self.precision:
+            raise ValueError('HyperLogLog sketches have different precisions')
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def clear(self):
+        self.registers[:] = 0
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.registers.nbytes
+
+
+class TrafficSketches:
+    """One tenant's fixed-memory traffic summary.
+
+    Per snapshot interval: quantile sketches of every scored feature vector,
+    a count-min sketch of event types and a HyperLogLog of active sessions.
+    `snapshot()` closes the interval, measures per-feature drift against a
+    decayed baseline of earlier intervals, folds the interval into that
+    baseline and starts a new one.
+    """
+
+    def __init__(self, features: Tuple[str, ...], baseline_decay: float = 0.9, relative_accuracy: float = 0.02):
+        self.features = QuantileSketch(features, relative_accuracy=relative_accuracy)
+        self.baseline = QuantileSketch(features, relative_accuracy=relative_accuracy)
+        self.event_types = CountMinSketch()
+        self.sessions = HyperLogLog()
+        self.baseline_decay = baseline_decay
+        self.intervals = 0
+        self.scored = 0
+
+    @property
+    def memory_bytes(self) -> int:
+        return (self.features.memory_bytes + self.baseline.memory_bytes
+                + self.event_types.memory_bytes + self.sessions.memory_bytes)
+
+    def observe_event(self, session_id: str, event_type: Optional[str]):
+        self.event_types.add(event_type or 'unknown')
+        self.sessions.add(session_id)
+
+    def observe_features(self, values: np.ndarray, present: np.ndarray):
+        self.features.add(values, present)
+        self.scored += 1
+
+    def summary(self, sketch: QuantileSketch, qs=(0.5, 0.9, 0.99)) -> Dict[str, Dict[str, float]]:
+        quantiles = sketch.quantiles(qs)
+        totals = sketch.totals()
+        return {
+            name: {'n': float(totals[i]), **{f'p{round(q * 100)}': float(v) for q, v in zip(qs, quantiles[i])}}
+            for i, name in enumerate(sketch.features) if totals[i]
+        }
+
+    def snapshot(self, started_at: float, now: float, min_count: int = 50) -> Dict:
+        """Close the current interval; returns its summary, mergeable sketches and drift"""
+        drift = {}
+        if self.intervals:
+            distances = self.features.distance(self.baseline)
+            totals = self.features.totals()
+            drift = {name: float(distances[i]) for i, name in enumerate(self.features.features)
+                     if totals[i] >= min_count and np.isfinite(distances[i])}
+        snapshot = {
+            'interval': [started_at, now],
+            'scored': self.scored,
+            'events': self.event_types.total,
+            'active_sessions': round(self.sessions.count()),
+            'event_types': self.event_types.heavy_hitters(),
+            'features': self.summary(self.features),
+            'drift': drift,  # KS distance of this interval vs the baseline, per feature
+            'sketch': self.features.to_dict(),  # Sum these across intervals/instances to merge
+        }
+        self.baseline.scale(self.baseline_decay)
+        self.baseline.merge(self.features)
+        self.features.clear()
+        self.event_types.clear()
+        self.sessions.clear()
+        self.scored = 0
+        self.intervals += 1
+        return snapshot
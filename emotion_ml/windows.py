@@ -0,0 +1,139 @@
+"""
+Event-Time Windows
+
+Per-session buffers ordered by when events happened rather than when they
+arrived, with a watermark that bounds how late an event may still be.
+"""
+
+import heapq
+from collections import Counter, deque
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from emotion_ml.features import encode_event
+
+
+def parse_event_time(timestamp, default: float) -> float:
+    """Event timestamp (ISO string or epoch s/ms) -> epoch seconds"""
+    if isinstance(timestamp, (int, float)):
+        return timestamp / 1000.0 if timestamp > 1e11 else float(timestamp)
+    if isinstance(timestamp, str):
+        try:
+            return datetime.fromisoformat(timestamp).timestamp()
+        except ValueError:
+            pass
+    return default
+
+
+DIGEST_MASK = (1 << 128) - 1  # event_fingerprint() digests are 16 bytes
+
+
+class EventTimeWindow:
+    """A session's recent events ordered by event time, with a watermark.
+
+    Keeps the last `span` seconds of event time (and at most `max_events`).
+    The watermark trails the newest event time by `allowed_lateness`: events
+    behind it are dropped as too late, everything else is kept in order.
+    In-order events are appended to a deque and late ones pushed on a heap,
+    so an insert or eviction is O(log n); the ordered `events` view is merged
+    from both only when read (once per score). Each event is encoded for
+    columnar_features() when it arrives, and per-type counts are kept up to
+    date, so scheduling and scoring never re-parse the window.
+    """
+
+    def __init__(self, span: float = 30.0, allowed_lateness: float = 5.0, max_events: int = 50):
+        self.span = span
+        self.allowed_lateness = allowed_lateness
+        self.max_events = max_events
+        # Entries are (event_time, arrival_seq, digest, event, encoded row)
+        self._ordered = deque()  # In event-time order: arrivals at or past the newest event
+        self._late = []          # Heap of out-of-order arrivals
+        self._merged = None      # Cached ordered entries (see _entries)
+        self.type_counts = Counter()
+        self._seq = 0
+        self._sum = 0
+        self.max_event_time = None
+        self.newest_ingest_time = None  # When the event at max_event_time arrived
+
+    def __len__(self) -> int:
+        return len(self._ordered) + len(self._late)
+
+    @property
+    def watermark(self) -> float:
+        return float('-inf') if self.max_event_time is None else self.max_event_time - self.allowed_lateness
+
+    @property
+    def fingerprint(self) -> Tuple[int, int]:
+        """Cheap content fingerprint: sum of event digests mod 2^128, kept incrementally.
+
+        A sum rather than an XOR, so a digest that appears twice counts twice
+        instead of cancelling out.
+        """
+        return self._sum, len(self)
+
+    @property
+    def events(self) -> List[dict]:
+        """Event dicts in event-time order"""
+        return [entry[3] for entry in self._entries()]
+
+    @property
+    def rows(self) -> List[Optional[tuple]]:
+        """encode_event() rows, parallel to `events`"""
+        return [entry[4] for entry in self._entries()]
+
+    def has_any(self, event_types) -> bool:
+        return any(self.type_counts[event_type] for event_type in event_types)
+
+    def _entries(self) -> List[tuple]:
+        if self._merged is None:
+            if self._late:
+                # Fold the late arrivals in; everything is in order again afterwards
+                self._ordered = deque(heapq.merge(self._ordered, sorted(self._late)))
+                self._late = []
+            self._merged = list(self._ordered)
+        return self._merged
+
+    def add(self, event: dict, event_time: float, digest: bytes = b'',
+            ingest_time: Optional[float] = None) -> Tuple[bool, int]:
+        """Insert an event; returns (accepted, number of events evicted)"""
+        if event_time < self.watermark:
+            return False, 0
+
+        self._seq += 1
+        value = int.from_bytes(digest, 'little')
+        entry = (event_time, self._seq, value, event, encode_event(event))
+        if self._ordered and event_time < self._ordered[-1][0]:
+            heapq.heappush(self._late, entry)
+        else:
+            self._ordered.append(entry)
+        self._merged = None
+        self._sum = (self._sum + value) & DIGEST_MASK
+        self.type_counts[event.get('type')] += 1
+
+        if self.max_event_time is None or event_time >= self.max_event_time:
+            self.max_event_time = event_time
+            self.newest_ingest_time = ingest_time
+        return True, self._evict()
+
+    def _evict(self) -> int:
+        """Drop events older than the span, then the oldest beyond max_events"""
+        cutoff = self.max_event_time - self.span
+        n = 0
+        while self._ordered or self._late:
+            late = bool(self._late) and (not self._ordered or self._late[0] < self._ordered[0])
+            oldest = self._late[0] if late else self._ordered[0]
+            if oldest[0] >= cutoff and len(self) <= self.max_events:
+                break
+            if late:
+                heapq.heappop(self._late)
+            else:
+                self._ordered.popleft()
+            self._sum = (self._sum - oldest[2]) & DIGEST_MASK
+            event_type = oldest[3].get('type')
+            self.type_counts[event_type] -= 1
+            if not self.type_counts[event_type]:
+                del self.type_counts[event_type]
+            n += 1
+        if n:
+            self._merged = None
+        return n
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Telemetry Capture & Replay Harness
+
+Records live TELEMETRY.events traffic to a compact append-only file, then
+replays it into MLEmotionService through an in-process fake NATS connection,
+so production load can be reproduced offline without a broker.
+
+  python3 telemetry-replay.py record capture.siq
+  python3 telemetry-replay.py replay capture.siq --speed 10 --emit build-a.jsonl
+  python3 telemetry-replay.py replay capture.siq --speed max --report report.json
+"""
+
+import argparse
+import asyncio
+import gzip
+import importlib.util
+import json
+import os
+import struct
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+CAPTURE_MAGIC = b'SIQTEL1\n'
+RECORD_HEADER = struct.Struct('<dI')  # arrival time (epoch seconds), payload length
+
+
+def load_service_module():
+    """Import emotion-ml-service.py (hyphenated, so not importable by name)"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'emotion-ml-service.py')
+    spec = importlib.util.spec_from_file_location('emotion_ml_service', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module  # So pickling (e.g. the batch scoring pool) can find it
+    spec.loader.exec_module(module)
+    return module
+
+
+def _open_capture(path: str, mode: str):
+    return gzip.open(path, mode) if path.endswith('.gz') else open(path, mode)
+
+
+class TelemetryRecorder:
+    """Appends raw telemetry payloads with arrival timestamps to a capture file.
+
+    Each record is a fixed 12-byte header (arrival time, length) followed by
+    the message bytes exactly as received - no re-encoding. Files ending in
+    .gz are written as gzip members, which also append cleanly.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = _open_capture(path, 'ab')
+        if new_file:
+            self.file.write(CAPTURE_MAGIC)
+        self.records = 0
+        self.bytes = 0
+
+    def write(self, payload: bytes, arrival: Optional[float] = None):
+        self.file.write(RECORD_HEADER.pack(arrival if arrival is not None else time.time(), len(payload)))
+        self.file.write(payload)
+        self.records += 1
+        self.bytes += len(payload)
+
+    def close(self):
+        self.file.close()
+
+    async def record(self, nats_url: str = 'nats://localhost:4222', subject: str = 'TELEMETRY.events',
+                     duration: Optional[float] = None):
+        """Capture live traffic until interrupted (or for `duration` seconds)"""
+        import nats
+
+        nc = await nats.connect(nats_url)
+
+        async def on_message(msg):
+            self.write(msg.data)
+            if self.records % 1000 == 0:
+                self.file.flush()
+                print(f"💾 {self.records} messages ({self.bytes / 1024:.0f} KB)")
+
+        await nc.subscribe(subject, cb=on_message)
+        print(f"🎙️  Recording {subject} → {self.path}")
+        try:
+            if duration:
+                await asyncio.sleep(duration)
+            else:
+                await asyncio.Event().wait()
+        finally:
+            await nc.drain()
+            self.close()
+            print(f"✅ Recorded {self.records} messages ({self.bytes / 1024:.0f} KB)")
+
+
+def read_capture(path: str) -> Iterator[Tuple[float, bytes]]:
+    """Yield (arrival_time, payload) records from a capture file"""
+    with _open_capture(path, 'rb') as f:
+        magic = f.read(len(CAPTURE_MAGIC))
+        if magic != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a telemetry capture file")
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            arrival, length = RECORD_HEADER.unpack(header)
+            yield arrival, f.read(length)
+
+
+class FakeMsg:
+    """Minimal stand-in for nats.aio.msg.Msg"""
+
+    def __init__(self, nc: 'FakeNATS', subject: str, data: bytes, reply: str = '', headers: Optional[Dict] = None):
+        self._nc = nc
+        self.subject = subject
+        self.data = data
+        self.reply = reply
+        self.headers = headers
+
+    async def respond(self, data: bytes):
+        await self._nc.publish(self.reply, data)
+
+
+class FakeSubscription:
+    """Subscription delivering to a callback or to the `messages` iterator"""
+
+    def __init__(self, nc: 'FakeNATS', subject: str, cb=None):
+        self._nc = nc
+        self.subject = subject
+        self._cb = cb
+        self._queue = asyncio.Queue()
+        self._closed = False
+        self.pending = 0
+
+    def matches(self, subject: str) -> bool:
+        pattern, tokens = self.subject.split('.'), subject.split('.')
+        for i, token in enumerate(pattern):
+            if token == '>':
+                return len(tokens) > i
+            if i >= len(tokens) or (token != '*' and token != tokens[i]):
+                return False
+        return len(pattern) == len(tokens)
+
+    async def deliver(self, msg: FakeMsg):
+        if self._cb:
+            await self._cb(msg)
+        else:
+            self.pending += 1
+            await self._queue.put(msg)
+
+    @property
+    async def messages(self):
+        while not self._closed:
+            msg = await self._queue.get()
+            if msg is None:
+                return
+            try:
+                yield msg
+            finally:
+                self.pending -= 1
+
+    @property
+    def pending_msgs(self) -> int:
+        return self.pending
+
+    async def idle(self):
+        """Wait until every delivered message has been consumed and handled"""
+        while self.pending > 0:
+            await asyncio.sleep(0)
+
+    async def unsubscribe(self):
+        self._closed = True
+        self._nc.subscriptions.remove(self)
+        await self._queue.put(None)
+
+
+class FakeNATS:
+    """In-process NATS connection: subject wildcards, callbacks, request-reply.
+
+    `on_publish(subject, data)` sees every publish, so the harness can capture
+    the service's EMOTIONS.state output without subscribing to it.
+    """
+
+    def __init__(self):
+        self.subscriptions: List[FakeSubscription] = []
+        self.on_publish = None
+        self._inbox = 0
+
+    async def subscribe(self, subject: str, cb=None, **kwargs) -> FakeSubscription:
+        sub = FakeSubscription(self, subject, cb)
+        self.subscriptions.append(sub)
+        return sub
+
+    async def publish(self, subject: str, payload: bytes = b'', reply: str = '', headers: Optional[Dict] = None):
+        if self.on_publish:
+            self.on_publish(subject, payload)
+        msg = FakeMsg(self, subject, payload, reply, headers)
+        for sub in list(self.subscriptions):
+            if sub.matches(subject):
+                await sub.deliver(msg)
+
+    async def request(self, subject: str, payload: bytes = b'', timeout: float = 1.0, headers: Optional[Dict] = None):
+        self._inbox += 1
+        inbox = f"_INBOX.fake.{self._inbox}"
+        response = asyncio.get_running_loop().create_future()
+
+        async def on_reply(msg):
+            if not response.done():
+                response.set_result(msg)
+
+        sub = await self.subscribe(inbox, cb=on_reply)
+        try:
+            await self.publish(subject, payload, reply=inbox, headers=headers)
+            return await asyncio.wait_for(response, timeout)
+        finally:
+            await sub.unsubscribe()
+
+    async def flush(self, timeout: float = 1.0):
+        pass
+
+    async def drain(self):
+        await self.close()
+
+    async def close(self):
+        for sub in list(self.subscriptions):
+            await sub.unsubscribe()
+
+
+class TelemetryReplayer:
+    """Feeds a capture into MLEmotionService at 1×, N× or max speed.
+
+    The service runs its normal `start()` loop on a FakeNATS connection. Its
+    clock is replaced by virtual time (the recorded arrival time of the
+    message being processed), so debounce and publish decisions behave the
+    same at any replay speed and the emitted stream is comparable across
+    builds.
+    """
+
+    def __init__(self, path: str, speed: Optional[float] = 1.0):
+        self.path = path
+        self.speed = speed  # None = as fast as possible
+        self.virtual_now = 0.0
+
+    async def replay(self, service_module=None) -> Dict:
+        module = service_module or load_service_module()
+        nc = FakeNATS()
+        service = module.MLEmotionService(clock=lambda: self.virtual_now)
+        service.watchdog = None  # Replay timing is measured here instead
+
+        emitted = []
+        first_arrival = {}
+        first_decision = {}
+        decisions = defaultdict(int)
+        current = {'arrival': 0.0}
+
+        # One copy per decision: the hierarchical subject when enabled, else the legacy one
+        hierarchical = service.hierarchical_subjects
+        emotions = service.intelligence.compiled_rules.emotions
+
+        def on_publish(subject: str, data: bytes):
+            if hierarchical:
+                if not subject.startswith(module.EMOTIONS_SUBJECT + '.'):
+                    return
+            elif subject != module.EMOTIONS_SUBJECT:
+                return
+            event = module.decode_emotion_payload(data, emotions)
+            emitted.append({'subject': subject, 'event': event})
+            session_id = event.get('sessionId')
+            decisions[session_id] += 1
+            if session_id not in first_decision:
+                first_decision[session_id] = current['arrival']
+
+        nc.on_publish = on_publish
+        service_task = asyncio.ensure_future(service.start(nc=nc))
+        while not any(sub.subject == module.TELEMETRY_SUBJECT for sub in nc.subscriptions):
+            await asyncio.sleep(0)
+        telemetry_sub = next(sub for sub in nc.subscriptions if sub.subject == module.TELEMETRY_SUBJECT)
+
+        processing = []
+        messages = events = 0
+        replay_start = time.perf_counter()
+        capture_start = None
+
+        for arrival, payload in read_capture(self.path):
+            if capture_start is None:
+                capture_start = arrival
+            if self.speed:
+                # Pace against wall time at the requested speed-up
+                due = replay_start + (arrival - capture_start) / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            self.virtual_now = current['arrival'] = arrival
+            for session_id in self._session_ids(payload):
+                first_arrival.setdefault(session_id, arrival)
+
+            started = time.perf_counter()
+            await nc.publish(module.TELEMETRY_SUBJECT, payload)
+            await telemetry_sub.idle()
+            await service.wait_idle()
+            processing.append(time.perf_counter() - started)
+
+            messages += 1
+            events += self._event_count(payload)
+
+        elapsed = time.perf_counter() - replay_start
+        await service.stop()
+        await nc.close()
+        await service_task
+
+        decision_latency = {
+            session_id: first_decision[session_id] - first_arrival.get(session_id, first_decision[session_id])
+            for session_id in first_decision
+        }
+        return {
+            'capture': self.path,
+            'speed': self.speed or 'max',
+            'messages': messages,
+            'events': events,
+            'wall_seconds': elapsed,
+            'captured_seconds': (self.virtual_now - capture_start) if capture_start is not None else 0.0,
+            'throughput': {
+                'messages_per_sec': messages / elapsed if elapsed else 0.0,
+                'events_per_sec': events / elapsed if elapsed else 0.0,
+            },
+            'processing_ms': self._percentiles([p * 1000 for p in processing]),
+            'sessions': len(first_arrival),
+            'sessions_with_decision': len(first_decision),
+            'first_decision_latency_s': self._percentiles(list(decision_latency.values())),
+            'per_session': {
+                session_id: {
+                    'first_decision_s': decision_latency.get(session_id),
+                    'decisions': decisions.get(session_id, 0),
+                }
+                for session_id in first_arrival
+            },
+            'published': len(emitted),
+            'emitted': emitted,
+        }
+
+    @staticmethod
+    def _decode(payload: bytes) -> List[dict]:
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            return []
+        return data.get('events', [data]) if isinstance(data, dict) else []
+
+    def _session_ids(self, payload: bytes) -> List[str]:
+        return [e.get('sessionId') for e in self._decode(payload) if isinstance(e, dict) and e.get('sessionId')]
+
+    def _event_count(self, payload: bytes) -> int:
+        return len(self._decode(payload))
+
+    @staticmethod
+    def _percentiles(values: List[float]) -> Dict[str, float]:
+        if not values:
+            return {'p50': 0.0, 'p90': 0.0, 'p99': 0.0, 'max': 0.0}
+        p50, p90, p99 = np.percentile(values, [50, 90, 99])
+        return {'p50': float(p50), 'p90': float(p90), 'p99': float(p99), 'max': float(max(values))}
+
+
+def write_emitted(emitted: List[Dict], path: str):
+    """Write the EMOTIONS.state stream as JSON lines (stable key order for diffing)"""
+    with open(path, 'w') as f:
+        for item in emitted:
+            f.write(json.dumps(item, sort_keys=True, default=str) + '\n')
+
+
+async def _main(args):
+    if args.command == 'record':
+        recorder = TelemetryRecorder(args.capture)
+        await recorder.record(args.nats, args.subject, args.duration)
+        return
+
+    speed = None if args.speed == 'max' else float(args.speed)
+    report = await TelemetryReplayer(args.capture, speed).replay()
+
+    if args.emit:
+        write_emitted(report['emitted'], args.emit)
+        print(f"📝 Wrote {len(report['emitted'])} emitted states to {args.emit}")
+    summary = {k: v for k, v in report.items() if k not in ('emitted', 'per_session')}
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({k: v for k, v in report.items() if k != 'emitted'}, f, indent=2, default=str)
+
+    print(f"\n🎬 Replay of {args.capture} at {summary['speed']}×")
+    print(f"   Messages: {summary['messages']} ({summary['events']} events) in {summary['wall_seconds']:.2f}s")
+    print(f"   Throughput: {summary['throughput']['messages_per_sec']:.0f} msg/s, "
+          f"{summary['throughput']['events_per_sec']:.0f} events/s")
+    print(f"   Processing: p50={summary['processing_ms']['p50']:.2f}ms p99={summary['processing_ms']['p99']:.2f}ms")
+    print(f"   Sessions: {summary['sessions']} ({summary['sessions_with_decision']} with a decision)")
+    print(f"   First decision: p50={summary['first_decision_latency_s']['p50']:.1f}s "
+          f"p90={summary['first_decision_latency_s']['p90']:.1f}s")
+    print(f"   Published: {summary['published']} emotion states")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Record and replay TELEMETRY.events traffic')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record = commands.add_parser('record', help='Capture live telemetry to a file')
+    record.add_argument('capture')
+    record.add_argument('--nats', default='nats://localhost:4222')
+    record.add_argument('--subject', default='TELEMETRY.events')
+    record.add_argument('--duration', type=float, default=None, help='Stop after N seconds')
+
+    replay = commands.add_parser('replay', help='Replay a capture into MLEmotionService')
+    replay.add_argument('capture')
+    replay.add_argument('--speed', default='1', help="Speed-up factor (1, 10, ...) or 'max'")
+    replay.add_argument('--emit', help='Write the emitted EMOTIONS.state stream as JSON lines')
+    replay.add_argument('--report', help='Write the full replay report as JSON')
+
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        print("\n👋 Stopped")
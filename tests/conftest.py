@@ -0,0 +1,30 @@
+"""Shared fixtures: the ML scripts are hyphenated, so they are loaded by path."""
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)  # The emotion_ml package, as when a script runs from the repo
+
+
+def load_script(filename: str, name: str):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module  # So process pools can pickle its functions
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope='session')
+def service():
+    return load_script('emotion-ml-service.py', 'emotion_ml_service')
+
+
+@pytest.fixture(scope='session')
+def training():
+    return load_script('behavioral-training-data.py', 'behavioral_training_data')
@@ -0,0 +1,140 @@
+"""Batch scoring request-reply API (MLEmotionService.score_batch / ML.score.batch)."""
+
+import asyncio
+import json
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from emotion_ml import batch
+
+TYPES = ['mouse', 'scroll', 'idle', 'price_proximity', 'rage_click', 'mouse_exit', 'element_hover', 'tab_switch']
+
+
+def session(session_id: str, n: int, seed: int):
+    rng = random.Random(seed)
+    return [{
+        'type': rng.choice(TYPES), 'sessionId': session_id, 'timestamp': 1_700_000_000_000 + i * 700,
+        'data': {'velocity': rng.uniform(0, 900), 'direction': rng.choice(['up', 'down']),
+                 'scrollSpeed': rng.uniform(5, 30), 'duration': rng.uniform(0, 4000)},
+    } for i in range(n)]
+
+
+@pytest.fixture(scope='module')
+def sessions():
+    return [{'session_id': f"b{i}", 'tenant_id': 'acme', 'events': session(f"b{i}", 1 + i % 40, i)}
+            for i in range(60)]
+
+
+@pytest.fixture
+def svc(service, monkeypatch):
+    monkeypatch.setenv('ML_BATCH_WORKERS', '1')
+    return service.MLEmotionService()
+
+
+async def collect(iterator):
+    return [reply async for reply in iterator]
+
+
+def test_batch_matches_live_rules_and_leaves_live_state_alone(service, svc, sessions):
+    replies = asyncio.run(collect(svc.score_batch({'sessions': sessions, 'chunk_size': 16})))
+    assert [r['chunk'] for r in replies[:-1]] == [0, 1, 2, 3]
+    assert replies[-1]['done'] and replies[-1]['scored'] == len(sessions)
+    results = {r['session_id']: r for reply in replies[:-1] for r in reply['results']}
+    assert not svc.intelligence.sessions
+
+    live = service.EmotionalIntelligence()
+    for request in sessions:
+        window = service.session_window(request['events'], svc.window_span, svc.max_buffer_size)
+        expected = asyncio.run(live.process_session(request['session_id'], window,
+                                                    skip_anomaly=True, skip_clustering=True))
+        batch = results[request['session_id']]
+        assert batch['dominant_emotion'] == expected['dominant_emotion']
+        assert batch['confidence'] == pytest.approx(expected['confidence'])
+        assert batch['recommendations'] == expected['recommendations']
+
+
+def test_split_reply_fits_the_payload_limit(service):
+    reply = {'chunk': 3, 'results': [{'session_id': f"s{i}", 'pad': 'x' * 50} for i in range(37)]}
+    limit = 400
+    parts = [json.loads(data) for data in service.split_reply(reply, limit)]
+    assert all(len(json.dumps(part).encode()) <= limit for part in parts)
+    assert all(part['chunk'] == 3 for part in parts)
+    assert [r for part in parts for r in part['results']] == reply['results']
+    assert list(service.split_reply({'done': True}, 10)) == [b'{"done": true}']
+
+
+def test_nats_replies_respect_max_payload(svc, sessions):
+    published = []
+
+    async def publish(subject, data):
+        published.append(data)
+
+    async def flush():
+        pass
+
+    svc.nc = SimpleNamespace(max_payload=4096, publish=publish, flush=flush)
+    msg = SimpleNamespace(reply='_INBOX.1', data=json.dumps({'sessions': sessions[:20]}).encode())
+    asyncio.run(svc.handle_batch_score(msg))
+    assert all(len(data) <= 4096 for data in published)
+    replies = [json.loads(data) for data in published]
+    assert replies[-1]['done'] and 'error' not in replies[-1]
+    assert len([r for reply in replies[:-1] for r in reply['results']]) == 20
+
+
+def test_http_body_over_the_limit_gets_413(service):
+    async def main():
+        async def score(request):
+            yield {'done': True}
+        server = service.IngestServer(asyncio.Queue(), service.ServiceMetrics(), port=0, score=score)
+        await server.start()
+        port = server.server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f"POST /api/score HTTP/1.1\r\nContent-Length: {server.MAX_BODY_BYTES + 1}\r\n\r\n".encode())
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            return response
+        finally:
+            await server.stop()
+
+    response = asyncio.run(main())
+    assert response.startswith(b'HTTP/1.1 413')
+    assert b'split it into smaller requests' in response
+
+
+def test_sequence_evidence_uses_the_feature_window(service, svc, monkeypatch):
+    svc.build_library_models()
+    seen = []
+    matcher, model = svc.intelligence.sequence_matcher, svc.intelligence.transition_model
+    encode, rebuild = matcher.encode, model.rebuild
+    monkeypatch.setattr(matcher, 'encode', lambda events: seen.append(('match', events)) or encode(events))
+    monkeypatch.setattr(model, 'rebuild', lambda state, events: seen.append(('evidence', events)) or rebuild(state, events))
+
+    events = session('long', 90, 7)
+    asyncio.run(collect(svc.score_batch({'sessions': [{'session_id': 'long', 'events': events}]})))
+    window = service.session_window(events, svc.window_span, svc.max_buffer_size)
+    assert len(window) < len(events)
+    assert sorted(seen, key=lambda s: s[0]) == [('evidence', window), ('match', window)]
+
+
+def test_feature_block_is_one_columnar_pass_with_pandas_fallback(service, sessions, monkeypatch):
+    block = [s['events'] for s in sessions[:20]]
+    block[3] = [dict(e, data=dict(e['data'], velocity='fast')) for e in block[3]]  # Needs pandas
+    block[5] = [None]                                                              # Fails outright
+    calls = []
+    columnar = service.columnar_features
+    monkeypatch.setattr(batch, 'columnar_features', lambda *a: calls.append(a) or columnar(*a))
+    values, present, errors = service.extract_feature_block(block, span=30.0)
+    assert len(calls) == 1
+    assert errors[5] and not present[5].any()
+    for i, events in enumerate(block):
+        if i == 5:
+            continue
+        assert errors[i] is None
+        window = service.session_window(events, 30.0, 50)
+        expected = service.feature_vector(service.BehavioralFeatureExtractor().extract_features(window))
+        assert (present[i] == expected[1]).all()
+        assert values[i] == pytest.approx(expected[0], rel=1e-9)
@@ -0,0 +1,56 @@
+"""Cascade inference: models only when the rules are unclear (CascadePolicy)."""
+
+import asyncio
+
+import pytest
+
+
+def test_reasons_for_running_the_models(service):
+    policy = service.CascadePolicy(margin=0.15, min_confidence=0.8, sample_every=3)
+    assert policy.needs_models({'a': 0.8, 'b': 0.7}, 0.95) == 'ambiguous'
+    assert policy.needs_models({'a': 0.8, 'b': 0.2}, 0.5) == 'low_confidence'
+    clear = [policy.needs_models({'a': 0.9, 'b': 0.1}, 0.9) for _ in range(7)]
+    assert clear == ['sampled', None, None, 'sampled', None, None, 'sampled']
+    assert policy.needs_models({'a': 0.9}, 0.9) is None  # A single emotion is never ambiguous
+
+    report = policy.report()
+    assert report['evaluated'] == 10 and report['exit_rate'] == 0.5
+    assert report['reasons'] == {'ambiguous': 1, 'low_confidence': 1, 'sampled': 3}
+
+
+def test_disabled_always_runs_the_models(service):
+    policy = service.CascadePolicy(enabled=False)
+    assert policy.needs_models({'a': 1.0, 'b': 0.0}, 1.0) == 'disabled'
+    assert policy.report()['exit_rate'] == 0.0
+
+
+def test_cpu_saved_follows_the_measured_model_cost(service):
+    policy = service.CascadePolicy(sample_every=100, smoothing=0.5)
+    policy.record_models(0.010)
+    policy.record_models(0.020)
+    assert policy.model_time == pytest.approx(0.015)
+    policy.needs_models({'a': 0.9}, 0.9)  # Sampled
+    for _ in range(4):
+        policy.needs_models({'a': 0.9}, 0.9)
+    report = policy.report()
+    assert report['model_runs'] == 2 and report['cpu_saved_s'] == pytest.approx(4 * 0.015)
+
+
+def test_clear_results_skip_the_model_stages(service, training):
+    intelligence = service.EmotionalIntelligence()
+    intelligence.cascade = service.CascadePolicy(margin=0.0, min_confidence=0.0, sample_every=1000)
+    calls = []
+    intelligence._detect_anomaly = lambda vector: calls.append('anomaly') or False
+    intelligence._get_behavior_cluster = lambda vector: calls.append('cluster') or 4
+    sequence = training.PatternSimulator(seed=1).library.get_training_data()[0][0]
+    events = service.pattern_events(sequence)
+
+    async def main():
+        first = await intelligence.process_session('s1', events)
+        second = await intelligence.process_session('s1', events + service.pattern_events(sequence, start=60.0))
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert calls == ['anomaly', 'cluster']  # The first clear result is sampled, the next exits
+    assert first['behavior_cluster'] == second['behavior_cluster'] == 4  # Carried over after the exit
+    assert intelligence.cascade.report()['exit_rate'] == 0.5
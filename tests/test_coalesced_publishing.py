@@ -0,0 +1,73 @@
+"""Coalesced, batched publishing of emotion results (the outbox)."""
+
+import asyncio
+import json
+
+
+class RecordingNATS:
+    def __init__(self):
+        self.published = []
+        self.flushes = 0
+
+    async def publish(self, subject, payload=b''):
+        self.published.append((subject, json.loads(payload)))
+
+    async def flush(self):
+        self.flushes += 1
+
+
+def result(session_id, confidence, emotion='confusion'):
+    return {'session_id': session_id, 'tenant_id': 't', 'dominant_emotion': emotion, 'confidence': confidence,
+            'emotion_scores': {emotion: confidence}, 'is_anomaly': False, 'behavior_cluster': None,
+            'recommendations': []}
+
+
+def new_service(service, monkeypatch, flush_ms):
+    monkeypatch.setenv('ML_PUBLISH_FLUSH_MS', str(flush_ms))
+    monkeypatch.setenv('ML_LEGACY_SUBJECT', '0')
+    svc = service.MLEmotionService(clock=lambda: 1.7e9)
+    svc.nc = RecordingNATS()
+    return svc
+
+
+def test_keeps_the_latest_result_per_session_and_flushes_once(service, monkeypatch):
+    svc = new_service(service, monkeypatch, 20)
+
+    async def main():
+        await svc.publish_emotion(result('a', 0.5))
+        await svc.publish_emotion(result('b', 0.6))
+        await svc.publish_emotion(result('a', 0.9, 'frustration'))
+        assert svc.nc.published == []
+        await svc.flush_emotions()
+        await svc.flush_emotions()  # Empty outbox: nothing more to send
+
+    asyncio.run(main())
+    sent = [(event['sessionId'], event['emotion']) for _, event in svc.nc.published]
+    assert sent == [('a', 'frustration'), ('b', 'confusion')]
+    assert svc.nc.flushes == 1
+    assert svc.metrics.counters['publishes_coalesced'] == 1
+    assert svc.metrics.counters['emotions_published'] == 2
+
+
+def test_publish_loop_bounds_the_added_latency(service, monkeypatch):
+    svc = new_service(service, monkeypatch, 10)
+
+    async def main():
+        loop = asyncio.ensure_future(svc._publish_loop())
+        try:
+            await svc.publish_emotion(result('a', 0.5))
+            for _ in range(100):
+                await asyncio.sleep(0.005)
+                if svc.nc.published:
+                    break
+        finally:
+            loop.cancel()
+
+    asyncio.run(main())
+    assert len(svc.nc.published) == 1 and svc.nc.flushes == 1
+
+
+def test_zero_interval_publishes_inline(service, monkeypatch):
+    svc = new_service(service, monkeypatch, 0)
+    asyncio.run(svc.publish_emotion(result('a', 0.5)))
+    assert len(svc.nc.published) == 1 and not svc._outbox
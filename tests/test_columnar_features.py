@@ -0,0 +1,90 @@
+"""Columnar feature extraction (encode_event / columnar_features) against the pandas extractor."""
+
+import random
+
+import numpy as np
+import pytest
+
+TYPES = ['mouse', 'mouse_exit', 'mousemove', 'scroll', 'idle', 'price_proximity', 'cta_proximity',
+         'form_proximity', 'nav_proximity', 'rage_click', 'circular_motion', 'direction_changes',
+         'text_selection', 'tab_switch', 'viewport_approach', 'element_hover', 'click', 'price_selection']
+TIMESTAMPS = {
+    'epoch_ms': lambda i, rng: 1_700_000_000_000 + i * rng.randint(1, 900),
+    'js_iso': lambda i, rng: f"2026-01-01T00:{i // 60:02d}:{i % 60:02d}.{rng.randint(0, 999):03d}Z",
+    'python_iso': lambda i, rng: f"2026-01-01T00:{i // 60:02d}:{i % 60:02d}.{rng.randint(0, 999999):06d}",
+    'seconds': lambda i, rng: f"2026-01-01 00:{i // 60:02d}:{i % 60:02d}",
+}
+
+
+def random_session(rng: random.Random, n: int, timestamps: str):
+    events = []
+    for i in range(n):
+        data = {field: rng.choice([rng.uniform(-50, 900), rng.randint(0, 2000), 0, 0.1])
+                for field in ('velocity', 'acceleration', 'scrollPercentage', 'scrollSpeed', 'duration')
+                if rng.random() < 0.6}
+        if rng.random() < 0.7:
+            data['direction'] = rng.choice(['up', 'down', 'left', '', 'unknown'])
+        if rng.random() < 0.4:
+            data['element'] = rng.choice(['price-tag', 'cta', None, 3])
+        event = {'type': rng.choice(TYPES), 'timestamp': TIMESTAMPS[timestamps](i, rng), 'data': data}
+        if rng.random() < 0.05:
+            del event['data']
+        events.append(event)
+    return events
+
+
+@pytest.fixture(scope='module')
+def sessions():
+    rng = random.Random(0)
+    return [random_session(rng, rng.randint(0, 25), rng.choice(list(TIMESTAMPS))) for _ in range(400)]
+
+
+def reference(service, events):
+    return service.feature_vector(service.BehavioralFeatureExtractor().extract_features(events))
+
+
+def test_matches_pandas_in_one_grouped_pass(service, sessions):
+    rows = [service.encode_event(event) for events in sessions for event in events]
+    values, present, ok = service.columnar_features(rows, [len(events) for events in sessions])
+    assert ok.all()
+    for i, events in enumerate(sessions):
+        expected_values, expected_present = reference(service, events)
+        np.testing.assert_array_equal(present[i], expected_present)
+        np.testing.assert_allclose(values[i], expected_values, rtol=1e-9, atol=1e-12)
+
+
+def test_library_patterns_match_pandas(service, training):
+    extractor = service.ColumnarFeatureExtractor()
+    for sequence, _, _ in training.PatternSimulator(seed=1).library.get_training_data():
+        events = service.pattern_events(sequence)
+        assert extractor.extract_features(events) == pytest.approx(
+            service.BehavioralFeatureExtractor().extract_features(events), rel=1e-9
+        )
+
+
+@pytest.mark.parametrize('change', [
+    lambda events: events[1]['data'].update(velocity='fast'),         # Non-numeric field pandas reads
+    lambda events: events[1]['data'].update(direction=None),           # value_counts drops None
+    lambda events: events[1].update(timestamp='2026-01-01T00:00:01'),  # A second timestamp shape
+    lambda events: events[1].update(type=None),
+    lambda events: [event.pop('data') for event in events],            # No data column at all
+])
+def test_input_pandas_treats_specially_falls_back(service, change):
+    events = [{'type': 'mouse', 'timestamp': f"2026-01-01T00:00:0{i}.000", 'data': {'velocity': 10.0 * i}}
+              for i in range(4)]
+    change(events)
+    rows = [service.encode_event(event) for event in events]
+    assert not service.columnar_features(rows, [len(rows)])[2][0]
+    try:
+        expected = service.BehavioralFeatureExtractor().extract_features(events)
+    except Exception as e:  # pandas' own verdict stands, error included
+        with pytest.raises(type(e)):
+            service.ColumnarFeatureExtractor().extract_features(events)
+    else:
+        assert service.ColumnarFeatureExtractor().extract_features(events) == pytest.approx(expected)
+
+
+def test_short_sessions_have_no_features(service):
+    rows = [service.encode_event({'type': 'click', 'timestamp': 1, 'data': {}})] * 2
+    values, present, ok = service.columnar_features(rows, [2, 0])
+    assert ok.all() and not present.any() and not values.any()
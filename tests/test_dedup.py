@@ -0,0 +1,71 @@
+"""Duplicate event filtering at ingest (RotatingBloomFilter, event_fingerprint)."""
+
+import asyncio
+import hashlib
+
+
+def key(n: int) -> bytes:
+    return hashlib.blake2b(str(n).encode(), digest_size=16).digest()
+
+
+def test_fingerprint_keys_on_session_type_time_and_payload(service):
+    event = {'sessionId': 's', 'type': 'click', 'timestamp': '2026-01-01T00:00:00', 'data': {'x': 1, 'y': 2}}
+    reordered = dict(event, data={'y': 2, 'x': 1})
+    assert service.event_fingerprint(event) == service.event_fingerprint(reordered)
+    for change in ({'timestamp': '2026-01-01T00:00:01'}, {'type': 'mouse'}, {'sessionId': 't'}, {'data': {'x': 2}}):
+        assert service.event_fingerprint(dict(event, **change)) != service.event_fingerprint(event)
+
+
+def test_catches_duplicates_within_retention(service):
+    dedup = service.RotatingBloomFilter(memory_bytes=1 << 12, generations=4, bucket_seconds=10.0)
+    assert not dedup.check_and_add(key(1), 0.0)
+    assert dedup.check_and_add(key(1), 5.0)
+    assert dedup.check_and_add(key(1), 29.0)  # Three buckets later: still in an older generation
+    assert dedup.report()['dedup_rate'] == 2 / 3
+    assert dedup.report()['retention_s'] == 30.0
+
+
+def test_forgets_keys_after_every_generation_rotates(service):
+    dedup = service.RotatingBloomFilter(memory_bytes=1 << 12, generations=4, bucket_seconds=10.0)
+    dedup.check_and_add(key(1), 0.0)
+    assert not dedup.check_and_add(key(1), 40.0)
+    assert not dedup.check_and_add(key(2), 1000.0)  # Long gaps clear everything, once
+    assert dedup.check_and_add(key(2), 1001.0)
+
+
+def test_fixed_memory_and_low_false_positive_rate(service):
+    dedup = service.RotatingBloomFilter(memory_bytes=64 << 10, generations=4, bucket_seconds=60.0)
+    false_positives = sum(dedup.check_and_add(key(n), 0.0) for n in range(5000))
+    assert false_positives / 5000 < 0.001
+    assert sum(len(bits) for bits in dedup.filters) == dedup.report()['memory_bytes'] == 64 << 10
+
+
+def test_service_drops_resent_events_before_buffering(service):
+    async def main():
+        svc = service.MLEmotionService(clock=lambda: 100.0)
+        event = {'sessionId': 's1', 'type': 'click', 'timestamp': '2026-01-01T00:00:00', 'data': {'x': 1}}
+        await svc.process_payload(event)
+        await svc.process_payload({'events': [event, dict(event, timestamp='2026-01-01T00:00:01')]})
+        return svc
+
+    svc = asyncio.run(main())
+    assert len(svc.event_buffer['s1'].events) == 2
+    assert svc.metrics.counters['duplicate_events'] == 1
+
+
+def test_rejected_events_are_not_remembered(service):
+    async def main():
+        svc = service.MLEmotionService(clock=lambda: 100.0)
+        svc.tenants = service.TenantRegistry({'default': {'max_buffered_events': 1}}, svc.intelligence)
+        first = {'sessionId': 's1', 'type': 'click', 'timestamp': '2026-01-01T00:00:00', 'data': {}}
+        second = dict(first, timestamp='2026-01-01T00:00:01')
+        await svc.process_payload({'events': [first, second]})  # Second is over quota
+        rejected = svc.metrics.counters['tenant_event_rejections']
+        svc.tenants = service.TenantRegistry(None, svc.intelligence)
+        await svc.process_payload(second)  # The client's retry is let through
+        return svc, rejected
+
+    svc, rejected = asyncio.run(main())
+    assert rejected == 1
+    assert len(svc.event_buffer['s1'].events) == 2
+    assert svc.metrics.counters['duplicate_events'] == 0
@@ -0,0 +1,96 @@
+"""Hierarchical EMOTIONS.state subjects and the binary payload codec."""
+
+import asyncio
+import json
+
+import pytest
+
+
+class RecordingNATS:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, subject, payload=b''):
+        self.published.append((subject, payload))
+
+    async def flush(self):
+        pass
+
+
+def result(**overrides):
+    return {
+        'session_id': 's1', 'tenant_id': 'acme', 'dominant_emotion': 'confusion', 'confidence': 0.8,
+        'emotion_scores': {'confusion': 0.8, 'frustration': 0.25}, 'is_anomaly': False,
+        'behavior_cluster': None, 'recommendations': ['help_chat'],
+        'event_time': 1.7e9, 'ingest_time': 1.7e9 + 0.5, **overrides,
+    }
+
+
+def published(service, monkeypatch, results, **env):
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    svc = service.MLEmotionService(clock=lambda: 1.7e9 + 1.0)
+    svc.nc = RecordingNATS()
+    asyncio.run(svc._publish_batch(results))
+    return svc, svc.nc.published
+
+
+def test_subject_tokens_cannot_escape_their_level(service):
+    assert service.MLEmotionService.emotion_subject('acme.eu', 'price shock') == 'EMOTIONS.state.acme_eu.price_shock'
+    assert service.MLEmotionService.emotion_subject(None, '>') == 'EMOTIONS.state.default._'
+    assert service.subject_token('') == '_'
+
+
+def test_hierarchical_subject_with_legacy_mirror(service, monkeypatch):
+    _, messages = published(service, monkeypatch, [result()])
+    assert [subject for subject, _ in messages] == ['EMOTIONS.state.acme.confusion', 'EMOTIONS.state']
+    assert messages[0][1] == messages[1][1]  # One encoding for both copies
+    assert json.loads(messages[0][1])['emotion'] == 'confusion'
+
+
+def test_mirror_off_and_flat_only(service, monkeypatch):
+    _, messages = published(service, monkeypatch, [result()], ML_LEGACY_SUBJECT='0')
+    assert [subject for subject, _ in messages] == ['EMOTIONS.state.acme.confusion']
+    monkeypatch.setenv('ML_LEGACY_SUBJECT', '1')
+    _, messages = published(service, monkeypatch, [result()], ML_HIERARCHICAL_SUBJECTS='0')
+    assert [subject for subject, _ in messages] == ['EMOTIONS.state']
+
+
+def test_binary_payload_on_hierarchical_subjects_only(service, monkeypatch):
+    svc, messages = published(service, monkeypatch, [result()], ML_PAYLOAD_FORMAT='binary')
+    (subject, binary), (_, legacy) = messages
+    event = service.decode_emotion_payload(binary, svc.intelligence.compiled_rules.emotions)
+    assert binary[0] == service.EMOTION_PAYLOAD_VERSION and len(binary) < len(legacy)
+    assert event['sessionId'] == 's1' and event['tenantId'] == 'acme' and event['emotion'] == 'confusion'
+    assert service.decode_emotion_payload(legacy, ()) == json.loads(legacy)
+
+
+def test_rejects_unknown_payload_formats(service, monkeypatch):
+    monkeypatch.setenv('ML_PAYLOAD_FORMAT', 'msgpack')
+    with pytest.raises(ValueError):
+        service.MLEmotionService()
+
+
+def test_binary_round_trip(service):
+    emotions = ('confusion', 'frustration', 'engagement')
+    codes = {emotion: i for i, emotion in enumerate(emotions)}
+    event = {
+        'sessionId': 'sess-é', 'tenantId': 'acme', 'emotion': 'tenant_only', 'confidence': 72.5,
+        'ml_scores': {'confusion': 0.5, 'tenant_only': 1.0, 'engagement': 0.0},
+        'is_anomaly': True, 'behavior_cluster': 3, 'interventions': ['help_chat', 'trust_badges'],
+    }
+    data = service.encode_emotion_payload(event, codes, 1.7e9, event_time=1.7e9 - 2.0, ingest_time=None)
+    decoded = service.decode_emotion_payload(data, emotions)
+    for key in ('sessionId', 'tenantId', 'emotion', 'is_anomaly', 'behavior_cluster', 'interventions'):
+        assert decoded[key] == event[key]
+    assert decoded['confidence'] == pytest.approx(72.5)
+    assert decoded['ml_scores'] == pytest.approx(event['ml_scores'], abs=1 / 65535)
+    assert decoded['ingestTime'] is None and decoded['eventTime'] is not None
+
+
+def test_binary_defaults(service):
+    event = {'sessionId': 's', 'emotion': 'confusion', 'confidence': 50.0}
+    decoded = service.decode_emotion_payload(service.encode_emotion_payload(event, {'confusion': 0}, 0.0), ['confusion'])
+    assert decoded['tenantId'] is None and decoded['behavior_cluster'] is None and not decoded['is_anomaly']
+    assert decoded['ml_scores'] == {} and decoded['interventions'] == []
+    assert decoded['eventTime'] is None and decoded['ingestTime'] is None
@@ -0,0 +1,114 @@
+"""Event-time session windows with watermarks (EventTimeWindow)."""
+
+import asyncio
+import json
+
+import pytest
+
+
+def times(window):
+    return [event['t'] for event in window.events]
+
+
+def test_out_of_order_events_are_slotted_in(service):
+    window = service.EventTimeWindow(span=30.0, allowed_lateness=5.0)
+    for t in (10.0, 12.0, 11.0, 12.0, 8.0):
+        assert window.add({'t': t}, t) == (True, 0)
+    assert times(window) == [8.0, 10.0, 11.0, 12.0, 12.0]
+
+
+def test_events_behind_the_watermark_are_dropped(service):
+    window = service.EventTimeWindow(span=30.0, allowed_lateness=5.0)
+    window.add({'t': 20.0}, 20.0)
+    assert window.watermark == 15.0
+    assert window.add({'t': 14.9}, 14.9) == (False, 0)
+    assert window.add({'t': 15.0}, 15.0) == (True, 0)
+    assert times(window) == [15.0, 20.0]
+
+
+def test_span_and_event_cap_evict_the_oldest(service):
+    window = service.EventTimeWindow(span=10.0, allowed_lateness=5.0, max_events=3)
+    for t in (0.0, 5.0, 9.0):
+        window.add({'t': t}, t)
+    assert window.add({'t': 12.0}, 12.0) == (True, 1)  # 0.0 is past the span
+    assert times(window) == [5.0, 9.0, 12.0]
+    assert window.add({'t': 10.0}, 10.0) == (True, 1)  # The cap drops the oldest, not the newest arrival
+    assert times(window) == [9.0, 10.0, 12.0]
+
+
+def test_newest_ingest_time_follows_the_newest_event(service):
+    window = service.EventTimeWindow()
+    window.add({'t': 5.0}, 5.0, ingest_time=100.0)
+    window.add({'t': 3.0}, 3.0, ingest_time=101.0)
+    assert window.max_event_time == 5.0 and window.newest_ingest_time == 100.0
+    window.add({'t': 6.0}, 6.0, ingest_time=102.0)
+    assert window.newest_ingest_time == 102.0
+
+
+
+def test_late_arrivals_and_eviction_keep_rows_and_type_counts_in_step(service):
+    window = service.EventTimeWindow(span=10.0, allowed_lateness=5.0, max_events=4)
+    for t, kind in ((1.0, 'a'), (3.0, 'b'), (2.0, 'c'), (4.0, 'a'), (2.5, 'b'), (5.0, 'c')):
+        window.add({'t': t, 'type': kind, 'timestamp': f"2026-01-01T00:00:0{t:.1f}", 'data': {}}, t)
+    assert times(window) == [2.5, 3.0, 4.0, 5.0]
+    assert window.type_counts == {'a': 1, 'b': 2, 'c': 1}
+    assert window.has_any(('c', 'z')) and not window.has_any(('z',))
+    assert window.rows == [service.encode_event(event) for event in window.events]
+    window.add({'t': 4.5, 'type': 'a'}, 4.5)  # Late again after the ordered view was read
+    assert times(window) == [3.0, 4.0, 4.5, 5.0]
+
+@pytest.mark.parametrize('timestamp, expected', [
+    (1_700_000_000_000, 1_700_000_000.0),
+    (1_700_000_000, 1_700_000_000.0),
+    ('2026-01-01T00:00:00+00:00', 1767225600.0),
+    ('garbage', -1.0),
+])
+def test_parse_event_time(service, timestamp, expected):
+    assert service.parse_event_time(timestamp, -1.0) == pytest.approx(expected)
+
+
+class RecordingNATS:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, subject, payload=b''):
+        self.published.append(json.loads(payload))
+
+    async def flush(self):
+        pass
+
+
+def test_a_late_final_event_is_still_scored(service, monkeypatch):
+    monkeypatch.setenv('ML_PUBLISH_FLUSH_MS', '0')
+    monkeypatch.setenv('ML_LEGACY_SUBJECT', '0')
+    now = [100.0]
+    svc = service.MLEmotionService(clock=lambda: now[0])
+    svc.nc = RecordingNATS()
+
+    def event(second, kind, **data):
+        return {'sessionId': 's1', 'type': kind, 'timestamp': f"2026-01-01T00:00:{second:02d}", 'data': data}
+
+    async def drain():
+        while svc.scheduler.queued:
+            session_id = svc.scheduler.pop()[1]
+            await svc.score_session(session_id, svc.session_tenant[session_id])
+
+    async def main():
+        await svc.process_payload({'events': [
+            event(0, 'price_proximity', duration=2000, element='price'),
+            event(1, 'element_hover', duration=3000, element='price'),
+            event(2, 'scroll', scrollSpeed=10, direction='down'),
+            event(4, 'scroll', scrollSpeed=10, direction='down'),
+        ]})
+        await drain()
+        now[0] = 101.0  # Inside the debounce
+        await svc.process_payload(event(3, 'price_proximity', duration=5000, element='price'))
+        assert 's1' in svc.deferred_sessions and not svc.scheduler.queued
+        now[0] = 106.0
+        svc.schedule_deferred_sessions()
+        await drain()
+
+    asyncio.run(main())
+    assert [e['emotion'] for e in svc.nc.published] == ['curiosity', 'sticker_shock']
+    assert svc.metrics.counters['reordered_events'] == 1
+    assert not svc.deferred_sessions
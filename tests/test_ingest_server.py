@@ -0,0 +1,121 @@
+"""Built-in HTTP / WebSocket ingest endpoint (IngestServer)."""
+
+import asyncio
+import json
+import os
+import struct
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def started(service, **kwargs):
+    server = service.IngestServer(asyncio.Queue(maxsize=10), service.ServiceMetrics(), port=0, **kwargs)
+    await server.start()
+    server.port = server.server.sockets[0].getsockname()[1]
+    return server
+
+
+async def request(server, head: str, body: bytes = b''):
+    reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+    writer.write(head.encode() + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status = int(response.split(b' ', 2)[1])
+    return status, json.loads(response.split(b'\r\n\r\n', 1)[1] or b'null')
+
+
+def test_defaults_to_loopback(service):
+    server = service.IngestServer(asyncio.Queue(), service.ServiceMetrics())
+    assert server.host == '127.0.0.1'
+
+
+def test_token_guards_sessions_but_not_telemetry(service):
+    async def main():
+        server = await started(service, query=lambda session_id, **_: {'session_id': session_id}, token='s3cret')
+        try:
+            anonymous = await request(server, "GET /api/sessions/abc HTTP/1.1\r\n")
+            wrong = await request(server, "GET /api/sessions/abc HTTP/1.1\r\nAuthorization: Bearer nope\r\n")
+            allowed = await request(server, "GET /api/sessions/abc HTTP/1.1\r\nAuthorization: Bearer s3cret\r\n")
+            batch = json.dumps({'events': [{'sessionId': 'abc', 'type': 'click', 'timestamp': 1}]}).encode()
+            telemetry = await request(server, "POST /api/telemetry HTTP/1.1\r\n", batch)
+        finally:
+            await server.stop()
+        return anonymous, wrong, allowed, telemetry
+
+    anonymous, wrong, allowed, telemetry = run(main())
+    assert anonymous[0] == wrong[0] == 401
+    assert allowed == (200, {'session_id': 'abc'})
+    assert telemetry[0] == 200
+
+
+def test_public_bind_without_token_refuses_protected_endpoints(service):
+    server = service.IngestServer(asyncio.Queue(), service.ServiceMetrics(), host='0.0.0.0')
+    assert server._authorize('/api/score', 'POST', {})[0] == 403
+    assert server._authorize('/api/sessions/abc', 'GET', {})[0] == 403
+    assert server._authorize('/api/telemetry', 'POST', {}) is None
+    loopback = service.IngestServer(asyncio.Queue(), service.ServiceMetrics())
+    assert loopback._authorize('/api/score', 'POST', {}) is None
+
+
+def frame(opcode: int, payload: bytes, masked: bool = True, fin: bool = True) -> bytes:
+    first = (0x80 if fin else 0) | opcode
+    if not masked:
+        return struct.pack('>BB', first, len(payload)) + payload
+    mask = os.urandom(4)
+    return (struct.pack('>BB', first, 0x80 | len(payload)) + mask
+            + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+
+
+async def websocket(server, *frames):
+    reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+    writer.write(b"GET /ws HTTP/1.1\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                 b"Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n\r\n")
+    await reader.readuntil(b'\r\n\r\n')
+    replies = []
+    for data in frames:
+        writer.write(data)
+        first, second = await reader.readexactly(2)
+        replies.append((first & 0x0F, await reader.readexactly(second & 0x7F)))
+    writer.close()
+    return replies
+
+
+def test_websocket_acks_masked_frames(service):
+    async def main():
+        server = await started(service)
+        try:
+            return await websocket(server, frame(0x1, json.dumps({'type': 'init', 'session_id': 's1'}).encode()))
+        finally:
+            await server.stop()
+
+    [(opcode, payload)] = run(main())
+    assert opcode == 0x1 and json.loads(payload) == {'type': 'ack', 'session_id': 's1'}
+
+
+def test_websocket_closes_on_unmasked_client_frame(service):
+    async def main():
+        server = await started(service)
+        try:
+            return await websocket(server, frame(0x1, b'{"type": "init"}', masked=False))
+        finally:
+            await server.stop()
+
+    [(opcode, payload)] = run(main())
+    assert opcode == 0x8 and struct.unpack('>H', payload[:2])[0] == 1002
+
+
+def test_websocket_caps_the_total_size_of_a_fragmented_message(service):
+    async def main():
+        server = await started(service)
+        server.MAX_BODY_BYTES = 100
+        try:
+            # Each fragment is under the limit, together they are not
+            return await websocket(server, frame(0x1, b'[' + b' ' * 60, fin=False) + frame(0x0, b' ' * 60, fin=False))
+        finally:
+            await server.stop()
+
+    [(opcode, payload)] = run(main())
+    assert opcode == 0x8 and struct.unpack('>H', payload[:2])[0] == 1009
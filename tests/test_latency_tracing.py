@@ -0,0 +1,70 @@
+"""Event-to-decision and ingest-to-publish latency tracing."""
+
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+
+
+class RecordingNATS:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, subject, payload=b''):
+        self.published.append(json.loads(payload))
+
+    async def flush(self):
+        pass
+
+
+def test_histogram_buckets_and_quantiles(service):
+    histogram = service.LatencyHistogram()
+    for value in (0.005, 0.02, 0.02, 0.3, 45.0):
+        histogram.observe(value)
+    report = histogram.report()
+    assert report['count'] == 5 and report['max_ms'] == 45000.0
+    assert report['p50_ms'] == 25.0  # Upper bound of the median's bucket
+    assert report['p99_ms'] == 45000.0  # Capped at the largest value seen
+    assert report['buckets']['0.01'] == 1 and report['buckets']['0.025'] == 3
+    assert report['buckets']['30'] == 4 and report['buckets']['+Inf'] == 5
+
+
+def test_latencies_are_labelled_by_tenant_and_emotion(service):
+    metrics = service.ServiceMetrics()
+    metrics.observe_latency('event_to_decision', 0.2, 'acme', 'confusion')
+    metrics.observe_latency('event_to_decision', -1.0, 'acme', 'confusion')  # Client clock ahead of ours
+    metrics.observe_latency('event_to_decision', 0.4, 'other', 'engagement')
+    snapshot = metrics.snapshot()
+    by_tenant = snapshot['histograms']['event_to_decision']
+    assert by_tenant['acme']['confusion']['count'] == 2
+    assert by_tenant['acme']['confusion']['buckets']['0.01'] == 1  # Clamped to zero
+    assert by_tenant['other']['engagement']['count'] == 1
+    assert snapshot['latency_ms']['event_to_decision']['max'] == pytest.approx(400.0)
+
+
+def test_published_results_carry_event_and_ingest_times(service, training, monkeypatch):
+    monkeypatch.setenv('ML_PUBLISH_FLUSH_MS', '0')
+    monkeypatch.setenv('ML_LEGACY_SUBJECT', '0')
+    clock = [0.0]
+    svc = service.MLEmotionService(clock=lambda: clock[0])
+    svc.nc = RecordingNATS()
+    sequence = training.PatternSimulator(seed=2).library.get_training_data()[0][0]
+    events = service.pattern_events(sequence, start=1.7e9)
+    newest = max(datetime.fromisoformat(e['timestamp']).timestamp() for e in events)
+
+    async def main():
+        for event in events:
+            clock[0] = datetime.fromisoformat(event['timestamp']).timestamp() + 0.25  # Network delay
+            await svc.process_payload(dict(event, sessionId='s1', tenantId='acme'))
+        clock[0] = newest + 1.0
+        await svc.score_session('s1', 'acme')
+
+    asyncio.run(main())
+    (published,) = svc.nc.published
+    assert published['eventTime'] == datetime.fromtimestamp(newest).isoformat()
+    assert published['ingestTime'] == datetime.fromtimestamp(newest + 0.25).isoformat()
+    histograms = svc.metrics.histograms
+    decision = histograms['event_to_decision'][('acme', published['emotion'])]
+    publish = histograms['ingest_to_publish'][('acme', published['emotion'])]
+    assert decision.max == pytest.approx(1.0) and publish.max == pytest.approx(0.75)
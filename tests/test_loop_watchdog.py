@@ -0,0 +1,44 @@
+"""Event-loop lag watchdog (LoopLagWatchdog)."""
+
+import asyncio
+import time
+
+
+def hold_the_loop(seconds: float):
+    time.sleep(seconds)  # Stands in for a blocking sklearn fit
+
+
+def test_reports_stalls_and_the_blocking_call_site(service):
+    async def main():
+        watchdog = service.LoopLagWatchdog(interval=0.01, threshold=0.05)
+        watchdog.start()
+        try:
+            await asyncio.sleep(0.05)
+            hold_the_loop(0.3)
+            await asyncio.sleep(0.05)
+        finally:
+            watchdog.stop()
+        return watchdog.report()
+
+    report = asyncio.run(main())
+    assert report['stalls'] >= 1 and report['stack_samples'] >= report['stalls']
+    assert report['lag_ms']['max'] >= 200
+    assert 'hold_the_loop' in report['top_blocking'][0]['site']
+
+
+def test_quiet_loop_records_lag_without_stalls(service):
+    async def main():
+        watchdog = service.LoopLagWatchdog(interval=0.01, threshold=0.2)
+        watchdog.start()
+        try:
+            await asyncio.sleep(0.15)
+        finally:
+            watchdog.stop()
+        return watchdog
+
+    watchdog = asyncio.run(main())
+    report = watchdog.report()
+    assert len(watchdog.lags) >= 5
+    assert report['stalls'] == 0 and report['top_blocking'] == []
+    watchdog.reset()
+    assert not watchdog.lags
@@ -0,0 +1,62 @@
+"""Skip-recompute memoization: window fingerprints and memo keys."""
+
+import asyncio
+
+
+def digest(n: int) -> bytes:
+    return n.to_bytes(16, 'little')
+
+
+def test_fingerprint_counts_repeated_digests(service):
+    window = service.EventTimeWindow()
+    empty = window.fingerprint
+    window.add({'type': 'a'}, 1.0, digest(7))
+    once = window.fingerprint
+    window.add({'type': 'a'}, 2.0, digest(7))
+    assert window.fingerprint not in (empty, once)
+    assert window.fingerprint[0] != empty[0]  # XOR would have cancelled back to 0
+
+
+def test_fingerprint_follows_contents_not_arrival_order(service):
+    in_order, shuffled = service.EventTimeWindow(), service.EventTimeWindow()
+    for t in (1.0, 2.0, 3.0):
+        in_order.add({'t': t}, t, digest(int(t * 10)))
+    for t in (3.0, 1.0, 2.0):
+        shuffled.add({'t': t}, t, digest(int(t * 10)))
+    assert in_order.fingerprint == shuffled.fingerprint
+    assert [e['t'] for e in shuffled.events] == [1.0, 2.0, 3.0]
+
+
+def test_fingerprint_after_eviction(service):
+    window = service.EventTimeWindow(max_events=2)
+    reference = service.EventTimeWindow(max_events=2)
+    for t in (1.0, 2.0, 3.0):
+        window.add({'t': t}, t, digest(1 << 127 | int(t)))  # Large digests wrap mod 2^128
+    for t in (2.0, 3.0):
+        reference.add({'t': t}, t, digest(1 << 127 | int(t)))
+    assert window.fingerprint == reference.fingerprint
+
+
+def test_rule_sets_never_share_a_generation(service):
+    first = service.CompiledRules({'joy': {}}, {})
+    generation = first.generation
+    del first
+    assert service.CompiledRules({'joy': {}}, {}).generation != generation
+
+
+def test_new_rules_invalidate_memoized_results(service):
+    intelligence = service.EmotionalIntelligence()
+    events = [{'type': 'click', 'timestamp': i * 500, 'data': {}} for i in range(12)]
+
+    async def score():
+        return await intelligence.process_session('s', events, fingerprint=(1, len(events)))
+
+    first = asyncio.run(score())
+    asyncio.run(score())
+    assert intelligence.memo_stats['window_hits'] == 1
+
+    # Same window, new base rules: rescored, not served from the memo
+    intelligence.set_tuned_rules({first['dominant_emotion']: {}}, {})
+    asyncio.run(score())
+    assert intelligence.memo_stats['window_hits'] == 1
+    assert intelligence.memo_stats['misses'] == 2
@@ -0,0 +1,120 @@
+"""Offline model artifacts (train-emotion-models.py -> ModelArtifacts)."""
+
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from sklearn.ensemble import IsolationForest, RandomForestClassifier
+
+from conftest import load_script
+
+
+@pytest.fixture(scope='module')
+def trainer():
+    return load_script('train-emotion-models.py', 'train_emotion_models')
+
+
+@pytest.fixture(scope='module')
+def library(training):
+    return training.PatternSimulator(seed=1).library.get_training_data()
+
+
+def feature_cache(service, path, sessions, labels):
+    """A minimal feature cache entry, as extract_features() writes it"""
+    values, present, errors = service.extract_feature_block(sessions)
+    emotions = sorted(set(labels))
+    os.makedirs(path)
+    np.save(os.path.join(path, 'values.npy'), values)
+    np.save(os.path.join(path, 'present.npy'), present)
+    np.save(os.path.join(path, 'ok.npy'), np.array([e is None for e in errors]))
+    np.save(os.path.join(path, 'labels.npy'), np.array([emotions.index(e) for e in labels], dtype=np.int16))
+    with open(os.path.join(path, 'emotions.json'), 'w') as f:
+        json.dump(emotions, f)
+
+
+def save_models(service, root, vectors, labels, normalizer, version='v1'):
+    anomaly = IsolationForest(n_estimators=10, random_state=0).fit(vectors)
+    classifier = RandomForestClassifier(n_estimators=5, random_state=0).fit(vectors, labels)
+    manifest = {'version': version, 'params': {'eps': 1.0}}
+    return service.ModelArtifacts.save(str(root), manifest, anomaly, classifier,
+                                       vectors[:3].copy(), np.zeros(3, dtype=np.int32), normalizer)
+
+
+def test_same_session_same_model_input(service, trainer, library, tmp_path):
+    sessions = [service.pattern_events(sequence) for sequence, _, _ in library]
+    labels = [emotion for _, emotion, _ in library]
+    feature_cache(service, str(tmp_path / 'features'), sessions, labels)
+    vectors, codes, emotions, normalizer = trainer.load_features(service, str(tmp_path / 'features'))
+    save_models(service, tmp_path / 'models', vectors, np.array(emotions)[codes], normalizer)
+
+    intelligence = service.EmotionalIntelligence()
+    intelligence.models = service.ModelArtifacts.load(str(tmp_path / 'models'))
+    intelligence.cascade = service.CascadePolicy(enabled=False)  # Always run the models
+    seen = []
+    is_anomaly = intelligence.models.is_anomaly
+    intelligence.models.is_anomaly = lambda vector: seen.append(vector.copy()) or is_anomaly(vector)
+
+    # A fresh tenant's running baseline must not leak into the models' inputs
+    async def score():
+        for i, session in enumerate(sessions):
+            await intelligence.process_session(f"s{i}", session, tenant_id='new-tenant')
+    asyncio.run(score())
+    assert len(seen) == len(sessions)
+    np.testing.assert_allclose(np.array(seen), vectors)
+
+
+def test_save_replaces_an_existing_version(service, tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(40, len(service.FEATURE_SCHEMA)))
+    labels = np.array(['joy', 'confusion'] * 20)
+    normalizer = service.OnlineNormalizer()
+    os.makedirs(tmp_path / 'v1.tmp')  # An interrupted save
+    (tmp_path / 'v1.tmp' / 'stale').write_text('x')
+    save_models(service, tmp_path, vectors, labels, normalizer)
+    path = save_models(service, tmp_path, vectors * 2, labels, normalizer)
+
+    assert sorted(os.listdir(tmp_path)) == ['LATEST', 'v1']
+    assert 'stale' not in os.listdir(path)
+    models = service.ModelArtifacts.load(str(tmp_path))
+    np.testing.assert_array_equal(models.core_tree.data, vectors[:3] * 2)
+
+
+def test_load_rejects_other_feature_schemas(service, tmp_path):
+    vectors = np.zeros((4, len(service.FEATURE_SCHEMA)))
+    path = save_models(service, tmp_path, vectors, np.array(['a', 'b'] * 2), service.OnlineNormalizer())
+    with open(os.path.join(path, 'manifest.json')) as f:
+        manifest = json.load(f)
+    manifest['extractor_version'] += 1
+    with open(os.path.join(path, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+    with pytest.raises(ValueError, match='extractor version'):
+        service.ModelArtifacts.load(str(tmp_path))
+
+
+def test_load_features_z_scores_the_whole_dataset(service, trainer, tmp_path):
+    values = np.array([[1.0, 5.0], [3.0, 5.0], [5.0, 5.0]])
+    present = np.array([[True, True], [True, False], [True, True]])
+    os.makedirs(tmp_path / 'f')
+    for name, array in (('values', values), ('present', present), ('ok', np.ones(3, bool)),
+                        ('labels', np.zeros(3, np.int16))):
+        np.save(tmp_path / 'f' / f'{name}.npy', array)
+    (tmp_path / 'f' / 'emotions.json').write_text('["joy"]')
+    vectors, _, _, normalizer = trainer.load_features(SimpleNamespace(OnlineNormalizer=service.OnlineNormalizer),
+                                                      str(tmp_path / 'f'))
+    np.testing.assert_allclose(vectors[:, 0], [-1.0, 0.0, 1.0])
+    np.testing.assert_allclose(vectors[:, 1], 0.0)  # Constant or absent
+    np.testing.assert_allclose(normalizer.mean, [3.0, 5.0])
+
+
+def test_generated_dataset_fingerprint_covers_the_generator_code(training, trainer, tmp_path, monkeypatch):
+    args = SimpleNamespace(dataset=None, samples=2, seed=3, workers=1)
+    before = trainer.DatasetSource(training, args).fingerprint
+    assert trainer.DatasetSource(training, args).fingerprint == before
+    edited = tmp_path / 'behavioral-training-data.py'
+    with open(training.__file__) as f:
+        edited.write_text(f.read() + '\n# Changed noise model\n')
+    monkeypatch.setattr(training, '__file__', str(edited))
+    assert trainer.DatasetSource(training, args).fingerprint != before
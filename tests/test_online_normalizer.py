@@ -0,0 +1,78 @@
+"""Streaming per-tenant feature baselines (OnlineNormalizer) and their checkpoints."""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+
+def test_running_statistics_match_numpy_per_feature(service):
+    rng = np.random.default_rng(0)
+    values = rng.normal([10.0, 5000.0, 0.2], [2.0, 900.0, 0.05], (500, 3))
+    present = rng.random((500, 3)) > 0.3
+    values[0, 2] = np.nan  # Non-finite values never reach the statistics
+    normalizer = service.OnlineNormalizer(3)
+    for row, mask in zip(values, present):
+        normalizer.update(row, mask)
+    for f in range(3):
+        seen = values[present[:, f] & np.isfinite(values[:, f]), f]
+        assert normalizer.count[f] == len(seen)
+        assert normalizer.mean[f] == pytest.approx(seen.mean())
+        assert normalizer.std()[f] == pytest.approx(seen.std(ddof=1))
+
+
+def test_normalize_in_place_and_absent_features(service):
+    normalizer = service.OnlineNormalizer(3)
+    for row in ([1.0, 10.0, 7.0], [3.0, 30.0, 7.0]):
+        normalizer.update(np.array(row), np.array([True, True, True]))
+    vector = np.array([3.0, 20.0, 9.0])
+    result = normalizer.normalize(vector, np.array([True, False, True]))
+    assert result is vector
+    assert vector.tolist() == pytest.approx([2 ** 0.5 / 2, 0.0, 2.0])  # Constant feature: std 1
+
+
+def test_state_round_trip(service):
+    normalizer = service.OnlineNormalizer(3)
+    normalizer.update(np.array([1.0, 2.0, 3.0]), np.array([True, False, True]))
+    restored = service.OnlineNormalizer.from_state(normalizer.state())
+    assert np.array_equal(restored.state(), normalizer.state())
+
+
+def test_each_tenant_keeps_its_own_baseline(service, training):
+    intelligence = service.EmotionalIntelligence()
+    library = training.PatternSimulator(seed=1).library.get_training_data()
+
+    async def main():
+        for i, (sequence, _, _) in enumerate(library[:6]):
+            tenant = 'acme' if i % 3 else 'other'
+            await intelligence.process_session(f"s{i}", service.pattern_events(sequence), tenant_id=tenant)
+
+    asyncio.run(main())
+    assert set(intelligence.normalizers) == {'acme', 'other'}
+    assert intelligence.normalizers['acme'].count.max() == 4
+    assert intelligence.normalizers['other'].count.max() == 2
+
+
+def test_checkpoint_restores_baselines_and_rejects_other_schemas(service, tmp_path):
+    svc = service.MLEmotionService()
+    rng = np.random.default_rng(1)
+    for tenant in ('acme', 'other'):
+        svc.intelligence.normalizer(tenant).update(rng.normal(size=len(service.FEATURE_SCHEMA)),
+                                                   np.ones(len(service.FEATURE_SCHEMA), dtype=bool))
+    svc.intelligence.training_vectors.append(np.arange(len(service.FEATURE_SCHEMA), dtype=float))
+    path = str(tmp_path / 'state.npz')
+    svc.save_checkpoint(path)
+
+    restored = service.MLEmotionService()
+    restored.load_checkpoint(path)
+    for tenant in ('acme', 'other'):
+        assert np.array_equal(restored.intelligence.normalizers[tenant].state(),
+                              svc.intelligence.normalizers[tenant].state())
+    assert np.array_equal(restored.intelligence.training_vectors[0], svc.intelligence.training_vectors[0])
+
+    state = dict(np.load(path))
+    state['schema'] = state['schema'][::-1]
+    np.savez(path, **state)
+    fresh = service.MLEmotionService()
+    fresh.load_checkpoint(path)  # Ignored with a warning
+    assert fresh.intelligence.normalizers == {}
@@ -0,0 +1,52 @@
+"""Adaptive load shedding (OverloadController)."""
+
+import asyncio
+
+
+def test_steps_down_under_sustained_pressure(service):
+    controller = service.OverloadController(latency_budget=0.25, step_down_after=2.0)
+    controller.record(0.1)
+    controller.record(0.1)
+    assert not controller.evaluate(backlog=100, now=0.0)
+    assert not controller.evaluate(backlog=100, now=1.0)
+    assert controller.evaluate(backlog=100, now=2.0) and controller.tier == 1
+    assert controller.skip_clustering(critical=False) and not controller.skip_clustering(critical=True)
+
+
+def test_recovers_on_the_clock_without_traffic(service):
+    controller = service.OverloadController(step_down_after=1.0, step_up_after=10.0)
+    controller.record(1.0)
+    for now in range(0, 9):
+        controller.evaluate(backlog=10, now=float(now))
+    degraded = controller.tier
+    assert degraded >= 3
+
+    # Traffic stops: nothing is scored, only the timer evaluates an empty queue
+    now = 10.0
+    while controller.tier and now < 100:
+        controller.evaluate(backlog=0, now=now)
+        now += 0.5
+    assert controller.tier == 0
+    assert now <= 10.0 + (degraded + 1) * 10.0
+
+
+def test_service_timer_restores_full_quality_when_idle(service):
+    async def main():
+        svc = service.MLEmotionService()
+        clock = [0.0]
+        svc.clock = lambda: clock[0]
+        svc.overload_interval = 0.001
+        svc.overload.tier = 2
+        svc.overload.step_up_after = 5.0
+        task = asyncio.ensure_future(svc._overload_loop())
+        try:
+            for _ in range(200):
+                clock[0] += 1.0
+                await asyncio.sleep(0.002)
+                if svc.overload.tier == 0:
+                    break
+        finally:
+            task.cancel()
+        return svc.overload.tier
+
+    assert asyncio.run(main()) == 0
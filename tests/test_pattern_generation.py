@@ -0,0 +1,44 @@
+"""Seeded, batched synthetic dataset generation (PatternSimulator, PatternTemplate)."""
+
+import copy
+import json
+
+import numpy as np
+
+
+def dump(dataset) -> str:
+    return json.dumps(dataset, sort_keys=True)
+
+
+def test_same_seed_same_dataset_for_any_worker_count(training):
+    serial = training.PatternSimulator(seed=11).generate_training_dataset(30, workers=1, chunk_size=10)
+    pooled = training.PatternSimulator(seed=11).generate_training_dataset(30, workers=2, chunk_size=10)
+    other = training.PatternSimulator(seed=12).generate_training_dataset(30, workers=1, chunk_size=10)
+    patterns = len(training.PatternSimulator(seed=11).library.get_training_data())
+    assert len(serial) == patterns * 31
+    assert dump(serial) == dump(pooled)
+    assert dump(serial) != dump(other)
+
+
+def test_templates_are_never_mutated(training):
+    simulator = training.PatternSimulator(seed=3)
+    before = copy.deepcopy(simulator.library.patterns)
+    sequence = simulator.library.patterns['confusion'][0]['sequence']
+    simulator.generate_training_dataset(20, chunk_size=7)
+    simulator.generate_variations(sequence, 5)
+    simulator.add_noise(sequence)
+    assert simulator.library.patterns == before
+
+
+def test_variation_noise_and_inserts_follow_the_documented_rates(training):
+    sequence = [{'type': 'mouse', 'data': {'velocity': 100.0, 'label': 'x', 'flag': True}}] * 20
+    template = training.PatternTemplate(sequence)
+    variations = template.variations(np.random.default_rng(0), 2000)
+    velocities = np.array([e['data']['velocity'] for v in variations for e in v if e['type'] == 'mouse'
+                           and not e['data'].get('random')])
+    assert abs(np.std(velocities) / 100.0 - 0.13) < 0.02  # Noise levels uniform in [5%, 20%]
+    inserted = sum(e['data'].get('random', False) for v in variations for e in v)
+    assert abs(inserted / (2000 * 20) - 0.15) < 0.01
+    kept = [e for v in variations for e in v if not e['data'].get('random')]
+    assert all(e['data']['label'] == 'x' and e['data']['flag'] is True for e in kept)
+    assert sequence[0]['data']['velocity'] == 100.0
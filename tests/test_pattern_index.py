@@ -0,0 +1,52 @@
+"""kNN pattern-library matcher (PatternIndex) and how the service builds it."""
+
+import numpy as np
+import pytest
+from sklearn.ensemble import IsolationForest, RandomForestClassifier
+
+
+@pytest.fixture(scope='module')
+def points(service):
+    return service.PatternIndex.library_points(variations=2)
+
+
+def test_library_points_match_themselves(service, points):
+    values, present, emotions, names = points
+    index = service.PatternIndex(values, present, emotions, names, k=3)
+    assert len(index) == len(names) == 3 * len(set(n.split('~')[0] for n in names))
+    matches = index.match_block(values, present)
+    for match, name in zip(matches, names):
+        assert name in match['neighbors']
+    assert np.mean([m['emotion'] == e for m, e in zip(matches, emotions)]) > 0.8
+    assert index.match(values[0], present[0]) == matches[0]
+
+
+def test_service_construction_defers_library_models(service):
+    svc = service.MLEmotionService()
+    assert svc.intelligence.pattern_index is None and svc.intelligence.transition_model is None
+    svc.build_library_models()
+    assert svc.intelligence.pattern_index is not None
+    assert svc.intelligence.sequence_matcher is not None and svc.intelligence.transition_model is not None
+
+
+def test_index_comes_from_trained_models_when_available(service, points, tmp_path, monkeypatch):
+    vectors = np.random.default_rng(0).normal(size=(20, len(service.FEATURE_SCHEMA)))
+    service.ModelArtifacts.save(
+        str(tmp_path), {'version': 'v1', 'params': {'eps': 1.0}},
+        IsolationForest(n_estimators=5, random_state=0).fit(vectors),
+        RandomForestClassifier(n_estimators=3, random_state=0).fit(vectors, ['a', 'b'] * 10),
+        vectors[:2].copy(), np.zeros(2, dtype=np.int32), service.OnlineNormalizer(), points,
+    )
+    monkeypatch.setenv('ML_MODEL_DIR', str(tmp_path))
+    monkeypatch.setenv('ML_PATTERN_K', '3')
+
+    def extract(*args, **kwargs):
+        raise AssertionError('library points should come from the model version')
+    monkeypatch.setattr(service.PatternIndex, 'library_points', classmethod(extract))
+
+    svc = service.MLEmotionService()
+    svc.build_library_models()
+    index = svc.intelligence.pattern_index
+    assert len(index) == len(points[3])
+    assert index.match(points[0][5], points[1][5]) == \
+        service.PatternIndex(*points, k=3).match(points[0][5], points[1][5])
@@ -0,0 +1,48 @@
+"""Sampled per-stage and per-feature-helper profiling (StageProfiler)."""
+
+import asyncio
+import json
+import pstats
+
+
+def score_sessions(service, intelligence, training, count: int):
+    library = training.PatternSimulator(seed=1).library.get_training_data()
+
+    async def main():
+        for i in range(count):
+            sequence = library[i % len(library)][0]
+            await intelligence.process_session(f"s{i}", service.pattern_events(sequence))
+
+    asyncio.run(main())
+
+
+def test_off_by_default_samples_nothing(service, training):
+    intelligence = service.EmotionalIntelligence()
+    score_sessions(service, intelligence, training, 3)
+    report = intelligence.profiler.report()
+    assert not report['enabled'] and report['sampled_calls'] == 0
+    assert report['stages'] == {} and report['feature_helpers'] == {}
+
+
+def test_samples_one_in_n_and_attributes_time(service, training):
+    intelligence = service.EmotionalIntelligence()
+    intelligence.profiler.start(sample_every=2)
+    score_sessions(service, intelligence, training, 6)
+    report = intelligence.profiler.report()
+    assert report['sampled_calls'] == 3
+    assert report['stages'] and all(stage['calls'] == 3 for stage in report['stages'].values())
+    assert 'extract_features' in report['feature_helpers']
+    assert report['top_functions']
+
+
+def test_dump_writes_pstats_and_json(service, training, tmp_path):
+    intelligence = service.EmotionalIntelligence()
+    intelligence.profiler.start(sample_every=1)
+    score_sessions(service, intelligence, training, 2)
+    paths = intelligence.profiler.dump(str(tmp_path))
+    assert pstats.Stats(paths['pstats']).total_calls > 0
+    with open(paths['json']) as f:
+        assert json.load(f)['sampled_calls'] == 2
+
+    intelligence.profiler.reset()
+    assert intelligence.profiler.report()['sampled_calls'] == 0
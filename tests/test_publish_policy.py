@@ -0,0 +1,70 @@
+"""Table-driven publish suppression with hysteresis (PublishPolicy)."""
+
+import pytest
+
+EMOTIONS = ('engagement', 'confusion', 'price_shock', 'skeptical')
+
+
+@pytest.fixture
+def policy(service):
+    return service.PublishPolicy(EMOTIONS)
+
+
+def publish(policy, state, emotion, confidence, scores, now):
+    decision = policy.decide(state, emotion, confidence, scores, now)
+    return decision, policy.record(state, emotion, confidence, now) if decision[0] else state
+
+
+def test_first_detection_is_never_delayed(policy):
+    assert policy.decide(None, 'engagement', 0.2, {'engagement': 0.2}, 0.0) == (True, 'first')
+
+
+def test_same_emotion_is_rate_limited_then_needs_a_confidence_change(policy):
+    _, state = publish(policy, None, 'confusion', 0.6, {'confusion': 0.6}, 0.0)
+    assert policy.decide(state, 'confusion', 0.9, {'confusion': 0.9}, 1.0) == (False, 'rate')  # 12/min
+    assert policy.decide(state, 'confusion', 0.65, {'confusion': 0.65}, 10.0) == (False, 'delta')
+    assert policy.decide(state, 'confusion', 0.8, {'confusion': 0.8}, 10.0) == (True, 'confidence')
+
+
+def test_switch_needs_the_enter_score_and_waits_out_the_dwell(policy):
+    _, state = publish(policy, None, 'engagement', 0.7, {'engagement': 0.7}, 0.0)
+    assert policy.decide(state, 'skeptical', 0.5, {'skeptical': 0.5, 'engagement': 0.7}, 40.0) == (False, 'enter')
+    scores = {'skeptical': 0.7, 'engagement': 0.6}
+    assert policy.decide(state, 'skeptical', 0.7, scores, 10.0) == (False, 'dwell')  # engagement holds 30s
+    assert policy.decide(state, 'skeptical', 0.7, scores, 31.0) == (True, 'switch')
+
+
+def test_exit_hysteresis_releases_a_fading_emotion_early(policy):
+    _, state = publish(policy, None, 'engagement', 0.7, {'engagement': 0.7}, 0.0)
+    faded = {'skeptical': 0.7, 'engagement': 0.3}  # Below engagement's exit score
+    assert policy.decide(state, 'skeptical', 0.7, faded, 20.0) == (True, 'switch')  # Inside the 30s dwell
+
+
+def test_critical_emotion_preempts_dwell_and_rate(policy):
+    _, state = publish(policy, None, 'engagement', 0.7, {'engagement': 0.7}, 0.0)
+    scores = {'price_shock': 0.6, 'engagement': 0.7}
+    assert policy.decide(state, 'price_shock', 0.6, scores, 0.5) == (True, 'critical')
+
+
+def test_entered_at_holds_while_the_emotion_republishes(policy):
+    _, state = publish(policy, None, 'confusion', 0.5, {'confusion': 0.5}, 0.0)
+    _, state = publish(policy, state, 'confusion', 0.9, {'confusion': 0.9}, 10.0)
+    assert state == [policy.code('confusion'), 0.9, 0.0, 10.0]
+
+
+def test_config_overrides_and_unknown_emotions(service):
+    policy = service.PublishPolicy(EMOTIONS, {'default': {'min_delta': 0.3},
+                                              'emotions': {'price_shock': {'min_dwell': 2}}})
+    assert policy.min_dwell[policy.code('price_shock')] == 2
+    assert policy.min_delta[policy.code('skeptical')] == 0.3
+    assert policy.min_delta[policy.code('engagement')] == 0.15  # Built-in row beats the default
+    assert policy.code('tenant-only') == policy.code('other') == len(EMOTIONS)
+
+
+def test_report_counts_suppressions(policy):
+    _, state = publish(policy, None, 'confusion', 0.6, {'confusion': 0.6}, 0.0)
+    for now in (1.0, 2.0, 3.0):
+        policy.decide(state, 'confusion', 0.9, {'confusion': 0.9}, now)
+    report = policy.report()
+    assert report['published']['first'] == 1 and report['suppressed']['rate'] == 3
+    assert report['suppression_rate'] == 0.75
@@ -0,0 +1,63 @@
+"""Rule threshold tuning (tune-emotion-rules.py)."""
+
+import numpy as np
+import pytest
+
+from conftest import load_script
+
+
+@pytest.fixture(scope='module')
+def tuner_module():
+    return load_script('tune-emotion-rules.py', 'tune_emotion_rules')
+
+
+@pytest.fixture(scope='module')
+def rules(service):
+    return service.EmotionalIntelligence().compiled_rules
+
+
+def test_metrics(tuner_module):
+    fired = np.array([[True, True, False, False], [True, True, True, True]])
+    positive = np.array([True, False, True, False])
+    result = tuner_module.metrics(fired, positive)
+    np.testing.assert_allclose(result['precision'], [0.5, 0.5])
+    np.testing.assert_allclose(result['recall'], [0.5, 1.0])
+    np.testing.assert_allclose(result['f1'], [0.5, 2 / 3])
+
+
+def test_splits_are_disjoint(tuner_module):
+    tune, validate, test = tuner_module.splits(10000, np.random.default_rng(0), 0.2, 0.25)
+    assert not (tune & validate).any() and not (tune & test).any() and not (validate & test).any()
+    assert (tune | validate | test).all()
+    assert abs(validate.mean() - 0.2) < 0.02 and abs(test.mean() - 0.25) < 0.02
+
+
+def test_candidate_zero_is_the_service_score(service, tuner_module, rules):
+    rng = np.random.default_rng(1)
+    values = rng.gamma(1.0, 2.0, size=(200, len(service.FEATURE_SCHEMA)))
+    present = rng.random(values.shape) < 0.8
+    score, total = rules.score_vector(values, present)
+    for e, emotion in enumerate(rules.emotions):
+        tuner = tuner_module.EmotionTuner(rules, emotion, 16, rng)
+        expected = np.where(total[:, e] > 0, np.minimum(1.0, score[:, e] / np.maximum(total[:, e], 1e-12)), 0.0)
+        np.testing.assert_allclose(tuner.scores(service, values, present, block=5)[0], expected)
+
+
+def test_bounds_scale_independently_and_keep_their_presence(tuner_module, rules):
+    tuner = tuner_module.EmotionTuner(rules, 'frustration', 64, np.random.default_rng(2))
+    e = rules.emotions.index('frustration')
+    low, high = rules.min_thresholds[e, tuner.features], rules.max_thresholds[e, tuner.features]
+    for bound, candidates in ((low, tuner.min_thresholds), (high, tuner.max_thresholds)):
+        np.testing.assert_array_equal(np.isnan(candidates), np.broadcast_to(np.isnan(bound), candidates.shape))
+        assert (candidates[:, bound == 0] == 0).all()
+    both = ~np.isnan(low) & ~np.isnan(high) & (low != 0) & (high != 0)
+    if both.any():
+        assert not np.allclose(tuner.min_thresholds[1:, both] / low[both], tuner.max_thresholds[1:, both] / high[both])
+
+
+def test_candidate_zero_overrides_are_the_current_rules(service, tuner_module, rules):
+    tuner = tuner_module.EmotionTuner(rules, 'confusion', 4, np.random.default_rng(3))
+    overrides, weights = tuner.overrides(0, service.FEATURE_SCHEMA)
+    assert service.CompiledRules({'confusion': overrides}, {'confusion': weights}).score(
+        {name: 1.5 for name in service.FEATURE_SCHEMA}
+    ) == pytest.approx({'confusion': rules.score({name: 1.5 for name in service.FEATURE_SCHEMA})['confusion']})
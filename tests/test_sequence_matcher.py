@@ -0,0 +1,82 @@
+"""Ordered template matching against the pattern library (SequenceMatcher)."""
+
+import numpy as np
+import pytest
+
+TOKENS = ['click', 'scroll_down', 'scroll_up', 'hover', 'tab_switch', 'mouse_fast']
+
+
+@pytest.fixture(scope='module')
+def templates():
+    rng = np.random.default_rng(4)
+    return [(f"t{i}", f"e{i % 3}", list(rng.choice(TOKENS, size=rng.integers(2, 7))))
+            for i in range(24)]
+
+
+def naive_distances(templates, stream, gap_cost):
+    """Semi-global edit distance of each full template against any stretch of the stream"""
+    result = []
+    for _, _, tokens in templates:
+        previous = np.zeros(len(stream) + 1)  # Free start anywhere
+        for i, token in enumerate(tokens, 1):
+            row = np.empty_like(previous)
+            row[0] = i
+            for j, event in enumerate(stream, 1):
+                row[j] = min(previous[j - 1] + (token != event), previous[j] + 1, row[j - 1] + gap_cost)
+            previous = row
+        result.append(previous.min())
+    return np.array(result)
+
+
+def reported(matcher, best):
+    return np.where(best <= matcher.cutoff + 1e-9, best, np.inf)
+
+
+def test_matches_the_naive_alignment(service, templates):
+    matcher = service.SequenceMatcher(templates, decay=0.0)
+    rng = np.random.default_rng(5)
+    for _ in range(20):
+        stream = list(rng.choice(TOKENS, size=rng.integers(1, 15)))
+        state = matcher.new_state()
+        matcher.extend(state, [matcher.vocab.get(token, matcher.other) for token in stream])
+        expected = naive_distances(templates, stream, matcher.gap_cost)
+        np.testing.assert_allclose(reported(matcher, state.best), reported(matcher, expected))
+
+
+def test_incremental_equals_whole_window(service, templates):
+    matcher = service.SequenceMatcher(templates)
+    rng = np.random.default_rng(6)
+    codes = rng.integers(0, matcher.other + 1, size=40)
+    whole, pieces = matcher.new_state(), matcher.new_state()
+    matcher.extend(whole, codes)
+    for chunk in np.array_split(codes, [3, 4, 11, 25]):
+        matcher.extend(pieces, chunk)
+    # Distances past the cutoff are capped and never reported, so only those within it must agree
+    np.testing.assert_allclose(reported(matcher, pieces.best), reported(matcher, whole.best))
+    # Batch scoring (pruned by the bag-of-codes bound) agrees with the live state
+    assert matcher.match_window(codes, top=5) == matcher.matches(whole, top=5)
+
+
+def test_pending_codes_stay_bounded(service, templates):
+    matcher = service.SequenceMatcher(templates)
+    rng = np.random.default_rng(7)
+    codes = rng.integers(0, matcher.other + 1, size=200)
+    pushed, reference = matcher.new_state(), matcher.new_state()
+    for code in codes:
+        matcher.push(pushed, int(code))
+        assert len(pushed.pending) < matcher.max_pending
+    matcher.advance(pushed)
+    matcher.extend(reference, codes)
+    np.testing.assert_allclose(reported(matcher, pushed.best), reported(matcher, reference.best))
+
+
+def test_stale_state_rebuilds_from_the_window(service, templates):
+    matcher = service.SequenceMatcher(templates)
+    window = [{'type': token} for token in templates[0][2]]
+    state = matcher.new_state()
+    state.stale = True
+    matcher.push(state, 0)
+    assert state.pending == []
+    matcher.advance(state, window)
+    assert not state.stale
+    assert matcher.matches(state, top=1)[0]['similarity'] == 1.0
@@ -0,0 +1,85 @@
+"""Session state reads: emotion timelines and swapped read snapshots."""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+
+def test_timeline_ring_buffer_keeps_the_newest_entries(service):
+    timeline = service.EmotionTimeline(capacity=3)
+    for i in range(5):
+        timeline.append(100.0 + i, i, 0.5 + i / 10)
+    ts, code, confidence = timeline.arrays()
+    assert len(timeline) == 3 and timeline.version == 5
+    assert ts.tolist() == [102000, 103000, 104000]
+    assert code.tolist() == [2, 3, 4] and confidence.tolist() == [700, 800, 900]
+    assert ts.dtype == np.int64 and code.dtype == confidence.dtype == np.int16
+
+
+@pytest.fixture
+def scored(service, training):
+    """A service with two scored sessions (not yet in the read snapshot)"""
+    clock = [1.7e9]
+    svc = service.MLEmotionService(clock=lambda: clock[0])
+    svc.publish_emotion = lambda result: asyncio.sleep(0)  # No connection needed
+    library = training.PatternSimulator(seed=2).library.get_training_data()
+
+    async def score(session_id, tenant_id, sequence):
+        for event in service.pattern_events(sequence, start=clock[0]):
+            await svc.process_payload(dict(event, sessionId=session_id, tenantId=tenant_id))
+        clock[0] += 60
+        await svc.score_session(session_id, tenant_id)
+
+    asyncio.run(score('s1', 'acme', library[0][0]))
+    asyncio.run(score('s2', 'other', library[-1][0]))
+    svc.score = lambda session_id, tenant_id, sequence: asyncio.run(score(session_id, tenant_id, sequence))
+    svc.library = library
+    return svc
+
+
+def test_reads_come_from_the_swapped_snapshot(scored):
+    assert scored.query_session('s1') is None  # Scored, but not yet snapshotted
+    scored.refresh_snapshot()
+    reply = scored.query_session('s1')
+    assert reply['session_id'] == 's1' and reply['tenant_id'] == 'acme'
+    assert reply['published_emotion'] == reply['emotion']
+    timeline = reply['timeline']
+    assert len(timeline['ts']) == len(timeline['code']) == len(timeline['confidence']) == 1
+    assert timeline['emotions'][timeline['code'][0]] == reply['emotion']
+    assert 'timeline' not in scored.query_session('s1', timeline=False)
+
+
+def test_snapshots_are_never_mutated(scored):
+    scored.refresh_snapshot()
+    before = scored.state_snapshot
+    entry = before.sessions['s1']
+    scored.score('s1', 'acme', scored.library[1][0])
+    assert scored.state_snapshot is before and before.sessions['s1'] is entry
+
+    scored.refresh_snapshot()
+    after = scored.state_snapshot
+    assert after is not before
+    assert len(after.session('s1')['timeline']['ts']) == 2
+    assert after.session('s1', limit=1)['timeline']['ts'] == after.session('s1')['timeline']['ts'][-1:]
+    assert after.sessions['s2'] is before.sessions['s2']  # Untouched sessions are shared
+
+
+def test_evicted_sessions_leave_the_next_snapshot(scored):
+    scored.refresh_snapshot()
+    scored.evict_session('s2')
+    assert scored.query_session('s2') is not None
+    scored.refresh_snapshot()
+    assert scored.query_session('s2') is None
+
+
+def test_control_queries(scored):
+    scored.refresh_snapshot()
+    assert scored._control_session({}) == {'error': 'session_id required'}
+    assert scored._control_session({'session_id': 'nope'}) == {'error': 'unknown session: nope'}
+    assert scored._control_session({'session_id': 's1', 'timeline': False})['session_id'] == 's1'
+    found = scored._control_sessions({'tenant_id': 'other'})
+    assert found['total'] == 2 and [s['session_id'] for s in found['sessions']] == ['s2']
+    emotion = scored.query_session('s1')['emotion']
+    assert 's1' in [s['session_id'] for s in scored._control_sessions({'emotion': emotion})['sessions']]
+    assert len(scored._control_sessions({'limit': 1})['sessions']) == 1
@@ -0,0 +1,107 @@
+"""Fixed-memory traffic sketches (emotion_ml.sketches)."""
+
+import numpy as np
+import pytest
+
+from emotion_ml.sketches import CountMinSketch, HyperLogLog, QuantileSketch, TrafficSketches
+
+FEATURES = ('duration', 'velocity', 'delta')
+
+
+def test_quantiles_within_relative_error():
+    rng = np.random.default_rng(0)
+    values = np.stack([rng.lognormal(3, 1, 20000), rng.lognormal(6, 2, 20000), rng.normal(0, 50, 20000)], axis=1)
+    sketch = QuantileSketch(FEATURES, relative_accuracy=0.02)
+    sketch.add(values, np.ones_like(values, dtype=bool))
+    qs = (0.1, 0.5, 0.9, 0.99)
+    estimated, exact = sketch.quantiles(qs), np.quantile(values, qs, axis=0).T
+    assert np.allclose(estimated[:2], exact[:2], rtol=0.03)
+    assert np.all(np.sign(estimated[2]) == np.sign(exact[2]))  # Negative values keep their sign
+    assert np.allclose(estimated[2, 1:], exact[2, 1:], rtol=0.05, atol=1.0)
+
+
+def test_single_vectors_absent_features_and_zero():
+    sketch = QuantileSketch(FEATURES)
+    sketch.add(np.array([5.0, np.nan, 0.0]), np.array([True, True, True]))
+    sketch.add(np.array([5.0, 1.0, 0.0]), np.array([True, False, True]))
+    assert sketch.totals().tolist() == [2, 0, 2]
+    estimates = sketch.quantiles((0.5,))
+    assert estimates[0, 0] == pytest.approx(5.0, rel=0.02)
+    assert np.isnan(estimates[1, 0]) and estimates[2, 0] == 0.0
+
+
+def test_merge_round_trip_and_distance():
+    rng = np.random.default_rng(1)
+    a, b = QuantileSketch(FEATURES), QuantileSketch(FEATURES)
+    a.add(rng.lognormal(2, 1, (5000, 3)), np.ones((5000, 3), dtype=bool))
+    b.add(rng.lognormal(2, 1, (5000, 3)) * [1, 1, 4], np.ones((5000, 3), dtype=bool))
+    distance = a.distance(b)
+    assert distance[:2].max() < 0.05 and distance[2] > 0.5
+
+    restored = QuantileSketch.from_dict(a.to_dict(), FEATURES)
+    assert np.array_equal(restored.counts, a.counts)
+    merged = QuantileSketch(FEATURES)
+    merged.merge(a)
+    merged.merge(b)
+    assert np.array_equal(merged.totals(), a.totals() + b.totals())
+    with pytest.raises(ValueError):
+        a.merge(QuantileSketch(FEATURES, relative_accuracy=0.05))
+
+
+def test_count_min_never_undercounts_and_tracks_heavy_hitters():
+    sketch = CountMinSketch(width=256, depth=4, top_k=3)
+    counts = {'mouse': 500, 'scroll': 300, 'click': 200, **{f"rare{i}": 1 for i in range(200)}}
+    for key, count in counts.items():
+        for _ in range(count):
+            sketch.add(key)
+    assert sketch.total == sum(counts.values())
+    assert all(sketch.estimate(key) >= count for key, count in counts.items())
+    assert sketch.estimate('mouse') <= 500 + sketch.total * 2 / 256
+    assert list(sketch.heavy_hitters()) == ['mouse', 'scroll', 'click']
+    with pytest.raises(ValueError):
+        CountMinSketch(width=300)
+
+
+def test_hyperloglog_estimates_and_merges():
+    a, b = HyperLogLog(precision=12), HyperLogLog(precision=12)
+    for i in range(20000):
+        a.add(f"session-{i}")
+    for i in range(10000, 40000):
+        b.add(f"session-{i}")
+    assert a.count() == pytest.approx(20000, rel=0.05)
+    small = HyperLogLog()
+    for i in range(100):
+        small.add(str(i))
+        small.add(str(i))
+    assert small.count() == pytest.approx(100, rel=0.05)  # Linear counting range
+    a.merge(b)
+    assert a.count() == pytest.approx(40000, rel=0.05)
+    with pytest.raises(ValueError):
+        a.merge(HyperLogLog(precision=10))
+
+
+def test_traffic_snapshot_reports_drift_against_the_baseline():
+    rng = np.random.default_rng(2)
+    sketches = TrafficSketches(FEATURES, baseline_decay=0.5)
+    present = np.ones(3, dtype=bool)
+    for i in range(200):
+        sketches.observe_event(f"s{i % 20}", 'mouse')
+        sketches.observe_features(rng.lognormal(2, 0.5, 3), present)
+    first = sketches.snapshot(0.0, 60.0)
+    assert first['drift'] == {} and first['scored'] == 200 and first['active_sessions'] == 20
+    assert first['event_types'] == {'mouse': 200}
+
+    for i in range(200):
+        sketches.observe_features(rng.lognormal(2, 0.5, 3) * [1, 1, 10], present)
+    second = sketches.snapshot(60.0, 120.0)
+    assert second['drift']['delta'] > 0.9 and second['drift']['duration'] < 0.2
+    assert second['events'] == 0 and sketches.scored == 0
+    assert sketches.baseline.totals()[0] == pytest.approx(200 * 0.5 + 200)
+
+
+def test_service_sketches_cover_the_feature_schema(service):
+    svc = service.MLEmotionService()
+    sketches = svc._tenant_sketches('acme')
+    assert svc._tenant_sketches('acme') is sketches
+    assert sketches.features.features == service.FEATURE_SCHEMA
+    assert service.TrafficSketches is TrafficSketches
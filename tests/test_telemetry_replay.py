@@ -0,0 +1,81 @@
+"""Telemetry capture files and the in-process replay harness (telemetry-replay.py)."""
+
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+
+from conftest import load_script
+
+
+@pytest.fixture(scope='module')
+def replay():
+    return load_script('telemetry-replay.py', 'telemetry_replay')
+
+
+def write_capture(replay, service, training, path, sessions=4):
+    """Library sessions interleaved by event time, one event per message"""
+    library = training.PatternSimulator(seed=3).library.get_training_data()
+    events = []
+    for i in range(sessions):
+        for event in service.pattern_events(library[i][0], start=1.7e9 + i * 0.3):
+            events.append(dict(event, sessionId=f"s{i}", tenantId='t'))
+    events.sort(key=lambda e: e['timestamp'])
+    recorder = replay.TelemetryRecorder(path)
+    for event in events:
+        recorder.write(json.dumps(event).encode(), datetime.fromisoformat(event['timestamp']).timestamp())
+    recorder.close()
+    return events
+
+
+@pytest.mark.parametrize('name', ['capture.siq', 'capture.siq.gz'])
+def test_capture_round_trip_and_append(replay, tmp_path, name):
+    path = str(tmp_path / name)
+    first = replay.TelemetryRecorder(path)
+    first.write(b'{"a": 1}', 10.0)
+    first.close()
+    second = replay.TelemetryRecorder(path)  # Appends without a second header
+    second.write(b'', 11.5)
+    second.write(b'{"b": 2}', 12.0)
+    second.close()
+    assert list(replay.read_capture(path)) == [(10.0, b'{"a": 1}'), (11.5, b''), (12.0, b'{"b": 2}')]
+
+
+def test_rejects_files_that_are_not_captures(replay, tmp_path):
+    path = tmp_path / 'events.jsonl'
+    path.write_bytes(b'{"type": "mouse"}\n')
+    with pytest.raises(ValueError):
+        list(replay.read_capture(str(path)))
+    with gzip.open(tmp_path / 'other.gz', 'wb') as f:
+        f.write(b'not a capture')
+    with pytest.raises(ValueError):
+        list(replay.read_capture(str(tmp_path / 'other.gz')))
+
+
+@pytest.mark.parametrize('pattern, subject, expected', [
+    ('EMOTIONS.state.*.*', 'EMOTIONS.state.t.confusion', True),
+    ('EMOTIONS.state.*.*', 'EMOTIONS.state.t', False),
+    ('ML.control.>', 'ML.control.profile', True),
+    ('ML.control.>', 'ML.control', False),
+    ('TELEMETRY.events', 'TELEMETRY.events', True),
+])
+def test_fake_subject_matching(replay, pattern, subject, expected):
+    assert replay.FakeSubscription(replay.FakeNATS(), pattern).matches(subject) is expected
+
+
+def test_replay_is_deterministic_at_max_speed(replay, service, training, tmp_path):
+    path = str(tmp_path / 'capture.siq')
+    events = write_capture(replay, service, training, path)
+
+    first = replay.asyncio.run(replay.TelemetryReplayer(path, speed=None).replay(service))
+    second = replay.asyncio.run(replay.TelemetryReplayer(path, speed=None).replay(service))
+    assert first['messages'] == first['events'] == len(events)
+    assert first['sessions'] == 4 and first['published'] == len(first['emitted']) > 0
+    assert first['emitted'] == second['emitted']
+
+    for item in first['emitted']:
+        assert item['event']['sessionId'] in first['per_session']
+    decided = [s for s in first['per_session'].values() if s['decisions']]
+    assert len(decided) == first['sessions_with_decision']
+    assert all(s['first_decision_s'] >= 0 for s in decided)
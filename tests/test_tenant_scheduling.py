@@ -0,0 +1,87 @@
+"""Per-tenant weighted fair scoring queue, quotas and rule overrides."""
+
+import asyncio
+from collections import Counter
+
+from emotion_ml.scheduling import TenantScheduler
+
+
+def test_serves_tenants_in_proportion_to_weight():
+    scheduler = TenantScheduler({'a': 3.0, 'b': 1.0}.get)
+    for i in range(30):
+        scheduler.push('a', f"a{i}")
+        scheduler.push('b', f"b{i}")
+    served = Counter(scheduler.pop()[0] for _ in range(20))
+    assert served == {'a': 15, 'b': 5}
+    assert scheduler.depth == 40
+    assert scheduler.report()['a'] == {'queued': 15, 'scored': 15}
+
+
+def test_a_burst_does_not_starve_a_late_tenant():
+    scheduler = TenantScheduler(lambda tenant: 1.0)
+    for i in range(1000):
+        scheduler.push('flash-sale', f"big{i}")
+    for _ in range(10):
+        scheduler.pop()
+    scheduler.push('small', 'small0')
+    assert ('small', 'small0') in [scheduler.pop() for _ in range(2)]
+
+
+def test_fifo_per_tenant_and_no_duplicate_queueing():
+    scheduler = TenantScheduler(lambda tenant: 1.0)
+    assert scheduler.push('a', 's1') and scheduler.push('a', 's2')
+    assert not scheduler.push('a', 's1')
+    assert [scheduler.pop(), scheduler.pop()] == [('a', 's1'), ('a', 's2')]
+    assert scheduler.depth == 0 and scheduler.push('a', 's1')  # Requeued once served
+
+
+def test_get_waits_for_work():
+    async def main():
+        scheduler = TenantScheduler(lambda tenant: 1.0)
+        waiter = asyncio.ensure_future(scheduler.get())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        scheduler.push('a', 's1')
+        return await asyncio.wait_for(waiter, 1.0)
+
+    assert asyncio.run(main()) == ('a', 's1')
+
+
+def test_registry_settings_and_cached_rule_overrides(service):
+    intelligence = service.EmotionalIntelligence()
+    registry = service.TenantRegistry({
+        'default': {'max_sessions': 10},
+        'tenants': {'acme': {'weight': 3, 'rules': {'price_shock': {'price_proximity_time': [2, None]}}}},
+    }, intelligence)
+    assert registry.weight('acme') == 3.0 and registry.weight('other') == 1.0
+    assert registry.max_sessions('acme') == 10 and registry.max_buffered_events('acme') == 100000
+
+    acme = registry.rules_for('acme')
+    assert registry.rules_for('acme') is acme
+    assert acme is not intelligence.compiled_rules
+    assert registry.rules_for('other') is intelligence.compiled_rules
+    registry.invalidate()
+    assert registry.rules_for('acme') is not acme
+
+
+def test_quota_rejections_and_release(service):
+    svc = service.MLEmotionService()
+    svc.tenants = service.TenantRegistry(
+        {'tenants': {'small': {'max_sessions': 2, 'max_buffered_events': 3}}}, svc.intelligence
+    )
+    assert svc._admit_event('s1', 'small') == 'small'
+    assert svc._admit_event('s2', 'small') == 'small'
+    assert svc._admit_event('s3', 'small') is None
+    assert svc._admit_event('s3', 'other') == 'other'
+    assert svc._admit_event('s1', 'other') == 'small'  # A session stays with the tenant that opened it
+    assert svc.metrics.counters['tenant_session_rejections'] == 1
+
+    svc.tenant_buffered['small'] = 3
+    assert svc._admit_event('s1', 'small') is None
+    assert svc.metrics.counters['tenant_event_rejections'] == 1
+
+    svc.evict_session('s2')
+    assert 's2' not in svc.tenant_sessions['small']
+    assert svc._admit_event('s4', 'small') is None  # Still over the buffered-event cap
+    svc.tenant_buffered['small'] = 0
+    assert svc._admit_event('s4', 'small') == 'small'
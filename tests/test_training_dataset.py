@@ -0,0 +1,43 @@
+"""Parquet dataset export (DatasetWriter / TrainingDataset)."""
+
+import os
+
+import pytest
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+def sample(n, kind='click'):
+    return [{'type': kind, 'data': {'i': i % 3}} for i in range(n)]
+
+
+def test_round_trip(training, tmp_path):
+    samples = [(sample(5), 'frustration', 0.9), (sample(3, 'scroll'), 'confusion', 0.5), (sample(1), 'joy', 1.0)]
+    with training.DatasetWriter(str(tmp_path), row_group_samples=2) as writer:
+        writer.extend(samples, pattern='p')
+    dataset = training.TrainingDataset(str(tmp_path))
+    assert len(dataset) == 3
+    assert dataset.num_row_groups == 2
+    assert list(dataset.iter_samples()) == [(s, e, pytest.approx(c)) for s, e, c in samples]
+
+
+def test_large_flush_stays_one_row_group(training, tmp_path):
+    # One flush of more event rows than pyarrow's default 1Mi-row group limit
+    event = {'type': 'click', 'data': {}}
+    rows = (1 << 20) // 2 + 5
+    with training.DatasetWriter(str(tmp_path), row_group_samples=3) as writer:
+        for emotion in ('a', 'b', 'c'):
+            writer.add([event] * rows, emotion, 1.0)
+        writer.add([event], 'd', 1.0)
+    dataset = training.TrainingDataset(str(tmp_path))
+    assert dataset.events.num_row_groups == dataset.label_file.num_row_groups == 2
+    assert [(len(s), e) for s, e, _ in dataset.read_row_group(1)] == [(1, 'd')]
+
+
+def test_unpaired_files_are_rejected(training, tmp_path):
+    with training.DatasetWriter(str(tmp_path), row_group_samples=1) as writer:
+        writer.extend([(sample(2), 'joy', 1.0), (sample(2), 'joy', 1.0)])
+    path = os.path.join(str(tmp_path), 'labels.parquet')
+    pq.write_table(pq.read_table(path), path)  # Both samples in one group now
+    with pytest.raises(ValueError, match='row groups'):
+        training.TrainingDataset(str(tmp_path))
@@ -0,0 +1,83 @@
+"""Incremental per-emotion Markov transition models (TransitionModel)."""
+
+import numpy as np
+from sklearn.ensemble import IsolationForest, RandomForestClassifier
+
+TOKENS = ['click', 'scroll_down', 'scroll_up', 'hover', 'tab_switch', 'mouse_fast']
+
+
+def transition_sequences():
+    rng = np.random.default_rng(8)
+    sequences = []
+    for _ in range(50):
+        sequences.append((['hover', 'click', 'hover', 'click', 'hover'], 'evaluation'))
+        sequences.append((['scroll_down', 'scroll_up', 'scroll_down', 'scroll_up'], 'confusion'))
+        sequences.append((list(rng.choice(TOKENS, size=5)), 'engagement'))
+    return sequences
+
+
+def test_transition_model_favours_the_trained_order(service):
+    model = service.TransitionModel.fit(transition_sequences(), threshold=0.75)
+    state = model.new_state()
+    for token in ['scroll_down', 'scroll_up', 'scroll_down', 'scroll_up', 'scroll_down']:
+        model.update(state, model.vocab[token])
+    evidence = model.evidence(state)
+    assert list(evidence) == ['confusion']
+    assert 0 < evidence['confusion'] <= model.weight
+    # Same events, no order: a shuffled run does not carry the evidence
+    shuffled = model.new_state()
+    for token in ['scroll_down', 'scroll_down', 'scroll_down', 'scroll_up', 'scroll_up']:
+        model.update(shuffled, model.vocab[token])
+    assert model.scores(shuffled.loglik)[model.emotions.index('confusion')] < \
+        model.scores(state.loglik)[model.emotions.index('confusion')]
+
+
+def test_transition_rebuild_equals_incremental(service):
+    model = service.TransitionModel.fit(transition_sequences())
+    events = [{'type': t} for t in ['hover', 'click', 'nope', 'hover', 'click']]
+    incremental = model.new_state()
+    for event in events:
+        model.update(incremental, model.code(event))
+    rebuilt = model.new_state()
+    rebuilt.stale = True
+    model.rebuild(rebuilt, events)
+    np.testing.assert_allclose(rebuilt.loglik, incremental.loglik)
+    assert not rebuilt.stale
+
+
+def test_transition_table_is_a_log_ratio_to_the_background(service):
+    model = service.TransitionModel.fit(transition_sequences(), alpha=0.5)
+    # Exponentiated rows are ratios of two distributions over next codes:
+    # weighted by the background they sum to 1
+    counts = np.zeros(model.table.shape[1:])
+    for tokens, _ in transition_sequences():
+        codes = [model.start] + [model.vocab[t] for t in tokens]
+        np.add.at(counts, (codes[:-1], codes[1:]), 1)
+    size = counts.shape[1]
+    background = (counts + 0.5) / (counts.sum(axis=1, keepdims=True) + 0.5 * size)
+    np.testing.assert_allclose((np.exp(model.table) * background[None]).sum(axis=-1), 1.0)
+
+
+def test_service_uses_the_transition_models_shipped_with_the_model_version(service, tmp_path, monkeypatch):
+    fitted = service.TransitionModel.fit(transition_sequences())
+    vectors = np.random.default_rng(0).normal(size=(20, len(service.FEATURE_SCHEMA)))
+    service.ModelArtifacts.save(
+        str(tmp_path), {'version': 'v1', 'params': {'eps': 1.0}},
+        IsolationForest(n_estimators=5, random_state=0).fit(vectors),
+        RandomForestClassifier(n_estimators=3, random_state=0).fit(vectors, ['a', 'b'] * 10),
+        vectors[:2].copy(), np.zeros(2, dtype=np.int32), service.OnlineNormalizer(),
+        transitions=(fitted.vocab, fitted.emotions, fitted.table),
+    )
+    monkeypatch.setenv('ML_MODEL_DIR', str(tmp_path))
+    monkeypatch.setenv('ML_PATTERN_INDEX', '0')
+    monkeypatch.setenv('ML_TRANSITION_DECAY', '0.5')
+
+    def fit(*args, **kwargs):
+        raise AssertionError('transition models should come from the model version')
+    monkeypatch.setattr(service.TransitionModel, 'from_library', classmethod(fit))
+
+    svc = service.MLEmotionService()
+    svc.build_library_models()
+    model = svc.intelligence.transition_model
+    assert model.vocab == fitted.vocab and model.emotions == fitted.emotions and model.decay == 0.5
+    np.testing.assert_array_equal(model.table, fitted.table)
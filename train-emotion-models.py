@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Emotion Model Training Pipeline
+
+Turns the behavioral pattern library into the models emotion-ml-service.py
+loads at startup (ML_MODEL_DIR):
+
+  dataset   generated with PatternSimulator, or read from a Parquet dataset
+            (behavioral-training-data.py --parquet DIR)
+  features  BehavioralFeatureExtractor over a process pool, cached on disk
+            under a key of the dataset contents + EXTRACTOR_VERSION + schema
+  models    IsolationForest (anomalies), DBSCAN core points (segments) and
+            RandomForestClassifier (emotions), fitted with n_jobs cores
+  artifacts a versioned directory per (features, parameters), with the
+            training normalizer the service applies to every model input,
+            the pattern library's kNN points and its fitted transition
+            models (so the service does not rebuild them at startup), see
+            ModelArtifacts; LATEST names the newest
+
+Re-running with unchanged inputs reuses the cached features and the
+existing version, so it finishes in seconds.
+
+  python3 train-emotion-models.py --out models/
+  python3 train-emotion-models.py --samples 2000 --workers 8 --out models/
+  python3 train-emotion-models.py --dataset /data/patterns --out models/
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+
+def load_service_module():
+    """Import emotion-ml-service.py (hyphenated, so not importable by name)"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'emotion-ml-service.py')
+    spec = importlib.util.spec_from_file_location('emotion_ml_service', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module  # So the extraction pool can pickle its functions
+    spec.loader.exec_module(module)
+    return module
+
+
+class DatasetSource:
+    """Labelled samples plus a fingerprint of their contents"""
+
+    def __init__(self, training, args):
+        self.dataset = None
+        self.simulator = None
+        if args.dataset and os.path.exists(os.path.join(args.dataset, 'labels.parquet')):
+            self.dataset = training.TrainingDataset(args.dataset)
+            self.size = len(self.dataset)
+            self.fingerprint = self.dataset.fingerprint()
+            self.description = args.dataset
+        else:
+            # Generation is deterministic for a seed, so the inputs identify the
+            # dataset - together with the generator's code, which changes what a
+            # seed produces
+            self.simulator = training.PatternSimulator(seed=args.seed)
+            self.samples_per_pattern = args.samples
+            self.workers = args.workers
+            patterns = self.simulator.library.get_training_data()
+            self.size = len(patterns) * (args.samples + 1)
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(json.dumps([patterns, args.samples, args.seed], sort_keys=True).encode())
+            with open(training.__file__, 'rb') as f:
+                digest.update(f.read())
+            self.fingerprint = digest.hexdigest()
+            self.description = f"generated ({args.samples} per pattern, seed {args.seed})"
+
+    def chunks(self) -> Iterator[List[Tuple[List[Dict], str, float]]]:
+        if self.dataset is not None:
+            for index in range(self.dataset.num_row_groups):
+                yield self.dataset.read_row_group(index)
+        else:
+            for _, samples in self.simulator.iter_training_chunks(self.samples_per_pattern, self.workers):
+                yield samples
+
+
+def features_key(service, source: DatasetSource) -> str:
+    """Feature cache key: dataset contents + extractor version + schema"""
+    return hashlib.blake2b(json.dumps([
+        source.fingerprint, service.EXTRACTOR_VERSION, service.FEATURE_SCHEMA
+    ]).encode(), digest_size=12).hexdigest()
+
+
+def blocks(source: DatasetSource, service, block_size: int) -> Iterator[Tuple[List[List[Dict]], List[str]]]:
+    """(timestamped sessions, service emotions) in blocks of block_size"""
+    sessions, emotions = [], []
+    for samples in source.chunks():
+        for sequence, label, _ in samples:
+            sessions.append(service.pattern_events(sequence))
+            emotions.append(service.PatternIndex.EMOTION_MAP.get(label, label))
+            if len(sessions) == block_size:
+                yield sessions, emotions
+                sessions, emotions = [], []
+    if sessions:
+        yield sessions, emotions
+
+
+def extract_features(service, source: DatasetSource, cache_dir: str, key: str,
+                     workers: int, block_size: int) -> str:
+    """Feature matrices for the dataset, written once to cache_dir/key"""
+    path = os.path.join(cache_dir, key)
+    if os.path.exists(os.path.join(path, 'labels.npy')):
+        print(f"♻️ Features cached: {path}")
+        return path
+
+    staging = f"{path}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    width = len(service.FEATURE_SCHEMA)
+    values = np.lib.format.open_memmap(os.path.join(staging, 'values.npy'), 'w+', np.float64, (source.size, width))
+    present = np.lib.format.open_memmap(os.path.join(staging, 'present.npy'), 'w+', np.bool_, (source.size, width))
+    ok = np.zeros(source.size, dtype=bool)
+    labels = []
+
+    started = time.perf_counter()
+    row = 0
+    pending = deque()
+
+    def finish():
+        nonlocal row
+        future, names = pending.popleft()
+        block_values, block_present, errors = future.result() if workers > 1 else future
+        end = row + len(names)
+        values[row:end], present[row:end] = block_values, block_present
+        ok[row:end] = [error is None for error in errors]
+        labels.extend(names)
+        row = end
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for sessions, names in blocks(source, service, block_size):
+            if pool:
+                pending.append((pool.submit(service.extract_feature_block, sessions), names))
+                while len(pending) > 2 * workers:
+                    finish()
+            else:
+                pending.append((service.extract_feature_block(sessions), names))
+                finish()
+        while pending:
+            finish()
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+
+    emotions = sorted(set(labels))
+    codes = {emotion: code for code, emotion in enumerate(emotions)}
+    values.flush()
+    present.flush()
+    del values, present
+    np.save(os.path.join(staging, 'ok.npy'), ok[:row])
+    with open(os.path.join(staging, 'emotions.json'), 'w') as f:
+        json.dump(emotions, f)
+    np.save(os.path.join(staging, 'labels.npy'), np.array([codes[e] for e in labels], dtype=np.int16))
+    os.replace(staging, path)
+    elapsed = time.perf_counter() - started
+    print(f"🔬 Extracted {row} sessions in {elapsed:.1f}s ({row / max(elapsed, 1e-9):.0f}/s, "
+          f"{row - int(ok[:row].sum())} failed) -> {path}")
+    return path
+
+
+def load_features(service, path: str):
+    """(normalized vectors, labels, emotions, normalizer) from a feature cache entry"""
+    ok = np.load(os.path.join(path, 'ok.npy'))
+    values = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')[:len(ok)][ok]
+    present = np.load(os.path.join(path, 'present.npy'), mmap_mode='r')[:len(ok)][ok]
+    labels = np.load(os.path.join(path, 'labels.npy'))[ok]
+    with open(os.path.join(path, 'emotions.json')) as f:
+        emotions = json.load(f)
+
+    # One baseline over the whole dataset; it ships with the models and the
+    # service applies it unchanged (ModelArtifacts.prepare), whatever the tenant
+    count = present.sum(axis=0)
+    mean = np.where(present, values, 0.0).sum(axis=0) / np.maximum(count, 1)
+    m2 = (np.where(present, values - mean, 0.0) ** 2).sum(axis=0)
+    normalizer = service.OnlineNormalizer.from_state(np.stack([count, mean, m2]))
+    vectors = normalizer.normalize(np.array(values, dtype=float), present)
+    return vectors, labels, emotions, normalizer
+
+
+def fit_models(vectors: np.ndarray, labels: np.ndarray, emotions: List[str], args) -> Dict:
+    from sklearn.cluster import DBSCAN
+    from sklearn.ensemble import IsolationForest, RandomForestClassifier
+
+    fitted = {}
+    started = time.perf_counter()
+    fitted['anomaly'] = IsolationForest(contamination=args.contamination, n_estimators=args.anomaly_trees,
+                                        random_state=42, n_jobs=args.jobs).fit(vectors)
+    print(f"   IsolationForest: {time.perf_counter() - started:.1f}s")
+
+    # DBSCAN is quadratic in the worst case: cluster a sample, keep its core points
+    started = time.perf_counter()
+    rng = np.random.default_rng(args.seed)
+    sample = vectors if len(vectors) <= args.cluster_samples else \
+        vectors[np.sort(rng.choice(len(vectors), args.cluster_samples, replace=False))]
+    dbscan = DBSCAN(eps=args.eps, min_samples=args.min_samples, n_jobs=args.jobs).fit(sample)
+    cores = dbscan.core_sample_indices_
+    fitted['core_points'] = np.ascontiguousarray(sample[cores])
+    fitted['core_labels'] = dbscan.labels_[cores].astype(np.int32)
+    fitted['clusters'] = int(len(set(fitted['core_labels'].tolist())))
+    print(f"   DBSCAN: {fitted['clusters']} clusters, {len(cores)} core points "
+          f"from {len(sample)} sessions in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    classifier = RandomForestClassifier(n_estimators=args.trees, min_samples_leaf=2, oob_score=True,
+                                        random_state=42, n_jobs=args.jobs)
+    classifier.fit(vectors, np.array(emotions)[labels])
+    fitted['classifier'] = classifier
+    fitted['oob_accuracy'] = float(classifier.oob_score_)
+    print(f"   RandomForest: out-of-bag accuracy {classifier.oob_score_:.3f} in {time.perf_counter() - started:.1f}s")
+    return fitted
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the ML service models from behavioral patterns')
+    parser.add_argument('--out', default='models', help='Artifact root (the service reads ML_MODEL_DIR)')
+    parser.add_argument('--dataset', help='Parquet dataset directory (default: generate)')
+    parser.add_argument('--samples', type=int, default=200, help='Generated variations per base pattern')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--cache', default=os.path.join('/tmp', 'emotion-feature-cache'), help='Feature cache directory')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Feature extraction processes')
+    parser.add_argument('--jobs', type=int, default=-1, help='Model fitting cores (n_jobs)')
+    parser.add_argument('--block', type=int, default=500, help='Sessions per extraction block')
+    parser.add_argument('--contamination', type=float, default=0.1)
+    parser.add_argument('--anomaly-trees', type=int, default=100)
+    parser.add_argument('--eps', type=float, default=2.0, help='DBSCAN radius in z-scored feature space')
+    parser.add_argument('--min-samples', type=int, default=10)
+    parser.add_argument('--cluster-samples', type=int, default=20000)
+    parser.add_argument('--trees', type=int, default=200, help='RandomForest estimators')
+    parser.add_argument('--pattern-variations', type=int, default=20,
+                        help='Simulated variations per library pattern in the kNN index (ML_PATTERN_VARIATIONS)')
+    parser.add_argument('--transition-variations', type=int, default=20,
+                        help='Simulated variations per library pattern for the transition models '
+                             '(ML_TRANSITION_VARIATIONS)')
+    parser.add_argument('--force', action='store_true', help='Refit even if this version exists')
+    args = parser.parse_args()
+
+    service = load_service_module()
+    training = service.load_training_module()
+    started = time.perf_counter()
+
+    source = DatasetSource(training, args)
+    key = features_key(service, source)
+    print(f"📚 Dataset: {source.description}, {source.size} samples (features {key})")
+
+    os.makedirs(args.cache, exist_ok=True)
+    features = extract_features(service, source, args.cache, key, args.workers, args.block)
+
+    params = {name: getattr(args, name) for name in
+              ('contamination', 'anomaly_trees', 'eps', 'min_samples', 'cluster_samples', 'trees', 'seed',
+               'pattern_variations', 'transition_variations')}
+    version = hashlib.blake2b(json.dumps([key, params], sort_keys=True).encode(), digest_size=6).hexdigest()
+    if os.path.exists(os.path.join(args.out, version, 'manifest.json')) and not args.force:
+        service.ModelArtifacts.set_latest(args.out, version)
+        print(f"✅ Models {version} already trained -> {os.path.join(args.out, version)} "
+              f"({time.perf_counter() - started:.1f}s)")
+        return
+
+    vectors, labels, emotions, normalizer = load_features(service, features)
+    print(f"🏋️ Fitting on {len(vectors)} sessions, {len(emotions)} emotions "
+          f"({dict(Counter(np.array(emotions)[labels].tolist()))})")
+    fitted = fit_models(vectors, labels, emotions, args)
+
+    started_patterns = time.perf_counter()
+    patterns = service.PatternIndex.library_points(variations=args.pattern_variations)
+    print(f"   Pattern index: {len(patterns[2])} library points in {time.perf_counter() - started_patterns:.1f}s")
+    transitions = service.TransitionModel.from_library(variations=args.transition_variations)
+    print(f"   Transition models: {len(transitions.emotions)} emotions over {len(transitions.vocab)} event tokens")
+
+    os.makedirs(args.out, exist_ok=True)
+    manifest = {
+        'version': version,
+        'created': datetime.now().isoformat(),
+        'dataset': source.description,
+        'dataset_fingerprint': source.fingerprint,
+        'features_key': key,
+        'samples': int(len(vectors)),
+        'emotions': emotions,
+        'params': params,
+        'clusters': fitted['clusters'],
+        'oob_accuracy': fitted['oob_accuracy'],
+        'pattern_points': len(patterns[2]),
+        'transition_tokens': len(transitions.vocab),
+    }
+    path = service.ModelArtifacts.save(args.out, manifest, fitted['anomaly'], fitted['classifier'],
+                                       fitted['core_points'], fitted['core_labels'], normalizer, patterns,
+                                       (transitions.vocab, transitions.emotions, transitions.table))
+    print(f"✅ Models {version} -> {path} ({time.perf_counter() - started:.1f}s); "
+          f"run the service with ML_MODEL_DIR={args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Emotion Rule Threshold Tuning
+
+Backtests the service's emotion rules against labelled feature matrices and
+searches per-emotion threshold and weight settings. Every candidate for an
+emotion is scored in one broadcast pass over its CompiledRules rows
+(candidates × sessions × rule features). The same rule_scores() maths runs
+in the service, so what is measured here is what the service will do.
+
+Features come from the train-emotion-models.py cache (generated from the
+pattern library when --features is not given). Sessions are split three
+ways: each emotion's best candidate is picked on the tuning split, kept
+only if it gains at least --min-gain F1 on the validation split, and the
+figures printed and saved come from a report split neither decision saw.
+Kept emotions are written to a rules file the service hot-loads
+(ML_RULES_FILE, or ML.control.rules with the file's contents).
+
+  python3 tune-emotion-rules.py --out rules.json
+  python3 tune-emotion-rules.py --candidates 8192 --features /tmp/emotion-feature-cache/<key> --out rules.json
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+def load_script(filename: str, name: str):
+    """Import a sibling script (hyphenated, so not importable by name)"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module  # So process pools can pickle its functions
+    spec.loader.exec_module(module)
+    return module
+
+
+def feature_cache(service, args) -> str:
+    """A feature cache entry: --features, or the library dataset via train-emotion-models.py"""
+    if args.features:
+        return args.features
+    trainer = load_script('train-emotion-models.py', 'train_emotion_models')
+    source = trainer.DatasetSource(service.load_training_module(), args)
+    os.makedirs(args.cache, exist_ok=True)
+    return trainer.extract_features(service, source, args.cache, trainer.features_key(service, source),
+                                    args.workers, args.block)
+
+
+def load_matrix(path: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(values, present, label names) for the rows that extracted cleanly"""
+    ok = np.load(os.path.join(path, 'ok.npy'))
+    values = np.array(np.load(os.path.join(path, 'values.npy'), mmap_mode='r')[:len(ok)][ok])
+    present = np.array(np.load(os.path.join(path, 'present.npy'), mmap_mode='r')[:len(ok)][ok])
+    with open(os.path.join(path, 'emotions.json')) as f:
+        emotions = np.array(json.load(f))
+    return values, present, emotions[np.load(os.path.join(path, 'labels.npy'))[ok]]
+
+
+def metrics(fired: np.ndarray, positive: np.ndarray) -> Dict[str, np.ndarray]:
+    """Precision / recall / F1 along the last axis (fired and positive broadcast)"""
+    true_positive = (fired & positive).sum(axis=-1)
+    precision = true_positive / np.maximum(fired.sum(axis=-1), 1)
+    recall = true_positive / max(int(positive.sum()), 1)
+    f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-12)
+    return {'precision': precision, 'recall': recall, 'f1': f1}
+
+
+class EmotionTuner:
+    """Random search over one emotion's rule row, every candidate scored at once.
+
+    Candidate c scales each rule's minimum and maximum thresholds by
+    independent log-uniform factors in [1 / threshold_span, threshold_span]
+    and each weight by one in [1 / weight_span, weight_span]; candidate 0 is
+    the current rule set. Scaling keeps a bound's sign and presence: a
+    missing bound (None) is never added and a bound of 0 never moves, so
+    the search only retunes the comparisons a rule already makes. An
+    emotion "fires" when its rule score (score / total weight, capped at 1)
+    reaches `fire_at`, the level at which the service recommends its
+    interventions.
+    """
+
+    def __init__(self, rules, emotion: str, candidates: int, rng: np.random.Generator,
+                 threshold_span: float = 4.0, weight_span: float = 2.0, fire_at: float = 0.5):
+        e = rules.emotions.index(emotion)
+        self.emotion = emotion
+        self.features = np.flatnonzero(rules.has_rule[e])
+        self.fire_at = fire_at
+        count = len(self.features)
+        def scales(span):
+            scale = np.exp(rng.uniform(-np.log(span), np.log(span), (candidates, count)))
+            scale[0] = 1.0
+            return scale
+        self.min_thresholds = rules.min_thresholds[e, self.features] * scales(threshold_span)
+        self.max_thresholds = rules.max_thresholds[e, self.features] * scales(threshold_span)
+        self.weights = rules.weights[e, self.features] * scales(weight_span)
+
+    def scores(self, service, values: np.ndarray, present: np.ndarray, block: int) -> np.ndarray:
+        """(candidates, sessions) rule scores, `block` candidates per broadcast pass"""
+        values, present = values[:, self.features], present[:, self.features]
+        scores = np.empty((len(self.weights), len(values)))
+        for start in range(0, len(self.weights), block):
+            window = slice(start, start + block)
+            score, total = service.CompiledRules.rule_scores(
+                values[None], present[None],
+                self.min_thresholds[window, None], self.max_thresholds[window, None], self.weights[window, None]
+            )
+            with np.errstate(divide='ignore', invalid='ignore'):
+                scores[window] = np.where(total > 0, np.minimum(1.0, score / total), 0.0)
+        return scores
+
+    def evaluate(self, service, values, present, labels, block: int) -> Dict[str, np.ndarray]:
+        return metrics(self.scores(service, values, present, block) >= self.fire_at, labels == self.emotion)
+
+    def overrides(self, candidate: int, feature_names: List[str]) -> Tuple[Dict, Dict]:
+        def bound(value):
+            return None if np.isnan(value) else round(float(value), 4)
+        rules = {feature_names[f]: [bound(self.min_thresholds[candidate, i]), bound(self.max_thresholds[candidate, i])]
+                 for i, f in enumerate(self.features)}
+        weights = {feature_names[f]: round(float(self.weights[candidate, i]), 4)
+                   for i, f in enumerate(self.features)}
+        return rules, weights
+
+
+def splits(count: int, rng: np.random.Generator, validate: float, holdout: float) -> Tuple[np.ndarray, ...]:
+    """Disjoint (tune, validate, held-out) masks; the held-out share is only ever reported on"""
+    split = rng.random(count)
+    test = split < holdout
+    validation = ~test & (split < holdout + validate)
+    return ~test & ~validation, validation, test
+
+
+def dominant_report(intelligence, values, present, labels) -> Dict[str, Dict[str, float]]:
+    """End-to-end per-emotion precision / recall of the dominant emotion (score_batch)"""
+    scored = intelligence.score_batch(values, present)
+    predicted = np.array(scored['emotions'])[scored['dominant']]
+    report = {}
+    for emotion in sorted(set(labels)):
+        result = metrics(predicted == emotion, labels == emotion)
+        report[emotion] = {name: round(float(value), 3) for name, value in result.items()}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tune emotion rule thresholds against labelled features')
+    parser.add_argument('--out', help='Write the tuned rules file here (ML_RULES_FILE)')
+    parser.add_argument('--features', help='Feature cache entry (default: build from the pattern library)')
+    parser.add_argument('--dataset', help='Parquet dataset directory when building features')
+    parser.add_argument('--samples', type=int, default=200, help='Generated variations per base pattern')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--cache', default=os.path.join('/tmp', 'emotion-feature-cache'))
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--block', type=int, default=500, help='Sessions per extraction block')
+    parser.add_argument('--candidates', type=int, default=4096, help='Configurations per emotion')
+    parser.add_argument('--threshold-span', type=float, default=4.0)
+    parser.add_argument('--weight-span', type=float, default=2.0)
+    parser.add_argument('--validate', type=float, default=0.2, help='Share of sessions that decide what is kept')
+    parser.add_argument('--holdout', type=float, default=0.2, help='Share of sessions only used for the report')
+    parser.add_argument('--min-gain', type=float, default=0.02, help='Validation F1 gain needed to keep a change')
+    parser.add_argument('--memory', type=float, default=256, help='MB per broadcast block')
+    args = parser.parse_args()
+
+    service = load_script('emotion-ml-service.py', 'emotion_ml_service')
+    intelligence = service.EmotionalIntelligence()
+    rules = intelligence.compiled_rules
+    started = time.perf_counter()
+
+    path = feature_cache(service, args)
+    values, present, labels = load_matrix(path)
+    rng = np.random.default_rng(args.seed)
+    tune, validate, test = splits(len(labels), rng, args.validate, args.holdout)
+    print(f"📚 {len(labels)} labelled sessions from {path} "
+          f"({int(tune.sum())} tuning, {int(validate.sum())} validation, {int(test.sum())} held out)")
+
+    tuned_rules, tuned_weights, report = {}, {}, {}
+    emotions = [e for e in sorted(set(labels)) if e in rules.emotions]
+    print(f"\n🎚️ {args.candidates} candidates per emotion (rule score ≥ 0.5 fires)")
+    print(f"   {'emotion':<22} {'validation ΔF1':>14} {'held-out baseline':>20} {'tuned P/R/F1':>20}  held-out ΔF1")
+    for emotion in emotions:
+        tuner = EmotionTuner(rules, emotion, args.candidates, rng, args.threshold_span, args.weight_span)
+        block = max(1, int(args.memory * 2 ** 20 / 8 / max(len(values) * len(tuner.features) * 6, 1)))
+        fit = tuner.evaluate(service, values[tune], present[tune], labels[tune], block)
+        best = int(np.lexsort((fit['precision'], fit['f1']))[-1])  # Best F1, ties to precision
+        checked = tuner.evaluate(service, values[validate], present[validate], labels[validate], block)
+        gain = float(checked['f1'][best] - checked['f1'][0])
+        keep = gain >= args.min_gain
+        held = tuner.evaluate(service, values[test], present[test], labels[test], block)
+        report[emotion] = {
+            'baseline': {name: round(float(held[name][0]), 3) for name in held},
+            'tuned': {name: round(float(held[name][best]), 3) for name in held},
+            'validation_gain': round(gain, 3),
+            'kept': keep,
+        }
+        if keep:
+            tuned_rules[emotion], tuned_weights[emotion] = tuner.overrides(best, service.FEATURE_SCHEMA)
+        b, t = report[emotion]['baseline'], report[emotion]['tuned']
+        print(f"   {emotion:<22} {gain:>+14.3f} {b['precision']:>10.2f}/{b['recall']:.2f}/{b['f1']:.2f}"
+              f"       {t['precision']:>6.2f}/{t['recall']:.2f}/{t['f1']:.2f}   "
+              f"{t['f1'] - b['f1']:+.3f}{'' if keep else '  (kept baseline)'}")
+
+    # End to end on the held-out split: dominant emotion with every boost and default applied
+    before = dominant_report(intelligence, values[test], present[test], labels[test])
+    intelligence.set_tuned_rules(tuned_rules, tuned_weights)
+    after = dominant_report(intelligence, values[test], present[test], labels[test])
+    print(f"\n📊 Dominant emotion, held out (precision / recall)")
+    for emotion in before:
+        print(f"   {emotion:<22} {before[emotion]['precision']:.2f} / {before[emotion]['recall']:.2f}"
+              f"  ->  {after[emotion]['precision']:.2f} / {after[emotion]['recall']:.2f}")
+    print(f"\n   {time.perf_counter() - started:.1f}s")
+
+    if args.out:
+        version = hashlib.blake2b(json.dumps([tuned_rules, tuned_weights], sort_keys=True).encode(),
+                                  digest_size=6).hexdigest()
+        spec = {
+            'version': version,
+            'created': datetime.now().isoformat(),
+            'features': path,
+            'rules': tuned_rules,
+            'weights': tuned_weights,
+            'report': report,
+            'dominant': {'before': before, 'after': after},
+        }
+        with open(f"{args.out}.tmp", 'w') as f:
+            json.dump(spec, f, indent=2)
+        os.replace(f"{args.out}.tmp", args.out)  # The service polls the mtime; never let it see a partial file
+        print(f"✅ Rules {version} ({len(tuned_rules)} emotions) -> {args.out}")
+
+
+if __name__ == '__main__':
+    main()